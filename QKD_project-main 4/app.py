@@ -1,16 +1,87 @@
-from flask import Flask, jsonify, render_template, request
-from qkd_backend.qkd_runner import exp1, exp2, exp3, exp4
+import json
+import os
+import threading
+import numpy as np
+from flask import Flask, abort, g, jsonify, render_template, request, send_file, stream_with_context
+from qkd_backend.qkd_runner import exp1, exp2, exp3, exp4, exp4_sweep, key_stream, multiuser_engine
 from qkd_backend.backend_config import get_backend_service
+from qkd_backend.transpile_cache import get_transpile_cache
+from qkd_backend import decoy, diagrams, keyrate as keyrate_model, serialization
+from qkd_backend.cipher import xor_bytes
+from qkd_backend.jobs import JobQueueFull, get_job_manager, DONE, FAILED, CANCELLED
+from qkd_backend.key_store import get_key_store, new_key_id, session_pointer
+from qkd_backend.key_pool import KeyExhausted, TooManyKeyPools, check_key_pool, find_key_pool, get_key_pool
+from qkd_backend.qkd_runner.intercept_resend import validate_fraction
+from qkd_backend.qkd_runner.reconciliation import RECONCILERS
 
 app = Flask(__name__, static_folder="static")
-last_exp1_result = {}
-last_exp2_result = {}
-last_exp3_result = {}
-last_exp4_result = {}
 
 # Store experiment results for state management
 experiment_states = {}
-last_analysis = {}
+
+# ---- Per-session key storage ----
+SESSION_COOKIE = "qkd_session"
+
+def _session_id():
+    sid = request.cookies.get(SESSION_COOKIE)
+    if not sid or not sid.isalnum() or len(sid) != 32:
+        sid = g.get("new_session_id")
+        if sid is None:
+            sid = g.new_session_id = new_key_id()
+    return sid
+
+@app.after_request
+def _set_session_cookie(response):
+    sid = g.get("new_session_id")
+    if sid is not None:
+        response.set_cookie(SESSION_COOKIE, sid, httponly=True, samesite="Lax")
+    return response
+
+def _remember(name, result):
+    """Store a result under a fresh key id and point this session's `name` slot at it."""
+    store = get_key_store()
+    key_id = new_key_id()
+    store.put(key_id, result)
+    store.put(session_pointer(_session_id(), name), key_id)
+    return key_id
+
+def _peer(data):
+    """The requesting peer's name, checked before a run; raises ValueError or TooManyKeyPools."""
+    peer = (data or {}).get("peer", "default")
+    check_key_pool(peer)
+    return peer
+
+def _deposit_key(peer, result):
+    """Append a run's privacy-amplified key to the peer's pool, creating it; keys that skipped the pipeline are never deposited."""
+    secret_key = result.get("final_secret_key")
+    if secret_key and result.get("privacy_amplification") and not result.get("abort_reason"):
+        try:
+            get_key_pool(peer).deposit_bytes(bytes.fromhex(secret_key))
+        except TooManyKeyPools as e:
+            # Another peer took the last slot during the run
+            result["key_pool_error"] = str(e)
+
+def _recall(name, data=None):
+    """Result for an explicit key_id in the request, else this session's latest `name` result."""
+    store = get_key_store()
+    key_id = (data or {}).get("key_id") or store.get(session_pointer(_session_id(), name))
+    if not key_id:
+        return None
+    return store.get(key_id)
+
+def _result_response(result, status=200):
+    """A result in the format the Accept header asks for: JSON, compact JSON or MessagePack."""
+    media_type = serialization.negotiate(request.accept_mimetypes)
+    if media_type is None:
+        response = jsonify({"error": "Not acceptable", "available": serialization.media_types()})
+        status = 406
+    elif media_type == serialization.JSON:
+        response = jsonify(result)
+    else:
+        response = app.response_class(serialization.encode(result, media_type), mimetype=media_type)
+    response.status_code = status
+    response.vary.add("Accept")
+    return response
 
 # ---- Serve index.html at root ----
 @app.route("/")
@@ -29,9 +100,20 @@ def QuantumVsClassicalSimulator():
     return render_template("QuantumVsClassicalSimulator.html")
 
 # ---- Experiment routes ----
+def _seed(data):
+    """Optional integer "seed" from a request body; the same seed replays the same run."""
+    seed = data.get('seed') if data else None
+    return int(seed) if seed is not None else None
+
+def _reconciliation(data):
+    """Reconciliation method of a request body, checked before anything runs."""
+    method = data.get('reconciliation', 'cascade')
+    if method not in RECONCILERS:
+        raise ValueError(f"Unknown reconciliation method: {method}")
+    return method
+
 @app.route("/run/exp1", methods=["POST"])
 def exp1_route():
-    global last_exp1_result
     data = request.get_json()
     message = data.get("message") if data else None
     if message is None:
@@ -39,52 +121,288 @@ def exp1_route():
         backend_type = data.get('backend', 'local')
         # Use simple experiment for testing
         from qkd_backend.qkd_runner.exp_simple import run_simple_exp
-        result = run_simple_exp(backend_type=backend_type)
-        last_exp1_result = result
-        return jsonify(result)
+        # Its key is a hash of the sifted bits, not pipeline output, so it never feeds the key pool
+        result = run_simple_exp(backend_type=backend_type, rng_seed=_seed(data))
+        result["key_id"] = _remember("exp1", result)
+        return _result_response(result)
     else:
         # Use previous key to encrypt/decrypt
-        if not last_exp1_result:
+        previous = _recall("exp1", data)
+        if not previous:
             return jsonify({"error": "Run the experiment first!"}), 400
         from qkd_backend.qkd_runner.exp_simple import encrypt_with_existing_key
-        result = encrypt_with_existing_key(last_exp1_result, message)
+        result = encrypt_with_existing_key(previous, message)
         return jsonify(result)
 
 @app.route("/run/exp2", methods=["POST"])
 def exp2_route():
-    global last_exp2_result
     data = request.get_json()
     message = data.get("message") if data else None
     if message is None:
         backend_type = data.get('backend', 'local')
-        result = exp2.run_exp2(backend_type=backend_type)
-        last_exp2_result = result
-        return jsonify(result)
+        engine = data.get('engine', 'circuit')
+        harvest_shots = bool(data.get('harvest_shots', False))
+        draw_diagram = bool(data.get('diagram', True))
+        try:
+            reconciliation = _reconciliation(data)
+            peer = _peer(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except TooManyKeyPools as e:
+            return jsonify({"error": str(e)}), 429
+        result = exp2.run_exp2(backend_type=backend_type, engine=engine, harvest_shots=harvest_shots,
+                               draw_diagram=draw_diagram, reconciliation=reconciliation, rng_seed=_seed(data))
+        _deposit_key(peer, result)
+        result["key_id"] = _remember("exp2", result)
+        return _result_response(result)
     else:
-        if not last_exp2_result:
+        previous = _recall("exp2", data)
+        if not previous:
             return jsonify({"error": "Run the experiment first!"}), 400
-        result = exp2.encrypt_with_existing_key(last_exp2_result, message)
+        result = exp2.encrypt_with_existing_key(previous, message)
         return jsonify(result)
 
 @app.route("/run/exp3", methods=["POST"])
 def exp3_route():
     data = request.get_json()
     backend_type = data.get('backend', 'local') if data else 'local'
-    result = exp3.run_exp3(backend_type=backend_type)
-    return jsonify(result)
+    harvest_shots = bool(data.get('harvest_shots', False)) if data else False
+    draw_diagram = bool(data.get('diagram', True)) if data else True
+    engine = data.get('engine', 'circuit') if data else 'circuit'
+    try:
+        intercept_fraction = validate_fraction(data.get('intercept_fraction', 1.0)) if data else 1.0
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = exp3.run_exp3(backend_type=backend_type, harvest_shots=harvest_shots, draw_diagram=draw_diagram,
+                           engine=engine, intercept_fraction=intercept_fraction, rng_seed=_seed(data))
+    return _result_response(result)
 
 @app.route("/run/exp4", methods=["POST"])
 def exp4_route():
     data = request.get_json()
     backend_type = data.get('backend', 'local') if data else 'local'
-    result = exp4.run_exp4(backend_type=backend_type)
-    return jsonify(result)
+    harvest_shots = bool(data.get('harvest_shots', False)) if data else False
+    draw_diagram = bool(data.get('diagram', True)) if data else True
+    intercept_fraction = data.get('intercept_fraction') if data else None
+    message = data.get('message') if data else None
+    try:
+        intercept_fraction = validate_fraction(intercept_fraction) if intercept_fraction is not None else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = exp4.run_exp4(message=message, backend_type=backend_type, harvest_shots=harvest_shots, draw_diagram=draw_diagram,
+                           intercept_fraction=intercept_fraction, rng_seed=_seed(data))
+    return _result_response(result)
+
+# ---- Asynchronous experiment jobs ----
+JOB_RUNNERS = {
+    "exp1": exp1.run_exp1,
+    "exp2": exp2.run_exp2,
+    "exp3": exp3.run_exp3,
+    "exp3_batch": exp3.run_exp3_batch,
+    "exp4": exp4.run_exp4,
+}
+
+def _job_kwargs(exp, data):
+    kwargs = {
+        "backend_type": data.get('backend', 'local'),
+        "harvest_shots": bool(data.get('harvest_shots', False)),
+        "draw_diagram": bool(data.get('diagram', True)),
+        "rng_seed": _seed(data),
+    }
+    if exp in ("exp1", "exp2"):
+        kwargs["engine"] = data.get('engine', 'circuit')
+        kwargs["reconciliation"] = _reconciliation(data)
+    if exp == "exp3":
+        kwargs["engine"] = data.get('engine', 'circuit')
+    if exp in ("exp3", "exp3_batch"):
+        kwargs["intercept_fraction"] = validate_fraction(data.get('intercept_fraction', 1.0))
+    if exp == "exp3_batch":
+        kwargs["sessions"] = int(data.get('sessions', 8))
+        if not 1 <= kwargs["sessions"] <= exp3.MAX_BATCH_SESSIONS:
+            raise ValueError(f"sessions must be in [1, {exp3.MAX_BATCH_SESSIONS}]")
+        kwargs["draw_diagram"] = bool(data.get('diagram', False))
+    if exp == "exp4" and data.get('intercept_fraction') is not None:
+        kwargs["intercept_fraction"] = validate_fraction(data['intercept_fraction'])
+    return kwargs
+
+def _submit(name, runner, kwargs):
+    try:
+        job_id = get_job_manager().submit(name, runner, **kwargs)
+    except JobQueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }), 202
+
+@app.route("/jobs/<exp>", methods=["POST"])
+def submit_job(exp):
+    runner = JOB_RUNNERS.get(exp)
+    if runner is None:
+        return jsonify({"error": f"Unknown experiment: {exp}"}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        kwargs = _job_kwargs(exp, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid job parameters: {e}"}), 400
+    return _submit(exp, runner, kwargs)
+
+@app.route("/sweep/exp4", methods=["POST"])
+def sweep_exp4():
+    """QBER vs. interception fraction and key length, run as a job; the result is a column table."""
+    data = request.get_json(silent=True) or {}
+    try:
+        # Checked here rather than in the job worker, so a bad grid is a 400 and never queued
+        kwargs = exp4_sweep.validate_grid(
+            data.get('intercept_fractions', [0.0, 0.25, 0.5, 0.75, 1.0]),
+            data.get('key_lengths', [20]),
+            data.get('seeds', [0]),
+            data.get('sessions', exp4_sweep.DEFAULT_SESSIONS),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid sweep grid: {e}"}), 400
+    return _submit("exp4_sweep", exp4_sweep.run_sweep, kwargs)
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    status = get_job_manager().status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    status, result = get_job_manager().result(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if status == DONE:
+        return _result_response(result)
+    if status == FAILED:
+        return jsonify(get_job_manager().status(job_id)), 500
+    if status == CANCELLED:
+        return jsonify({"status": status}), 410
+    return jsonify({"status": status}), 202
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    status = get_job_manager().cancel(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"job_id": job_id, "status": status})
+
+@app.route("/jobs", methods=["GET"])
+def job_stats():
+    return jsonify(get_job_manager().stats())
+
+# ---- Continuous key streaming ----
+# Open streams each hold a pipeline of producer threads
+MAX_KEY_STREAMS = 4
+_key_streams = threading.BoundedSemaphore(MAX_KEY_STREAMS)
+NDJSON = "application/x-ndjson"
+
+@app.route("/stream/keys", methods=["GET"])
+def stream_keys():
+    """
+    Key blocks as server-sent events (or NDJSON with Accept: application/x-ndjson).
+
+    Query parameters: round_bits, block_bits, engine, backend, seed, kind
+    ("final" or "sifted"), sample_fraction, reconciliation, max_blocks.
+    """
+    args = request.args
+    try:
+        kwargs = {
+            "round_bits": int(args.get('round_bits', key_stream.DEFAULT_ROUND_BITS)),
+            "block_bits": int(args.get('block_bits', key_stream.DEFAULT_STREAM_BLOCK_BITS)),
+            "engine": args.get('engine', 'numpy'),
+            "backend_type": args.get('backend', 'local'),
+            "rng_seed": _seed(args),
+            "kind": args.get('kind', 'final'),
+            "sample_fraction": float(args.get('sample_fraction', 0.2)),
+            "reconciliation": args.get('reconciliation', 'cascade'),
+            "max_blocks": int(args['max_blocks']) if 'max_blocks' in args else None,
+        }
+        blocks = key_stream.key_stream(**kwargs)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid stream parameters: {e}"}), 400
+    if not _key_streams.acquire(blocking=False):
+        response = jsonify({"error": f"Too many open key streams ({MAX_KEY_STREAMS})"})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+
+    ndjson = request.accept_mimetypes.best == NDJSON
+
+    def events():
+        try:
+            for block in blocks:
+                if ndjson:
+                    yield json.dumps(block) + "\n"
+                else:
+                    yield f"id: {block['block']}\nevent: block\ndata: {json.dumps(block)}\n\n"
+        except Exception as e:
+            error = {"error": str(e)}
+            yield json.dumps(error) + "\n" if ndjson else f"event: error\ndata: {json.dumps(error)}\n\n"
+        finally:
+            blocks.close()
+
+    response = app.response_class(stream_with_context(events()),
+                                  mimetype=NDJSON if ndjson else "text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    # The WSGI server closes the response when the client goes away, even before the first block
+    response.call_on_close(_key_streams.release)
+    return response
+
+# ---- One-time-pad key pools ----
+@app.route("/key_pool/<peer>", methods=["GET"])
+def key_pool_stats(peer):
+    try:
+        pool = find_key_pool(peer)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except TooManyKeyPools as e:
+        return jsonify({"error": str(e)}), 429
+    if pool is None:
+        return jsonify({"error": f"No key pool for peer {peer!r}"}), 404
+    return jsonify(pool.stats())
+
+@app.route("/key_pool/<peer>/encrypt", methods=["POST"])
+def key_pool_encrypt(peer):
+    data = request.get_json(silent=True) or {}
+    message = data.get("message")
+    if message is None:
+        return jsonify({"error": "message is required"}), 400
+    try:
+        pool = find_key_pool(peer)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except TooManyKeyPools as e:
+        return jsonify({"error": str(e)}), 429
+    if pool is None:
+        return jsonify({"error": f"No key pool for peer {peer!r}"}), 404
+    try:
+        message_bytes = message.encode('utf-8')
+        encrypted_bytes, key, key_offset = pool.encrypt(message_bytes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except KeyExhausted as e:
+        return jsonify({"error": str(e), "pool": pool.stats()}), 409
+    return jsonify({
+        "original_message": message,
+        "encrypted_message_hex": encrypted_bytes.hex(),
+        "decrypted_message": xor_bytes(encrypted_bytes, key).decode('utf-8'),
+        "key_offset_bits": key_offset * 8,
+        "key_bits_used": len(key) * 8,
+        "remaining_bits": pool.available_bits,
+    })
+
 @app.route("/run/<exp>", methods=["POST"])
 def run_exp(exp):
     pass  # Placeholder route to be removed
     # After getting the result:
-    global last_analysis
-    last_analysis = result
+    _remember("analysis", result)
     return jsonify(result)
 
 @app.route("/analysis")
@@ -95,10 +413,121 @@ def shors():
     return render_template("shors.html")
 
 
+@app.route("/diagrams/<digest>.png")
+def diagram(digest):
+    # Drawn by the background worker on first request, then served from disk
+    if not digest.isalnum():
+        abort(404)
+    if not diagrams.is_known(digest):
+        abort(404)
+    path = diagrams.render(digest)
+    if path is None or not os.path.exists(path):
+        # Still drawing (or queued behind other diagrams); a later request serves it
+        response = jsonify({"error": "Diagram is still being drawn"})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    return send_file(path, mimetype="image/png")
+
+@app.route("/keyrate/grid", methods=["POST"])
+def keyrate_grid():
+    """
+    Key rate model on a whole grid, memoized server-side.
+
+    Body: model ("link" or "repeater"), distances or max_distance + step,
+    mus / protocols (link) or repeaters (repeater), and physical
+    parameters under "params". Non-finite values come back as null.
+    """
+    data = request.get_json(silent=True) or {}
+    model = data.get('model', 'link')
+    try:
+        if 'distances' in data:
+            distances = [float(d) for d in data['distances']]
+        else:
+            distances = keyrate_model.distance_grid(float(data.get('max_distance', 200)), float(data.get('step', 2)))
+        if model == "link":
+            axes = {"mus": data.get('mus', [0.5]), "protocols": data.get('protocols', ["bb84"])}
+        else:
+            axes = {"repeaters": data.get('repeaters', [0, 1, 3, 7])}
+        grid = keyrate_model.evaluate(model, distances, **axes, **(data.get('params') or {}))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid key rate grid: {e}"}), 400
+    result = {"model": model, "distances": list(map(float, distances)), **axes}
+    for name, values in grid.items():
+        result[name] = np.where(np.isfinite(values), values, None).tolist()
+    return _result_response(result)
+
+@app.route("/keyrate/decoy", methods=["POST"])
+def keyrate_decoy():
+    """Optimal decoy-state settings and key rate per distance, run as a job; the result is a column table."""
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'distances' in data:
+            distances = [float(d) for d in data['distances']]
+        else:
+            distances = keyrate_model.distance_grid(float(data.get('max_distance', 300)), float(data.get('step', 2)),
+                                                    max_points=decoy.MAX_DISTANCES)
+        kwargs = {"distances": decoy.validate_distances(distances).tolist(),
+                  **decoy.validate_params(dict(data.get('params') or {}))}
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid decoy optimization: {e}"}), 400
+    return _submit("decoy", decoy.run_optimize, kwargs)
+
+# Receivers one /multiuser request may model
+MAX_MULTIUSER_RECEIVERS = 1_000_000
+
+@app.route("/multiuser", methods=["POST"])
+def multiuser():
+    """
+    Multi-user trusted-node model for every receiver in one call.
+
+    Body: user_distances, or total_distance + n_users (spread evenly), plus
+    the simulator's inputs. Returns per-receiver columns and the summary;
+    an infinite time to form a key (or total time) comes back as null.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'user_distances' in data:
+            distances = np.asarray(data['user_distances'], dtype=float)
+        else:
+            distances = multiuser_engine.spread_distances(float(data.get('total_distance', 500)),
+                                                          int(data.get('n_users', 3)))
+        if not 1 <= distances.size <= MAX_MULTIUSER_RECEIVERS or distances.ndim != 1:
+            raise ValueError(f"Between 1 and {MAX_MULTIUSER_RECEIVERS} receiver distances are required")
+        result = multiuser_engine.simulate(
+            distances,
+            link_length=float(data.get('link_length', 100)),
+            session_key_length=int(data.get('session_key_length', 128)),
+            detector_efficiency=float(data.get('detector_efficiency', 90)),
+            dark_count_prob=float(data.get('dark_count_prob', 0.001)),
+            channel_attenuation=float(data.get('channel_attenuation', 0.2)),
+            misalignment_error=float(data.get('misalignment_error', 2)),
+            key_relay_latency=float(data.get('key_relay_latency', 5)),
+        )
+        summary = multiuser_engine.summarize(result, data.get('distribution_mode', 'Sequential'))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid multi-user parameters: {e}"}), 400
+    receivers = {name: np.where(np.isfinite(values), values, None).tolist() if values.dtype.kind == "f"
+                 else values.tolist() for name, values in result.items()}
+    summary = {name: None if isinstance(value, float) and not np.isfinite(value) else value
+               for name, value in summary.items()}
+    return _result_response({"receivers": receivers, "summary": summary})
+
+@app.route("/keyrate/stats")
+def keyrate_cache_stats():
+    return jsonify(keyrate_model.cache_stats())
+
+@app.route("/transpile_cache/stats")
+def transpile_cache_stats():
+    return jsonify(get_transpile_cache().stats())
+
+
 @app.route("/get_last_analysis")
 def get_last_analysis():
-    global last_analysis
-    return jsonify(last_analysis)
+    return _result_response(_recall("analysis") or {})
+
+@app.route("/key_store/stats")
+def key_store_stats():
+    return jsonify(get_key_store().stats())
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5088, debug=True)
@@ -1,9 +1,17 @@
 # Backend Configuration for QKD Experiments
 import os
 import json
-from qiskit_ibm_runtime import QiskitRuntimeService
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from qiskit_ibm_runtime import Batch, QiskitRuntimeService, SamplerV2
+from qiskit.primitives import BackendSamplerV2
 from qiskit_ibm_runtime.fake_provider import FakeBrisbane
 from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel
+from qkd_backend.clifford_sampler import CliffordSampler
 
 def _get_ibm_token():
     """Get IBM token from multiple sources"""
@@ -41,63 +49,303 @@ def _get_ibm_token():
     
     return None
 
+# How long a least_busy() answer (or a failed IBM login) is reused
+BACKEND_TTL_SECONDS = 300
+# Samplers kept per (backend, seed); seeded runs add one entry per distinct seed
+MAX_CACHED_SAMPLERS = 64
+
+IBM_CHANNELS = ("ibm_quantum_platform", "ibm_cloud")
+
+
+class LocalRuntimeService:
+    """
+    Stand-in for QiskitRuntimeService that serves a fake backend.
+
+    Lets the IBM code path run offline and in tests; enable it with
+    use_local_runtime_service() or QKD_FAKE_RUNTIME=1.
+    """
+
+    def __init__(self, channel=None, token=None, backend=None):
+        self.channel = channel
+        self._backend = backend if backend is not None else FakeBrisbane()
+
+    def least_busy(self, **kwargs):
+        return self._backend
+
+    def backend(self, name=None):
+        return self._backend
+
+    def backends(self, **kwargs):
+        return [self._backend]
+
+
+def _sampler_options(seed):
+    """Runtime SamplerV2 options fixing the simulator seed (used by fake and simulator backends)."""
+    return {"simulator": {"seed_simulator": seed}} if seed is not None else None
+
+
+def _make_sampler(backend, seed=None):
+    if isinstance(backend, AerSimulator):
+        sampler = BackendSamplerV2(backend=backend, options={"seed_simulator": seed})
+        if backend.options.noise_model is None:
+            sampler = CliffordSampler(fallback=sampler, seed=seed)
+        return sampler
+    return SamplerV2(mode=backend, options=_sampler_options(seed))
+
+
+def sampler_seed(rng_seed):
+    """
+    Simulator seed for a run seeded with rng_seed, or None for unseeded runs.
+
+    Derived as a spawned child of the run's SeedSequence, so it is
+    independent of the stream np.random.default_rng(rng_seed) draws from.
+    """
+    if rng_seed is None:
+        return None
+    return int(np.random.SeedSequence(rng_seed).spawn(1)[0].generate_state(1)[0])
+
+
+class BackendRegistry:
+    """
+    Process-wide pool of runtime services, backends and samplers.
+
+    Everything is created once and shared between requests. The IBM
+    least_busy() choice is refreshed after ttl seconds; a failed IBM login
+    is also remembered for ttl seconds so requests fall straight back to
+    the local backend instead of retrying both channels every time.
+    """
+
+    def __init__(self, ttl=BACKEND_TTL_SECONDS, service_factory=None):
+        self.ttl = ttl
+        self._service_factory = service_factory
+        # IBM logins and least_busy() calls go over the network; keep them
+        # off the lock that guards the local backends and samplers.
+        self._ibm_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._token = None
+        self._token_loaded = False
+        self._services = {}
+        self._ibm_backend = None
+        self._ibm_checked_at = None
+        self._local_backend = None
+        self._aer_simulator = None
+        self._noise_model = None
+        self._noisy_simulator = None
+        self._samplers = OrderedDict()
+
+    def _fake_runtime(self):
+        return self._service_factory is LocalRuntimeService
+
+    def token(self):
+        """IBM token, read from the environment/files once."""
+        with self._ibm_lock:
+            if not self._token_loaded:
+                self._token = _get_ibm_token()
+                self._token_loaded = True
+            return self._token
+
+    def service(self, channel):
+        """Runtime service for a channel, created on first use."""
+        with self._ibm_lock:
+            service = self._services.get(channel)
+            if service is None:
+                factory = self._service_factory or QiskitRuntimeService
+                service = factory(channel=channel, token=self.token())
+                self._services[channel] = service
+            return service
+
+    def ibm_backend(self):
+        """Least busy IBM backend, refreshed every ttl seconds; None if IBM is unavailable."""
+        with self._ibm_lock:
+            now = time.monotonic()
+            if self._ibm_checked_at is not None and now - self._ibm_checked_at < self.ttl:
+                return self._ibm_backend
+            self._ibm_checked_at = now
+            self._ibm_backend = self._find_ibm_backend()
+            return self._ibm_backend
+
+    def _find_ibm_backend(self):
+        if not self._fake_runtime():
+            token = self.token()
+            if not token:
+                print("IBM token not found in any source, falling back to local backend")
+                print("Sources checked: IBM_QUANTUM_TOKEN env var, ~/Downloads/apikey (1).json, token.env")
+                return None
+            print(f"Found IBM token: {token[:10]}...")
+
+        first_error = None
+        for channel in IBM_CHANNELS:
+            try:
+                backend = self.service(channel).least_busy(operational=True, simulator=False)
+                print(f"Using IBM backend via {channel}: {backend.name}")
+                return backend
+            except Exception as e:
+                print(f"IBM channel {channel} failed: {e}")
+                self._services.pop(channel, None)
+                first_error = first_error or e
+        print(f"IBM backend initialization failed: {first_error}")
+        print("Falling back to local backend")
+        return None
+
+    def local_backend(self):
+        """Shared FakeBrisbane instance."""
+        with self._lock:
+            if self._local_backend is None:
+                self._local_backend = FakeBrisbane()
+                print(f"Using local backend: {self._local_backend.name}")
+            return self._local_backend
+
+    def aer_simulator(self):
+        """Shared ideal AerSimulator instance."""
+        with self._lock:
+            if self._aer_simulator is None:
+                self._aer_simulator = AerSimulator()
+                print("Using Aer simulator backend")
+            return self._aer_simulator
+
+    def noise_model(self):
+        """NoiseModel of the shared FakeBrisbane, built once."""
+        with self._lock:
+            noise_model = self._noise_model
+        if noise_model is None:
+            # Built outside the lock; it reads every qubit and gate calibration
+            noise_model = NoiseModel.from_backend(self.local_backend())
+            with self._lock:
+                if self._noise_model is None:
+                    self._noise_model = noise_model
+                noise_model = self._noise_model
+        return noise_model
+
+    def noisy_simulator(self):
+        """
+        Shared AerSimulator with FakeBrisbane's noise model, coupling map and target.
+
+        Circuits for it are transpiled like hardware circuits, so the
+        transpile cache keeps one ISA template per chunk width for it too.
+        """
+        with self._lock:
+            simulator = self._noisy_simulator
+        if simulator is None:
+            simulator = AerSimulator.from_backend(self.local_backend(), noise_model=self.noise_model())
+            with self._lock:
+                if self._noisy_simulator is None:
+                    self._noisy_simulator = simulator
+                    print(f"Using noisy simulator backend: {simulator.name}")
+                simulator = self._noisy_simulator
+        return simulator
+
+    def sampler(self, backend, seed=None):
+        """
+        Shared sampler for a backend and seed.
+
+        Aer simulators get a BackendSamplerV2, wrapped in a CliffordSampler
+        when they are noise-free so BB84 circuits skip Aer altogether;
+        runtime and fake backends get an IBM Runtime SamplerV2. Samplers are
+        cached per (backend, seed), the least recently used MAX_CACHED_SAMPLERS
+        kept. A seeded CliffordSampler spawns a new stream for every job, so
+        each seeded call gets a fresh wrapper around the cached simulator
+        sampler: equal seeds then give equal runs.
+        """
+        key = (type(backend).__name__, getattr(backend, 'name', None), seed)
+        with self._lock:
+            cached = self._samplers.get(key)
+            # A refreshed backend object under the same name replaces its predecessor's sampler
+            if cached is None or cached[0] is not backend:
+                cached = self._samplers[key] = (backend, _make_sampler(backend, seed))
+            self._samplers.move_to_end(key)
+            while len(self._samplers) > MAX_CACHED_SAMPLERS:
+                self._samplers.popitem(last=False)
+        sampler = cached[1]
+        if seed is not None and isinstance(sampler, CliffordSampler):
+            return CliffordSampler(fallback=sampler.fallback, seed=seed)
+        return sampler
+
+    def reset(self):
+        """Forget every cached service, backend and sampler."""
+        with self._ibm_lock, self._lock:
+            self._token = None
+            self._token_loaded = False
+            self._services.clear()
+            self._ibm_backend = None
+            self._ibm_checked_at = None
+            self._local_backend = None
+            self._aer_simulator = None
+            self._noise_model = None
+            self._noisy_simulator = None
+            self._samplers.clear()
+
+
+_registry = BackendRegistry(
+    service_factory=LocalRuntimeService if os.getenv('QKD_FAKE_RUNTIME') == '1' else None
+)
+
+
+def get_registry():
+    """Process-wide backend registry."""
+    return _registry
+
+
+def use_local_runtime_service(ttl=BACKEND_TTL_SECONDS):
+    """Swap the registry for one whose IBM path is served by LocalRuntimeService."""
+    global _registry
+    _registry = BackendRegistry(ttl=ttl, service_factory=LocalRuntimeService)
+    return _registry
+
+
 def get_backend_service(backend_type="local"):
     """
     Get the appropriate backend service based on the backend type.
     
     Args:
-        backend_type (str): Either "local" or "ibm"
+        backend_type (str): "local", "noisy" (AerSimulator with FakeBrisbane
+            noise) or "ibm"
         
     Returns:
-        Backend service for quantum experiments
+        Backend service for quantum experiments (shared between requests)
     """
+    if backend_type == "noisy":
+        return _registry.noisy_simulator()
     if backend_type == "ibm":
-        # Use IBM Quantum backend
-        try:
-            # Get token from multiple sources
-            token = _get_ibm_token()
-            if not token:
-                print("IBM token not found in any source, falling back to local backend")
-                print("Sources checked: IBM_QUANTUM_TOKEN env var, ~/Downloads/apikey (1).json, token.env")
-                return get_local_backend()
-            
-            print(f"Found IBM token: {token[:10]}...")
-            
-            # Try ibm_quantum_platform channel first (public IBM Quantum Experience)
-            try:
-                service = QiskitRuntimeService(channel="ibm_quantum_platform", token=token)
-                backend = service.least_busy(operational=True, simulator=False)
-                print(f"Using IBM Quantum backend: {backend.name}")
-                return backend
-            except Exception as e1:
-                print(f"IBM Quantum channel failed: {e1}")
-                
-                # Try ibm_cloud channel as fallback
-                try:
-                    service = QiskitRuntimeService(channel="ibm_cloud", token=token)
-                    backend = service.least_busy(operational=True, simulator=False)
-                    print(f"Using IBM Cloud backend: {backend.name}")
-                    return backend
-                except Exception as e2:
-                    print(f"IBM Cloud channel also failed: {e2}")
-                    raise e1  # Raise the original error
-            
-        except Exception as e:
-            print(f"IBM backend initialization failed: {e}")
-            print("Falling back to local backend")
-            return get_local_backend()
-    else:
-        # Use local simulation
-        return get_local_backend()
+        backend = _registry.ibm_backend()
+        if backend is not None:
+            return backend
+    # Use local simulation
+    return get_local_backend()
 
 def get_local_backend():
     """Get local simulation backend"""
-    backend = FakeBrisbane()
-    print(f"Using local backend: {backend.name}")
-    return backend
+    return _registry.local_backend()
 
 def get_aer_simulator():
     """Get Aer simulator backend"""
-    backend = AerSimulator()
-    print("Using Aer simulator backend")
-    return backend
\ No newline at end of file
+    return _registry.aer_simulator()
+
+def get_noisy_simulator():
+    """Get the noisy (FakeBrisbane noise model) Aer simulator"""
+    return _registry.noisy_simulator()
+
+def get_sampler(backend, seed=None):
+    """Get the shared sampler for a backend and seed"""
+    return _registry.sampler(backend, seed)
+
+@contextmanager
+def batch_sampler(backend, seed=None):
+    """
+    Sampler for several jobs submitted back to back.
+
+    Runtime backends get a SamplerV2 in batch execution mode, so the jobs
+    are scheduled together instead of each waiting in the queue; Aer
+    simulators, and backends where batch mode is unavailable, get the
+    same sampler as get_sampler(backend, seed).
+    """
+    if isinstance(backend, AerSimulator):
+        yield get_sampler(backend, seed)
+        return
+    try:
+        batch = Batch(backend=backend)
+    except Exception as e:
+        print(f"Batch execution mode unavailable ({e}), submitting jobs individually")
+        yield get_sampler(backend, seed)
+        return
+    with batch:
+        yield SamplerV2(mode=batch, options=_sampler_options(seed))
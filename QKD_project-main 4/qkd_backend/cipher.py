@@ -0,0 +1,108 @@
+# Shared XOR cipher over QKD keys
+"""
+Vectorized repeating-key XOR.
+
+The key is turned into one period of keystream bytes once, and messages are
+XORed against it a whole buffer at a time with NumPy. Inputs can be bytes,
+bytearray or memoryview; they are wrapped with np.frombuffer rather than
+copied, and large payloads are processed in CHUNK_SIZE slices so the
+keystream tile stays small.
+"""
+
+import math
+
+import numpy as np
+
+# Bytes XORed per NumPy call when streaming large payloads
+CHUNK_SIZE = 1 << 20
+
+
+def as_bit_array(key_bits):
+    """Key bits as a uint8 0/1 array from a list, array or "0101" string."""
+    if isinstance(key_bits, str):
+        return np.frombuffer(key_bits.encode('ascii'), dtype=np.uint8) - ord('0')
+    return np.asarray(key_bits, dtype=np.uint8).ravel()
+
+
+def pack_key_bits(key_bits):
+    """
+    Keystream period for a bit-level repeating key.
+
+    Bits are packed MSB first. A key whose length is not a multiple of 8 is
+    tiled to lcm(len, 8) bits first, so repeating the returned bytes is the
+    same as repeating the key bit by bit.
+
+    Returns:
+        np.ndarray: uint8 keystream period
+    """
+    bits = as_bit_array(key_bits)
+    if bits.size == 0:
+        raise ValueError("key must contain at least one bit")
+    period_bits = math.lcm(bits.size, 8)
+    return np.packbits(np.tile(bits, period_bits // bits.size))
+
+
+def _keystream_tile(period, length):
+    """Period repeated to cover `length` bytes starting at any phase."""
+    return np.tile(period, -(-(length + period.size) // period.size))
+
+
+def _xor_into(out, data, period, offset, tile):
+    phase = offset % period.size
+    np.bitwise_xor(data, tile[phase:phase + data.size], out=out)
+
+
+def xor_bytes(data, key_bytes, chunk_size=CHUNK_SIZE):
+    """
+    XOR data with a repeating byte key.
+
+    Args:
+        data (bytes | bytearray | memoryview): Payload, not copied
+        key_bytes (bytes | np.ndarray): Key period, one value per byte
+        chunk_size (int): Bytes XORed per NumPy call
+
+    Returns:
+        bytes: Ciphertext (or plaintext; the operation is its own inverse)
+    """
+    period = np.frombuffer(key_bytes, dtype=np.uint8) if isinstance(key_bytes, (bytes, bytearray, memoryview)) \
+        else np.asarray(key_bytes, dtype=np.uint8).ravel()
+    if period.size == 0:
+        raise ValueError("key must contain at least one byte")
+    src = np.frombuffer(data, dtype=np.uint8)
+    out = bytearray(src.size)
+    dst = np.frombuffer(out, dtype=np.uint8)
+    tile = _keystream_tile(period, min(chunk_size, src.size))
+    for start in range(0, src.size, chunk_size):
+        stop = min(start + chunk_size, src.size)
+        _xor_into(dst[start:stop], src[start:stop], period, start, tile)
+    return bytes(out)
+
+
+def xor_bits(data, key_bits, chunk_size=CHUNK_SIZE):
+    """XOR data with a key repeated bit by bit (MSB of each byte first)."""
+    return xor_bytes(data, pack_key_bits(key_bits), chunk_size)
+
+
+def xor_stream(src, dst, key_bits, chunk_size=CHUNK_SIZE):
+    """
+    XOR a binary file-like `src` into `dst` with a bit-level repeating key.
+
+    Only one chunk is held in memory at a time.
+
+    Returns:
+        int: Number of bytes written
+    """
+    period = pack_key_bits(key_bits)
+    tile = _keystream_tile(period, chunk_size)
+    buf = bytearray(chunk_size)
+    out = bytearray(chunk_size)
+    view, out_view = memoryview(buf), memoryview(out)
+    src_arr, out_arr = np.frombuffer(buf, dtype=np.uint8), np.frombuffer(out, dtype=np.uint8)
+    total = 0
+    while True:
+        n = src.readinto(view)
+        if not n:
+            return total
+        _xor_into(out_arr[:n], src_arr[:n], period, total, tile)
+        dst.write(out_view[:n])
+        total += n
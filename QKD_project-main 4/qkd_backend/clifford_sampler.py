@@ -0,0 +1,123 @@
+# Clifford sampler for the ideal local backend
+"""
+SamplerV2 for circuits built from single-qubit Pauli and Hadamard gates.
+
+Every BB84 circuit in this project (Alice -> Bob, Alice -> Eve -> Bob, and
+exp4's measure-reset-resend) only uses x, h, measure and reset, so every
+qubit stays in one of the four BB84 states |0>, |1>, |+>, |->. That state
+is a basis (Z or X) plus a sign; Paulis flip the sign, H swaps the basis, a
+Z measurement of an X-basis qubit is a fair coin. Tracking that per qubit
+costs O(gates + shots * measured bits) instead of the statevector's
+O(2**n), and signs stay plain ints until a random measurement makes them
+per-shot arrays.
+
+Anything else (parameterized templates, entangling gates, other
+registers) goes to the fallback sampler unchanged.
+"""
+
+import threading
+
+import numpy as np
+from qiskit.primitives import BaseSamplerV2, PrimitiveJob
+from qiskit.primitives.containers import BitArray, DataBin, PrimitiveResult, SamplerPubResult
+from qiskit.primitives.containers.sampler_pub import SamplerPub
+
+DEFAULT_SHOTS = 1024
+
+SUPPORTED_GATES = {"x", "y", "z", "h", "measure", "reset", "barrier", "id"}
+
+
+def is_supported(circuit):
+    """True if the circuit only uses gates this sampler can simulate."""
+    return not circuit.parameters and all(
+        inst.operation.name in SUPPORTED_GATES and (inst.operation.name == "barrier" or len(inst.qubits) <= 1)
+        for inst in circuit.data
+    )
+
+
+def simulate(circuit, shots, rng):
+    """
+    Sample a supported circuit.
+
+    Returns:
+        np.ndarray: bool array of shape (shots, num_clbits), column i is clbit i
+    """
+    n = circuit.num_qubits
+    x_basis = [False] * n
+    # Per qubit: 0/1 when the same for every shot, else a uint8 array over shots
+    sign = [0] * n
+    clbits = [0] * circuit.num_clbits
+    for inst in circuit.data:
+        name = inst.operation.name
+        if name in ("barrier", "id"):
+            continue
+        q = circuit.find_bit(inst.qubits[0]).index
+        if name == "h":
+            x_basis[q] = not x_basis[q]
+        elif name == "reset":
+            x_basis[q] = False
+            sign[q] = 0
+        elif name == "measure":
+            if x_basis[q]:
+                x_basis[q] = False
+                sign[q] = rng.integers(0, 2, shots, dtype=np.uint8)
+            clbits[circuit.find_bit(inst.clbits[0]).index] = sign[q]
+        elif name == "y" or (name == "x") != x_basis[q]:
+            # X flips Z-basis states, Z flips X-basis states, Y flips both
+            sign[q] = 1 - sign[q]
+    out = np.empty((shots, len(clbits)), dtype=bool)
+    for i, value in enumerate(clbits):
+        out[:, i] = value
+    return out
+
+
+class CliffordSampler(BaseSamplerV2):
+    """
+    Sampler for BB84-style circuits, with a fallback for everything else.
+
+    A job falls back as a whole when any of its PUBs is unsupported, so
+    results never mix two simulators.
+    """
+
+    def __init__(self, fallback=None, default_shots=DEFAULT_SHOTS, seed=None):
+        self.fallback = fallback
+        self.default_shots = default_shots
+        self._seed_seq = np.random.SeedSequence(seed) if seed is not None else None
+        self._seed_lock = threading.Lock()
+
+    def _rng(self):
+        if self._seed_seq is None:
+            return np.random.default_rng()
+        with self._seed_lock:
+            return np.random.default_rng(self._seed_seq.spawn(1)[0])
+
+    def run(self, pubs, *, shots=None):
+        if shots is None:
+            shots = self.default_shots
+        pubs = list(pubs)
+        coerced = [SamplerPub.coerce(pub, shots) for pub in pubs]
+        if not all(pub.shape == () and is_supported(pub.circuit) for pub in coerced):
+            if self.fallback is None:
+                raise ValueError("CliffordSampler only runs unparameterized x/y/z/h/measure/reset circuits")
+            return self.fallback.run(pubs, shots=shots)
+        job = PrimitiveJob(self._run, coerced)
+        job._submit()
+        return job
+
+    def _run(self, pubs):
+        rng = self._rng()
+        return PrimitiveResult([self._run_pub(pub, rng) for pub in pubs], metadata={"version": 2})
+
+    def _run_pub(self, pub, rng):
+        circuit = pub.circuit
+        samples = simulate(circuit, pub.shots, rng)
+        meas = {
+            creg.name: BitArray.from_bool_array(
+                samples[:, [circuit.find_bit(bit).index for bit in creg]], order="little"
+            )
+            for creg in circuit.cregs
+        }
+        return SamplerPubResult(
+            DataBin(**meas, shape=pub.shape),
+            metadata={"shots": pub.shots, "circuit_metadata": circuit.metadata},
+        )
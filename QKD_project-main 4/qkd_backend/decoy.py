@@ -0,0 +1,260 @@
+# Decoy-state BB84 key rate
+"""
+Decoy-state BB84 with vacuum + weak decoy and optimized intensities.
+
+Alice sends signal pulses of mean photon number mu with probability p_mu,
+weak decoys nu with probability p_nu and vacuum pulses otherwise. The
+vacuum + weak bounds of Ma, Qi, Zhao and Lo (PRA 72, 012326) lower-bound
+the single-photon yield Y1 and upper-bound its error rate e1 from the
+observed gains, and the GLLP rate keeps only what the single photons
+carry:
+
+    R = q p_mu [ -Q_mu f h(E_mu) + Q_1 (1 - h(e_1)) ]
+
+With a finite number of pulses, the decoy and vacuum statistics are
+shifted by u standard deviations, which is what makes the decoy
+probabilities worth optimizing; n_pulses=None gives the asymptotic rate.
+
+optimize() searches (mu, nu, p_mu, p_nu) for every distance: a vectorized
+grid over the whole parameter box, then a few rounds of shrinking grids
+around the best point. Distances are split over a process pool.
+"""
+
+import multiprocessing
+import numbers
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from qkd_backend.keyrate import binary_entropy, distance_grid, transmittance
+from qkd_backend.serialization import table_columns
+
+# Channel defaults follow the KeyrateVsDistance page; dark counts per gate are dark / rep_rate
+DECOY_DEFAULTS = {
+    "alpha": 0.2, "eta_det": 0.1, "dark": 100.0, "rep_rate": 1e6, "e_det": 0.01,
+    "f_ec": 1.16, "n_pulses": 1e12, "u": 10.0,
+}
+# Accepted (low, high, low exclusive) of each parameter; all must be finite,
+# and n_pulses may also be None for the asymptotic rate
+DECOY_RANGES = {
+    "alpha": (0.0, np.inf, False), "eta_det": (0.0, 1.0, True), "dark": (0.0, np.inf, False),
+    "rep_rate": (0.0, np.inf, True), "e_det": (0.0, 0.5, False), "f_ec": (1.0, np.inf, False),
+    "n_pulses": (0.0, np.inf, True), "u": (0.0, np.inf, False),
+}
+# Basis sifting factor of BB84
+SIFT = 0.5
+# Error rate of a dark count
+E0 = 0.5
+MU_MAX = 1.0
+
+GRID_POINTS = 12
+REFINE_POINTS = 5
+REFINE_STEPS = 8
+# Distances one optimize() call accepts; each takes a few milliseconds
+MAX_DISTANCES = 10_000
+_EPS = 1e-4
+# Optimizations run on job worker threads; forking a multithreaded process can deadlock the child
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+DECOY_DTYPE = np.dtype([
+    ("distance_km", "f8"),
+    ("mu", "f8"),
+    ("nu", "f8"),
+    ("p_mu", "f8"),
+    ("p_nu", "f8"),
+    ("p_vacuum", "f8"),
+    ("key_rate", "f8"),
+    ("key_rate_per_pulse", "f8"),
+    ("gain", "f8"),
+    ("qber", "f8"),
+    ("y1_lower", "f8"),
+    ("e1_upper", "f8"),
+])
+
+
+def decoy_rate(distance_km, mu, nu, p_mu, p_nu, alpha=0.2, eta_det=0.1, dark=100.0, rep_rate=1e6, e_det=0.01,
+               f_ec=1.16, n_pulses=1e12, u=10.0):
+    """
+    GLLP key rate with vacuum + weak decoy bounds; all arguments broadcast.
+
+    Returns:
+        dict: key_rate (bits/s), key_rate_per_pulse, gain Q_mu, qber E_mu,
+        y1_lower and e1_upper. Infeasible settings (nu >= mu, negative
+        vacuum probability, no single-photon yield) get rate 0.
+    """
+    distance_km, mu, nu, p_mu, p_nu = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (distance_km, mu, nu, p_mu, p_nu))
+    )
+    eta = eta_det * transmittance(distance_km, alpha)
+    y0 = dark / rep_rate
+    p_0 = 1 - p_mu - p_nu
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        q_mu = y0 + 1 - np.exp(-eta * mu)
+        e_mu = (E0 * y0 + e_det * (1 - np.exp(-eta * mu))) / q_mu
+        q_nu = y0 + 1 - np.exp(-eta * nu)
+        eq_nu = E0 * y0 + e_det * (1 - np.exp(-eta * nu))
+        y0_upper = y0_lower = np.full_like(p_0, y0)
+        if n_pulses is not None:
+            # u standard deviations on the decoy and vacuum statistics
+            q_nu = q_nu - u * np.sqrt(q_nu / (n_pulses * p_nu))
+            eq_nu = eq_nu + u * np.sqrt(eq_nu / (n_pulses * p_nu))
+            y0_upper = y0 + u * np.sqrt(y0 / (n_pulses * p_0))
+            y0_lower = np.maximum(y0 - u * np.sqrt(y0 / (n_pulses * p_0)), 0)
+        y1 = mu / (mu * nu - nu**2) * (
+            q_nu * np.exp(nu) - q_mu * np.exp(mu) * nu**2 / mu**2 - (mu**2 - nu**2) / mu**2 * y0_upper
+        )
+        e1 = np.clip((eq_nu * np.exp(nu) - E0 * y0_lower) / (y1 * nu), 0, 0.5)
+        q1 = y1 * mu * np.exp(-mu)
+        rate = SIFT * p_mu * (-q_mu * f_ec * binary_entropy(e_mu) + q1 * (1 - binary_entropy(e1)))
+    feasible = (nu > 0) & (nu < mu) & (p_mu > 0) & (p_nu > 0) & (p_0 >= 0) & (y1 > 0)
+    rate = np.where(feasible & np.isfinite(rate), np.maximum(rate, 0), 0.0)
+    return {
+        "key_rate": rate * rep_rate,
+        "key_rate_per_pulse": rate,
+        "gain": q_mu,
+        "qber": e_mu,
+        "y1_lower": np.where(feasible, y1, 0.0),
+        "e1_upper": np.where(feasible, e1, 0.5),
+    }
+
+
+def _settings(x):
+    """Map points of the unit cube to (mu, nu, p_mu, p_nu) with nu < mu and p_mu + p_nu < 1."""
+    mu = MU_MAX * x[..., 0]
+    p_mu = x[..., 2]
+    return mu, mu * x[..., 1], p_mu, (1 - p_mu) * x[..., 3]
+
+
+def _best(distance_km, x, params):
+    rate = decoy_rate(distance_km, *_settings(x), **params)["key_rate_per_pulse"]
+    i = int(np.argmax(rate))
+    return x[i], rate[i]
+
+
+def _box_grid(low, high, points):
+    axes = [np.linspace(lo, hi, points) for lo, hi in zip(low, high)]
+    return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(axes))
+
+
+def optimize_distance(distance_km, grid_points=GRID_POINTS, refine_points=REFINE_POINTS,
+                      refine_steps=REFINE_STEPS, **params):
+    """
+    Optimal decoy settings at one distance.
+
+    A grid_points^4 search over the whole box, then refine_steps rounds of
+    refine_points^4 grids, each half as wide, around the best point.
+
+    Returns:
+        np.ndarray: One DECOY_DTYPE row
+    """
+    params = {**DECOY_DEFAULTS, **params}
+    low, high = np.full(4, _EPS), np.full(4, 1 - _EPS)
+    x, _ = _best(distance_km, _box_grid(low, high, grid_points), params)
+    span = (high - low) / (grid_points - 1)
+    for _ in range(refine_steps):
+        candidate, _ = _best(distance_km, _box_grid(np.maximum(x - span, low), np.minimum(x + span, high),
+                                                    refine_points), params)
+        x = candidate
+        span = span / 2
+    mu, nu, p_mu, p_nu = (float(v) for v in _settings(x))
+    stats = decoy_rate(distance_km, mu, nu, p_mu, p_nu, **params)
+    row = np.zeros((), dtype=DECOY_DTYPE)
+    row["distance_km"] = distance_km
+    if stats["key_rate"] > 0:
+        row["mu"], row["nu"], row["p_mu"], row["p_nu"] = mu, nu, p_mu, p_nu
+        row["p_vacuum"] = 1 - p_mu - p_nu
+    for name, value in stats.items():
+        row[name] = value
+    return row
+
+
+def validate_params(params):
+    """
+    Check decoy channel parameters before they reach the model.
+
+    Returns:
+        dict: The parameters as floats (n_pulses may stay None)
+
+    Raises:
+        ValueError: On an unknown parameter, a non-numeric or non-finite
+        value, or a value outside DECOY_RANGES
+    """
+    unknown = set(params) - set(DECOY_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown parameter(s): {sorted(unknown)}")
+    checked = {}
+    for name, value in params.items():
+        if name == "n_pulses" and value is None:
+            checked[name] = None
+            continue
+        low, high, low_open = DECOY_RANGES[name]
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or not np.isfinite(value):
+            raise ValueError(f"{name} must be a finite number, got {value!r}")
+        if value < low or (low_open and value == low) or value > high:
+            raise ValueError(f"{name} must be in {'(' if low_open else '['}{low}, {high}], got {value!r}")
+        checked[name] = float(value)
+    return checked
+
+
+def validate_distances(distances):
+    """
+    Check an optimization's distances.
+
+    Returns:
+        np.ndarray: The distances as floats
+
+    Raises:
+        ValueError: On a negative or non-finite distance, or none or more than MAX_DISTANCES of them
+    """
+    distances = np.atleast_1d(np.asarray(distances, dtype=float))
+    if distances.ndim != 1 or not 1 <= distances.size <= MAX_DISTANCES:
+        raise ValueError(f"Between 1 and {MAX_DISTANCES} distances are required")
+    if not np.all(np.isfinite(distances) & (distances >= 0)):
+        raise ValueError("Distances must be finite and non-negative")
+    return distances
+
+
+def _optimize_chunk(distances, options):
+    return [optimize_distance(d, **options) for d in distances]
+
+
+def optimize(distances=None, max_workers=None, executor=None, grid_points=GRID_POINTS,
+             refine_points=REFINE_POINTS, refine_steps=REFINE_STEPS, **params):
+    """
+    Optimal-rate envelope: the best decoy settings at every distance.
+
+    Args:
+        distances: Distances in km; default 0..300 km in 2 km steps
+        max_workers (int | None): Process pool size when no executor is given
+        executor: Optional executor to run the distance chunks on
+        **params: Channel and finite-key parameters overriding DECOY_DEFAULTS
+
+    Returns:
+        np.ndarray: Structured array of DECOY_DTYPE rows in distance order
+
+    Raises:
+        ValueError: On parameters or distances validate_params() or
+        validate_distances() rejects, or a grid smaller than 2 points
+    """
+    params = validate_params(params)
+    if grid_points < 2 or refine_points < 2:
+        raise ValueError("grid_points and refine_points must be at least 2")
+    distances = validate_distances(distance_grid(300, 2) if distances is None else distances)
+    options = {"grid_points": grid_points, "refine_points": refine_points, "refine_steps": refine_steps, **params}
+    # A few chunks per worker keeps the pool busy when rates vanish at long distances
+    workers = max_workers or os.cpu_count() or 1
+    chunks = [list(chunk) for chunk in np.array_split(distances, min(len(distances), 4 * workers)) if chunk.size]
+    if executor is not None:
+        parts = list(executor.map(_optimize_chunk, chunks, [options] * len(chunks)))
+    elif len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT) as pool:
+            parts = list(pool.map(_optimize_chunk, chunks, [options] * len(chunks)))
+    else:
+        parts = [_optimize_chunk(chunk, options) for chunk in chunks]
+    return np.array([row for part in parts for row in part], dtype=DECOY_DTYPE)
+
+
+def run_optimize(distances=None, max_workers=None, **params):
+    """optimize() as a JSON-ready column table, for the job API."""
+    return table_columns(optimize(distances, max_workers, **params))
@@ -0,0 +1,115 @@
+# Lazy circuit diagram rendering
+"""
+Circuit diagrams rendered off the request path.
+
+Runners register the circuit they want to show and get a URL back at once.
+The PNG is drawn on the first GET of that URL by a single background
+worker (matplotlib is not thread-safe) and cached on disk by circuit hash,
+so concurrent requests never overwrite each other's diagram and a circuit
+is drawn at most once.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from qiskit.visualization import circuit_drawer
+
+from qkd_backend.transpile_cache import circuit_key
+
+DIAGRAM_DIR = os.path.join("static", "diagrams")
+DIAGRAM_URL_PREFIX = "/diagrams"
+# Registered-but-not-yet-drawn circuits kept in memory
+MAX_PENDING = 128
+RENDER_TIMEOUT_SECONDS = 60
+
+_pending = OrderedDict()
+_futures = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diagram")
+
+
+def circuit_hash(qc):
+    """Stable hash of a circuit's structure."""
+    return hashlib.sha1(repr(circuit_key(qc)).encode()).hexdigest()[:20]
+
+
+def diagram_path(digest):
+    return os.path.abspath(os.path.join(DIAGRAM_DIR, f"{digest}.png"))
+
+
+def register_circuit(qc):
+    """
+    Remember a circuit for lazy drawing.
+
+    Returns:
+        str: URL that renders the diagram on first GET
+    """
+    digest = circuit_hash(qc)
+    with _lock:
+        if not os.path.exists(diagram_path(digest)):
+            _pending[digest] = qc
+            _pending.move_to_end(digest)
+            while len(_pending) > MAX_PENDING:
+                _pending.popitem(last=False)
+    return f"{DIAGRAM_URL_PREFIX}/{digest}.png"
+
+
+def is_known(digest):
+    """Whether a digest is drawn, registered or being drawn."""
+    with _lock:
+        return digest in _pending or digest in _futures or os.path.exists(diagram_path(digest))
+
+
+def _draw(digest, qc):
+    path = diagram_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig = circuit_drawer(qc, output='mpl')
+    # Write then rename so a reader never sees a half-written PNG
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    fig.savefig(tmp_path, format='png')
+    plt.close(fig)
+    os.replace(tmp_path, path)
+    return path
+
+
+def render(digest, timeout=RENDER_TIMEOUT_SECONDS):
+    """
+    Path of the PNG for a registered circuit, drawing it if needed.
+
+    If the drawing is not done within timeout, a drawing still queued is
+    cancelled; one already running finishes in the background. Either way
+    the circuit stays registered, so a later call picks it up.
+
+    Returns:
+        str | None: File path, or None if the digest is unknown or the
+        drawing timed out
+    """
+    path = diagram_path(digest)
+    if os.path.exists(path):
+        return path
+    with _lock:
+        future = _futures.get(digest)
+        if future is None:
+            qc = _pending.get(digest)
+            if qc is None:
+                return None
+            future = _executor.submit(_draw, digest, qc)
+            _futures[digest] = future
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.cancel():
+            with _lock:
+                _futures.pop(digest, None)
+        return None
+    finally:
+        if future.done() and not future.cancelled():
+            with _lock:
+                _futures.pop(digest, None)
+                _pending.pop(digest, None)
@@ -0,0 +1,170 @@
+# Asynchronous experiment jobs
+"""
+Bounded worker pool for experiment runs.
+
+A POST only enqueues a run and returns its job id; a fixed number of
+worker threads execute the runs, so a few slow hardware jobs cannot tie
+up every Flask request thread. When too many jobs are waiting, submit()
+raises JobQueueFull and the caller answers with a backpressure status.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4
+# Jobs allowed to wait for a worker before submissions are refused
+MAX_QUEUE_DEPTH = 32
+# Finished jobs kept around for status/result lookups
+MAX_FINISHED_JOBS = 256
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at its maximum depth."""
+
+
+class JobManager:
+    """Runs submitted callables on a bounded thread pool and tracks their state."""
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queue_depth=MAX_QUEUE_DEPTH, max_finished=MAX_FINISHED_JOBS):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qkd-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active(self):
+        return sum(1 for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING))
+
+    def submit(self, kind, fn, **kwargs):
+        """
+        Enqueue fn(**kwargs).
+
+        Returns:
+            str: Job id
+
+        Raises:
+            JobQueueFull: If max_workers + max_queue_depth jobs are already active
+        """
+        with self._lock:
+            if self._active() >= self.max_workers + self.max_queue_depth:
+                raise JobQueueFull(f"Job queue is full ({self.max_queue_depth} waiting)")
+            job_id = uuid.uuid4().hex
+            job = {
+                "id": job_id,
+                "kind": kind,
+                "status": QUEUED,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "error": None,
+                "result": None,
+                "cancel_requested": False,
+                "future": None,
+            }
+            self._jobs[job_id] = job
+            job["future"] = self._executor.submit(self._run, job, fn, kwargs)
+            self._evict()
+        return job_id
+
+    def _run(self, job, fn, kwargs):
+        with self._lock:
+            if job["status"] != QUEUED:
+                return
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+        try:
+            result = fn(**kwargs)
+        except Exception as e:
+            with self._lock:
+                job["status"] = CANCELLED if job["cancel_requested"] else FAILED
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+            return
+        with self._lock:
+            # A cancel that arrived while running discards the result
+            if job["cancel_requested"]:
+                job["status"] = CANCELLED
+            else:
+                job["status"] = DONE
+                job["result"] = result
+            job["finished_at"] = time.time()
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (DONE, FAILED, CANCELLED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        """Public view of a job, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            view = {k: v for k, v in job.items() if k not in ("result", "future")}
+            if job["status"] == QUEUED:
+                queued = [j for j in self._jobs.values() if j["status"] == QUEUED]
+                view["queue_position"] = queued.index(job)
+            return view
+
+    def result(self, job_id):
+        """
+        Returns:
+            tuple: (status, result) — result is only set when status is "done";
+            (None, None) if the job is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, None
+            return job["status"], job["result"]
+
+    def cancel(self, job_id):
+        """
+        Cancel a job.
+
+        Queued jobs are dropped immediately. A running job cannot be
+        interrupted; it is marked and its result discarded when it ends.
+
+        Returns:
+            str | None: New status, or None if the job is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == QUEUED:
+                job["future"].cancel()
+                job["status"] = CANCELLED
+                job["finished_at"] = time.time()
+            elif job["status"] == RUNNING:
+                job["cancel_requested"] = True
+            return job["status"]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_depth": self.max_queue_depth,
+                "jobs": counts,
+            }
+
+
+_manager = JobManager()
+
+
+def get_job_manager():
+    """Process-wide job manager."""
+    return _manager
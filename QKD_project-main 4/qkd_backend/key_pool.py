@@ -0,0 +1,295 @@
+# Per-peer one-time-pad key pool
+"""
+Ring buffer of distilled key material, one per peer.
+
+BB84 runs deposit their error-corrected, privacy-amplified key; encryption
+consumes it byte for byte and erases what it used, so no key bit is ever
+applied twice. When QKD_KEY_POOL_DIR is set the buffer is a memory-mapped
+file (<dir>/<peer>.pool) and survives restarts; otherwise it lives in
+memory. When the pool drains below its low watermark a background worker
+runs key generation until the high watermark is reached again.
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from qkd_backend.cipher import as_bit_array, xor_bytes
+from qkd_backend.qkd_runner.bb84_vectorized import prepare_and_measure
+from qkd_backend.qkd_runner.parameter_estimation import estimation_policy
+from qkd_backend.qkd_runner.pipeline import distill
+
+DEFAULT_CAPACITY_BYTES = 1 << 20
+LOW_WATERMARK_BITS = 4096
+HIGH_WATERMARK_BITS = 65536
+# Key generation runs per refill before giving up on reaching the high watermark
+MAX_REFILL_RUNS = 1024
+# Qubits per refill session; large enough that the sampled QBER bound stays
+# below the abort threshold and privacy amplification leaves key
+REFILL_BIT_NUM = 32768
+# Pools held open at once; each can pin DEFAULT_CAPACITY_BYTES of memory or a mapped file
+MAX_KEY_POOLS = 64
+
+# Header of a pool file: total bytes consumed, total bytes deposited
+_HEADER_BYTES = 16
+
+_refill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="key-refill")
+
+
+class KeyExhausted(Exception):
+    """Raised when a pool holds fewer key bytes than requested."""
+
+
+class TooManyKeyPools(Exception):
+    """Raised when a new pool would exceed MAX_KEY_POOLS."""
+
+
+class KeyPool:
+    """
+    Byte-granular ring buffer of one-time-pad key material.
+
+    Bits deposited in amounts that are not a multiple of 8 are held back
+    until a full byte is available.
+    """
+
+    def __init__(self, peer, capacity=DEFAULT_CAPACITY_BYTES, path=None,
+                 low_watermark_bits=LOW_WATERMARK_BITS, high_watermark_bits=HIGH_WATERMARK_BITS, refill=None):
+        self.peer = peer
+        self.path = path
+        self.low_watermark_bits = low_watermark_bits
+        self.high_watermark_bits = min(high_watermark_bits, capacity * 8)
+        self.refill = refill
+        self._lock = threading.Lock()
+        self._pending_bits = np.zeros(0, dtype=np.uint8)
+        self._refilling = False
+
+        if path is None:
+            self._mm = np.zeros(_HEADER_BYTES + capacity, dtype=np.uint8)
+        else:
+            if os.path.exists(path):
+                self._mm = np.memmap(path, dtype=np.uint8, mode='r+')
+            else:
+                self._mm = np.memmap(path, dtype=np.uint8, mode='w+', shape=(_HEADER_BYTES + capacity,))
+        self._header = self._mm[:_HEADER_BYTES].view(np.uint64)
+        self._data = self._mm[_HEADER_BYTES:]
+        self.capacity = self._data.size
+
+    # --- State ---
+    @property
+    def _consumed(self):
+        return int(self._header[0])
+
+    @property
+    def _deposited(self):
+        return int(self._header[1])
+
+    def _available_bytes(self):
+        return self._deposited - self._consumed
+
+    @property
+    def available_bits(self):
+        with self._lock:
+            return self._available_bytes() * 8
+
+    def _flush(self):
+        if isinstance(self._mm, np.memmap):
+            self._mm.flush()
+
+    # --- Ring buffer access ---
+    def _ring_write(self, start, data):
+        offset = start % self.capacity
+        first = min(data.size, self.capacity - offset)
+        self._data[offset:offset + first] = data[:first]
+        self._data[:data.size - first] = data[first:]
+
+    def _ring_take(self, start, n):
+        """Copy n bytes out of the ring and zero them."""
+        offset = start % self.capacity
+        first = min(n, self.capacity - offset)
+        out = np.concatenate([self._data[offset:offset + first], self._data[:n - first]])
+        self._data[offset:offset + first] = 0
+        self._data[:n - first] = 0
+        return out
+
+    # --- Public API ---
+    def deposit(self, key_bits):
+        """
+        Append key bits (list, array or "0101" string).
+
+        Bits that do not fit are dropped; key material is never overwritten
+        before it is consumed.
+
+        Returns:
+            int: Number of bits accepted
+        """
+        new_bits = as_bit_array(key_bits)
+        with self._lock:
+            free_bits = (self.capacity - self._available_bytes()) * 8 - self._pending_bits.size
+            accepted = max(0, min(new_bits.size, free_bits))
+            bits = np.concatenate([self._pending_bits, new_bits[:accepted]])
+            whole = bits.size // 8 * 8
+            self._pending_bits = bits[whole:]
+            packed = np.packbits(bits[:whole])
+            self._ring_write(self._deposited, packed)
+            self._header[1] = self._deposited + packed.size
+            self._flush()
+        return accepted
+
+    def deposit_bytes(self, key_bytes):
+        """Append whole bytes of key material (e.g. a hex-decoded secret key)."""
+        return self.deposit(np.unpackbits(np.frombuffer(key_bytes, dtype=np.uint8)))
+
+    def consume(self, n_bytes):
+        """
+        Take the next n_bytes of key; they are erased from the pool.
+
+        Returns:
+            tuple: (key bytes, absolute key offset in bytes)
+
+        Raises:
+            KeyExhausted: If fewer than n_bytes are available
+        """
+        with self._lock:
+            available = self._available_bytes()
+            if n_bytes > available:
+                self._maybe_refill(available)
+                raise KeyExhausted(f"peer {self.peer!r} has {available * 8} key bits, {n_bytes * 8} needed")
+            offset = self._consumed
+            key = self._ring_take(offset, n_bytes)
+            self._header[0] = offset + n_bytes
+            self._flush()
+            self._maybe_refill(available - n_bytes)
+        return key.tobytes(), offset
+
+    def encrypt(self, data):
+        """
+        One-time-pad data with fresh key.
+
+        Returns:
+            tuple: (ciphertext, key bytes used, key offset)
+        """
+        key, offset = self.consume(len(data))
+        return xor_bytes(data, key), key, offset
+
+    def stats(self):
+        with self._lock:
+            available = self._available_bytes()
+            return {
+                "peer": self.peer,
+                "available_bits": available * 8,
+                "pending_bits": int(self._pending_bits.size),
+                "capacity_bits": self.capacity * 8,
+                "consumed_bits": self._consumed * 8,
+                "low_watermark_bits": self.low_watermark_bits,
+                "high_watermark_bits": self.high_watermark_bits,
+                "refilling": self._refilling,
+                "persistent": self.path is not None,
+            }
+
+    # --- Background refill ---
+    def _maybe_refill(self, available_bytes):
+        # Called with the lock held
+        if self.refill is None or self._refilling or available_bytes * 8 >= self.low_watermark_bits:
+            return
+        self._refilling = True
+        _refill_executor.submit(self._refill_loop)
+
+    def _refill_loop(self):
+        try:
+            for _ in range(MAX_REFILL_RUNS):
+                if self.available_bits >= self.high_watermark_bits:
+                    break
+                bits = self.refill()
+                # An aborted batch yields no key; only a full pool stops the refill
+                if len(bits) and not self.deposit(bits):
+                    break
+        finally:
+            with self._lock:
+                self._refilling = False
+
+
+def bb84_key_material(bit_num=REFILL_BIT_NUM):
+    """
+    Run one ideal local BB84 session through the post-processing pipeline and return its key bits.
+
+    The QBER is sampled with the same policy as the experiments. A session
+    that aborts, or whose sample is too small for a finite-key bound, yields
+    no key.
+    """
+    rng = np.random.default_rng()
+    policy, _ = estimation_policy()
+    distilled = distill(*prepare_and_measure(bit_num, rng), rng=rng, **policy)
+    if distilled["aborted"] or distilled["estimation_status"] != "ok":
+        return np.zeros(0, dtype=np.uint8)
+    return distilled["key"]
+
+
+# --- Registry ---
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_path(peer):
+    pool_dir = os.environ.get("QKD_KEY_POOL_DIR")
+    if not pool_dir:
+        return None
+    os.makedirs(pool_dir, exist_ok=True)
+    return os.path.join(pool_dir, f"{peer}.pool")
+
+
+def _open_pool(peer, create):
+    """Registered pool for a peer, reopening a persisted one; with create, a new one otherwise."""
+    if not isinstance(peer, str) or not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", peer):
+        raise ValueError(f"Invalid peer name: {peer!r}")
+    with _pools_lock:
+        pool = _pools.get(peer)
+        if pool is not None:
+            return pool
+        path = _pool_path(peer)
+        if not create and (path is None or not os.path.exists(path)):
+            return None
+        if len(_pools) >= MAX_KEY_POOLS:
+            raise TooManyKeyPools(f"Too many key pools ({MAX_KEY_POOLS})")
+        pool = _pools[peer] = KeyPool(peer, path=path, refill=bb84_key_material)
+        return pool
+
+
+def find_key_pool(peer="default"):
+    """
+    Existing pool for a peer, or None; never creates one.
+
+    Raises:
+        ValueError: If the peer name is not a simple identifier
+        TooManyKeyPools: If a persisted pool cannot be reopened under the cap
+    """
+    return _open_pool(peer, create=False)
+
+
+def check_key_pool(peer="default"):
+    """
+    Check that key for a peer could be deposited, without creating its pool.
+
+    Raises:
+        ValueError: If the peer name is not a simple identifier
+        TooManyKeyPools: If the peer has no pool and the cap is reached
+    """
+    if find_key_pool(peer) is None:
+        with _pools_lock:
+            if len(_pools) >= MAX_KEY_POOLS:
+                raise TooManyKeyPools(f"Too many key pools ({MAX_KEY_POOLS})")
+
+
+def get_key_pool(peer="default"):
+    """
+    Process-wide pool for a peer with BB84 refill, created if needed.
+
+    Only depositing should create pools; readers use find_key_pool.
+
+    Raises:
+        ValueError: If the peer name is not a simple identifier
+        TooManyKeyPools: If the peer has no pool and MAX_KEY_POOLS are open
+    """
+    return _open_pool(peer, create=True)
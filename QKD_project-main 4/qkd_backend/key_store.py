@@ -0,0 +1,182 @@
+# Session-scoped key storage
+"""
+Key store for experiment results, looked up by key id.
+
+Each generated key (the full experiment result that the encryption step
+reuses) is stored under its own key id, and every browser session keeps a
+pointer to its latest key per experiment. Both lookups are single
+dictionary / primary-key reads. Idle entries expire after a TTL and the
+in-memory store is also capped by LRU eviction, so memory stays bounded
+with many users.
+
+Backends:
+    MemoryKeyStore  - per-process, the default
+    SQLiteKeyStore  - shared file, for several worker processes
+
+Select with QKD_KEY_STORE=memory (default) or QKD_KEY_STORE=sqlite:/path/to/keys.db.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+KEY_TTL_SECONDS = 30 * 60
+MAX_KEYS = 4096
+
+
+def new_key_id():
+    return uuid.uuid4().hex
+
+
+def session_pointer(session_id, name):
+    """Store key under which a session's latest key id for `name` is kept."""
+    return f"session:{session_id}:{name}"
+
+
+class MemoryKeyStore:
+    """In-process store with sliding TTL and LRU eviction."""
+
+    def __init__(self, ttl=KEY_TTL_SECONDS, maxsize=MAX_KEYS, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Value for key, or None if unknown or expired. A hit refreshes the TTL."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries[key] = (now + self.ttl, entry[1])
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        now = self._clock()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._evict(now)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _evict(self, now):
+        # Entries are in access order, so expired ones sit at the front
+        while self._entries:
+            oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.maxsize:
+                break
+            del self._entries[oldest_key]
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl}
+
+
+class SQLiteKeyStore:
+    """
+    File-backed store shared by every worker process on the host.
+
+    Values are stored as JSON, so they must be JSON-serializable (experiment
+    results already are, since they are returned through jsonify).
+    """
+
+    def __init__(self, path, ttl=KEY_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS keys ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS keys_expires_at ON keys (expires_at)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = self._clock()
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT value, expires_at FROM keys WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM keys WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE keys SET expires_at = ? WHERE key = ?", (now + self.ttl, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = self._clock()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO keys (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl),
+            )
+            conn.execute("DELETE FROM keys WHERE expires_at <= ?", (now,))
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM keys WHERE key = ?", (key,))
+
+    def stats(self):
+        (size,) = self._connect().execute("SELECT COUNT(*) FROM keys").fetchone()
+        return {"backend": "sqlite", "path": self.path, "size": size, "ttl": self.ttl}
+
+
+def create_key_store(spec=None):
+    """
+    Build a store from a spec string: "memory" or "sqlite:<path>".
+
+    Raises:
+        ValueError: For an unknown backend
+    """
+    spec = spec or os.environ.get("QKD_KEY_STORE", "memory")
+    if spec == "memory":
+        return MemoryKeyStore()
+    if spec.startswith("sqlite:"):
+        return SQLiteKeyStore(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown key store: {spec}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_key_store():
+    """Process-wide key store, created on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_key_store()
+        return _store
+
+
+def set_key_store(store):
+    """Replace the process-wide key store (e.g. with a SQLite store)."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,205 @@
+# Key rate vs. distance models
+"""
+Secure key rate and QBER over fiber distance, evaluated on whole grids.
+
+Python ports of the models behind the key-rate pages:
+
+    link_rate      - simulate() in templates/KeyrateVsDistance.html
+                     (BB84 / decoy / E91 / CV-QKD over distance x mu)
+    repeater_rate  - secureRepeaterSingleLink() in templates/keyrate.html,
+                     evaluated per segment for 0..n trusted repeaters
+    tf_qkd_rate    - tfQKDRate() in templates/keyrate.html (illustrative)
+
+Every function broadcasts over NumPy arrays, so a distance x mu x
+protocol (or distance x repeater-count) grid is one vectorized call.
+evaluate() memoizes whole grids on their parameters rounded to
+SIG_DIGITS significant digits.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+SIG_DIGITS = 9
+CACHE_SIZE = 256
+# Largest grid evaluate() computes in one call
+MAX_GRID_POINTS = 4_000_000
+
+PROTOCOLS = ("bb84", "decoy", "e91", "cvqkd")
+
+# Slider defaults of the two pages
+LINK_DEFAULTS = {"eta": 0.1, "dark": 100.0, "rep_rate": 1e6, "alpha": 0.2, "e0": 0.01}
+REPEATER_DEFAULTS = {
+    "alpha": 0.2, "eta_det": 0.6, "f_rep": 10e6, "dark_count_rate": 100.0,
+    "e_channel": 0.01, "emission_prob": 1.0, "basis_sift_factor": 0.5,
+}
+# Twin-field scaling constant of tfQKDRate()
+TF_K = 0.2
+
+
+def binary_entropy(q):
+    """Elementwise h(q) in bits; 0 outside (0, 1)."""
+    q = np.asarray(q, dtype=float)
+    inside = (q > 0) & (q < 1)
+    p = np.where(inside, q, 0.5)
+    return np.where(inside, -p * np.log2(p) - (1 - p) * np.log2(1 - p), 0.0)
+
+
+def transmittance(distance_km, alpha):
+    """Fiber transmittance 10^(-alpha L / 10)."""
+    return 10 ** (-np.asarray(alpha, dtype=float) * np.asarray(distance_km, dtype=float) / 10)
+
+
+def link_rate(distance_km, mu, protocol="bb84", eta=0.1, dark=100.0, rep_rate=1e6, alpha=0.2, e0=0.01):
+    """
+    QBER and key rate of a direct link, as in KeyrateVsDistance.html.
+
+    Args broadcast against each other; protocol may be an array of
+    protocol names.
+
+    Returns:
+        tuple: (qber, key_rate) arrays of the broadcast shape
+    """
+    distance_km, mu, protocol = np.broadcast_arrays(
+        np.asarray(distance_km, dtype=float), np.asarray(mu, dtype=float), np.asarray(protocol)
+    )
+    unknown = set(np.unique(protocol)) - set(PROTOCOLS)
+    if unknown:
+        raise ValueError(f"Unknown protocol(s): {sorted(unknown)}")
+    signal = mu * eta * rep_rate * transmittance(distance_km, alpha)
+    qber = (e0 * signal + 0.5 * dark) / (signal + dark)
+    key_rate = signal * np.maximum(0, 1 - 2 * binary_entropy(qber))
+
+    # Protocol adjustments of the page: the key rate uses the BB84 QBER
+    key_rate = key_rate * np.select(
+        [protocol == "decoy", protocol == "e91", protocol == "cvqkd"], [1.2, 0.9, 1.5], 1.0
+    )
+    qber = np.select([protocol == "e91", protocol == "cvqkd"], [qber + 0.01, np.minimum(0.15, qber + 0.05)], qber)
+    return qber, key_rate
+
+
+def repeater_rate(distance_km, repeaters=0, alpha=0.2, eta_det=0.6, f_rep=10e6, dark_count_rate=100.0,
+                  e_channel=0.01, emission_prob=1.0, basis_sift_factor=0.5):
+    """
+    Secure key rate with the distance split over repeaters + 1 equal segments.
+
+    Returns:
+        np.ndarray: Rate of one segment, as keyrate.html plots it
+    """
+    segment_km = np.asarray(distance_km, dtype=float) / (np.asarray(repeaters) + 1)
+    p_signal = emission_prob * transmittance(segment_km, alpha) * eta_det
+    dark_per_gate = dark_count_rate / f_rep
+    raw_rate = f_rep * p_signal * basis_sift_factor
+    error_rate = (0.5 * dark_per_gate + e_channel * p_signal) / np.maximum(p_signal + dark_per_gate, 1e-30)
+    qber = np.clip(error_rate, 0, 0.4999)
+    return raw_rate * np.maximum(0, 1 - 2 * binary_entropy(qber))
+
+
+def tf_qkd_rate(distance_km, alpha=0.2, f_rep=10e6, eta_det=0.6, basis_sift_factor=0.5):
+    """Illustrative twin-field rate, scaling with the square root of the transmittance."""
+    eta = transmittance(distance_km, alpha)
+    return np.maximum(0, f_rep * basis_sift_factor * TF_K * np.sqrt(eta) * eta_det)
+
+
+def distance_grid(max_km, step, max_points=MAX_GRID_POINTS):
+    """
+    0, step, 2 step, ... up to max_km, as the pages build their x axis.
+
+    Raises:
+        ValueError: On a non-positive step, negative or non-finite max_km, or
+        more than max_points distances (checked before the grid is built)
+    """
+    if not (np.isfinite(max_km) and np.isfinite(step)) or step <= 0 or max_km < 0:
+        raise ValueError("step must be positive and max_km finite and non-negative")
+    points = np.ceil(max_km / step) + 1
+    if points > max_points:
+        raise ValueError(f"Grid of {points:.0f} distances exceeds {max_points}")
+    return np.round(np.arange(0, max_km + 1e-9, step), 6)
+
+
+# --- Memoized grids ---
+def _round(value):
+    return float(f"{float(value):.{SIG_DIGITS}g}")
+
+
+def _frozen(array):
+    array = np.asarray(array, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _link_grid(distances, mus, protocols, params):
+    d = np.array(distances)
+    qber, key_rate = link_rate(
+        d[None, None, :], np.array(mus)[None, :, None], np.array(protocols)[:, None, None], **dict(params)
+    )
+    return {"qber": _frozen(qber), "key_rate": _frozen(key_rate)}
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _repeater_grid(distances, repeaters, params):
+    d = np.array(distances)
+    kwargs = dict(params)
+    return {
+        "key_rate": _frozen(repeater_rate(d[None, :], np.array(repeaters)[:, None], **kwargs)),
+        "twin_field": _frozen(tf_qkd_rate(d, kwargs["alpha"], kwargs["f_rep"], kwargs["eta_det"],
+                                          kwargs["basis_sift_factor"])),
+    }
+
+
+def _params(defaults, overrides):
+    unknown = set(overrides) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameter(s): {sorted(unknown)}")
+    merged = {**defaults, **overrides}
+    return tuple(sorted((name, _round(value)) for name, value in merged.items()))
+
+
+def evaluate(model, distances, mus=(0.5,), protocols=("bb84",), repeaters=(0,), **params):
+    """
+    Evaluate a model on a whole grid, memoized on the rounded parameters.
+
+    Args:
+        model (str): "link" (KeyrateVsDistance page) or "repeater" (keyrate page)
+        distances: Distances in km
+        mus, protocols: Grid axes of the link model
+        repeaters: Repeater counts of the repeater model
+        **params: Physical parameters overriding LINK_DEFAULTS / REPEATER_DEFAULTS
+
+    Returns:
+        dict: Read-only arrays. link: qber and key_rate of shape
+        (protocols, mus, distances). repeater: key_rate of shape
+        (repeaters, distances) and twin_field of shape (distances,)
+
+    Raises:
+        ValueError: On an unknown model, protocol or parameter, or a grid over MAX_GRID_POINTS
+    """
+    distances = tuple(_round(d) for d in np.atleast_1d(distances))
+    if model == "link":
+        mus = tuple(_round(m) for m in np.atleast_1d(mus))
+        protocols = tuple(str(p) for p in np.atleast_1d(protocols))
+        size, compute = len(distances) * len(mus) * len(protocols), _link_grid
+        key = (distances, mus, protocols, _params(LINK_DEFAULTS, params))
+    elif model == "repeater":
+        repeaters = tuple(int(r) for r in np.atleast_1d(repeaters))
+        if any(r < 0 for r in repeaters):
+            raise ValueError("Repeater counts must be non-negative")
+        size, compute = len(distances) * len(repeaters), _repeater_grid
+        key = (distances, repeaters, _params(REPEATER_DEFAULTS, params))
+    else:
+        raise ValueError(f"Unknown key rate model: {model}")
+    if size > MAX_GRID_POINTS:
+        raise ValueError(f"Grid of {size} points exceeds {MAX_GRID_POINTS}")
+    return compute(*key)
+
+
+def cache_stats():
+    """Hit/miss counters of the grid caches."""
+    stats = {}
+    for name, cached in (("link", _link_grid), ("repeater", _repeater_grid)):
+        info = cached.cache_info()
+        total = info.hits + info.misses
+        stats[name] = {"hits": info.hits, "misses": info.misses, "hit_rate": info.hits / total if total else 0.0,
+                       "size": info.currsize, "maxsize": info.maxsize}
+    return stats
@@ -0,0 +1,219 @@
+# qkd_backend/qkd_runner/batching.py
+"""
+Chunked qubit batching for BB84 circuits.
+
+BB84 qubits never interact, so a long key can be split into fixed-width
+sub-circuits that are submitted together as one multi-PUB sampler job and
+stitched back in order. Simulator memory then grows with the key length
+instead of exponentially with the circuit width.
+"""
+
+from collections import Counter
+
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit.circuit import ParameterVector
+
+from qkd_backend.backend_config import get_aer_simulator, get_backend_service, get_sampler
+from qkd_backend.diagrams import register_circuit
+from qkd_backend.transpile_cache import transpile
+
+# Widest sub-circuit handed to the sampler. 20 qubits keeps the ideal
+# statevector simulator well under a few hundred MB per chunk.
+DEFAULT_CHUNK_WIDTH = 20
+# Noisy simulation samples every shot as its own trajectory over 2**width
+# amplitudes, so the noisy backend uses much narrower chunks.
+NOISY_CHUNK_WIDTH = 4
+
+
+def chunk_slices(n, width=DEFAULT_CHUNK_WIDTH):
+    """Split range(n) into consecutive (start, stop) slices of at most `width` qubits."""
+    if width < 1:
+        raise ValueError("chunk width must be at least 1")
+    return [(start, min(start + width, n)) for start in range(0, n, width)]
+
+
+def backend_chunk_width(backend_type, width=DEFAULT_CHUNK_WIDTH):
+    """Chunk width to use on a backend type: at most NOISY_CHUNK_WIDTH for "noisy"."""
+    return min(width, NOISY_CHUNK_WIDTH) if backend_type == "noisy" else width
+
+
+def build_chunks(n, build_fn, width=DEFAULT_CHUNK_WIDTH):
+    """
+    Build one sub-circuit per slice.
+
+    Args:
+        n (int): Total number of qubits (key bits)
+        build_fn (callable): build_fn(start, stop) -> QuantumCircuit of width stop - start,
+            with its classical register named "c"
+        width (int): Maximum sub-circuit width
+
+    Returns:
+        list[QuantumCircuit]: Sub-circuits in key order
+    """
+    return [build_fn(start, stop) for start, stop in chunk_slices(n, width)]
+
+
+def bb84_circuit(bits, bases, meas_bases, barrier=False):
+    """
+    Prepare `bits` in `bases` and measure them in `meas_bases`.
+
+    Basis 0 is Z, basis 1 is X. Used for Alice -> Bob as well as for the
+    Alice -> Eve and Eve -> Bob legs of the intercept-resend attack.
+    """
+    width = len(bits)
+    qc = QuantumCircuit(width, width)
+    for n in range(width):
+        if bits[n] == 1:
+            qc.x(n)
+        if bases[n] == 1:
+            qc.h(n)
+    if barrier:
+        qc.barrier()
+    for m in range(width):
+        if meas_bases[m] == 1:
+            qc.h(m)
+        qc.measure(m, m)
+    return qc
+
+
+def bb84_template(width):
+    """
+    Parameterized prepare-and-measure circuit with a fixed structure.
+
+    theta[i] = pi * bit flips the qubit, phi[i] = pi/2 * basis rotates it into
+    the X basis and psi[i] = -pi/2 * basis rotates it back for measurement.
+    Up to global phase this reproduces bb84_circuit for every bit/basis
+    choice, so one transpiled template serves every session of that width.
+    """
+    theta = ParameterVector("theta", width)
+    phi = ParameterVector("phi", width)
+    psi = ParameterVector("psi", width)
+    qc = QuantumCircuit(width, width)
+    for n in range(width):
+        qc.rx(theta[n], n)
+        qc.ry(phi[n], n)
+    for m in range(width):
+        qc.ry(psi[m], m)
+        qc.measure(m, m)
+    return qc
+
+
+def bb84_parameter_values(circuit, bits, bases, meas_bases):
+    """Parameter values for a (transpiled) bb84_template, in circuit.parameters order."""
+    values = {
+        "theta": np.pi * np.asarray(bits, dtype=float),
+        "phi": np.pi / 2 * np.asarray(bases, dtype=float),
+        "psi": -np.pi / 2 * np.asarray(meas_bases, dtype=float),
+    }
+    return np.array([values[p.vector.name][p.index] for p in circuit.parameters])
+
+
+def bb84_template_pubs(backend, bits, bases, meas_bases, width=DEFAULT_CHUNK_WIDTH):
+    """
+    Sampler PUBs for a chunked prepare-and-measure run on a hardware backend.
+
+    Templates are transpiled through the transpile cache, so after the first
+    session of a given chunk width no transpilation happens at all.
+    """
+    slices = chunk_slices(len(bits), width)
+    templates = transpile(backend, [bb84_template(stop - start) for start, stop in slices])
+    return [
+        (qc_isa, bb84_parameter_values(qc_isa, bits[start:stop], bases[start:stop], meas_bases[start:stop]))
+        for qc_isa, (start, stop) in zip(templates, slices)
+    ]
+
+
+def pub_circuit(pub):
+    """Circuit of a PUB, which is either a circuit or a (circuit, parameter_values) tuple."""
+    return pub[0] if isinstance(pub, tuple) else pub
+
+
+def _bit_array(pub_result):
+    """Return the BitArray of the "c" register (or the only register)."""
+    data = pub_result.data
+    if hasattr(data, 'c'):
+        return data.c
+    return next(iter(data.values()))
+
+
+def stitch_results(result):
+    """
+    Stitch the per-chunk results of one multi-PUB job back into key order.
+
+    Returns:
+        np.ndarray: uint8 array of shape (shots, n), column i is qubit i
+    """
+    columns = []
+    for pub_result in result:
+        bit_array = _bit_array(pub_result)
+        # BitArray packs each shot big-endian, highest clbit first
+        unpacked = np.unpackbits(bit_array.array, axis=-1)
+        columns.append(unpacked[:, -bit_array.num_bits:][:, ::-1])
+    return np.concatenate(columns, axis=1)
+
+
+def run_chunks(sampler, pubs, shots):
+    """Submit all sub-circuits (or template PUBs) as one sampler job and return the stitched (shots, n) bits."""
+    job = sampler.run(list(pubs), shots=shots)
+    return stitch_results(job.result())
+
+
+def counts_from_matrix(bits):
+    """
+    Rebuild a sampler-style counts dict from stitched per-shot bits.
+
+    Keys are little-endian bitstrings (qubit 0 rightmost) in first-seen order,
+    matching BitArray.get_counts().
+    """
+    chars = (bits[:, ::-1] + ord('0')).astype(np.uint8)
+    return dict(Counter(row.tobytes().decode('ascii') for row in chars))
+
+
+# --- One BB84 round on a backend ---
+def run_bb84_circuit(bit_num, shots, rng, backend_type, chunk_width=DEFAULT_CHUNK_WIDTH, draw_diagram=True,
+                     seed=None, barrier=False):
+    """
+    Draw a BB84 round and run its chunked circuits on the selected backend as one job.
+
+    The local backend runs the circuits as built; other backends run the
+    cached transpiled template. seed fixes the simulator.
+
+    Returns:
+        tuple: (abits, abase, bbase, bbits of shot 0 as a list, counts,
+        (shots, bit_num) shot bits, diagram URL of the first chunk or None)
+    """
+    chunk_width = backend_chunk_width(backend_type, chunk_width)
+    # QKD step 1: Random bits and bases for Sender
+    abits = np.round(rng.random(bit_num))
+    abase = np.round(rng.random(bit_num))
+
+    # QKD step 2: Random bases for Receiver
+    bbase = np.round(rng.random(bit_num))
+
+    # Map problem to quantum circuits, chunk_width qubits per sub-circuit
+    circuits = build_chunks(
+        bit_num,
+        lambda start, stop: bb84_circuit(abits[start:stop], abase[start:stop], bbase[start:stop], barrier=barrier),
+        chunk_width,
+    )
+
+    # Backend & sampler selection
+    if backend_type == "local":
+        qc_isa = circuits
+        sampler = get_sampler(get_aer_simulator(), seed)
+    else:
+        backend = get_backend_service(backend_type)
+        # Cached parameterized template: transpiled once per backend and chunk width
+        qc_isa = bb84_template_pubs(backend, abits, abase, bbase, chunk_width)
+        sampler = get_sampler(backend, seed)
+
+    # Diagram of the first chunk is drawn lazily on first GET of its URL
+    diagram_url = register_circuit(pub_circuit(qc_isa[0])) if draw_diagram else None
+
+    # Run all chunks as one job
+    shot_bits = run_chunks(sampler, qc_isa, shots)
+    counts = counts_from_matrix(shot_bits)
+    bbits = shot_bits[0].tolist()
+
+    return abits, abase, bbase, bbits, counts, shot_bits, diagram_url
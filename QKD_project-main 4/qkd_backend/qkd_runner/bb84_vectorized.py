@@ -0,0 +1,97 @@
+# qkd_backend/qkd_runner/bb84_vectorized.py
+"""
+Circuit-free BB84 engine for the ideal (noise-free) local backend.
+
+Every qubit in a BB84 round is independent, so an ideal simulation reduces
+to array operations: Bob reads Alice's bit when the bases agree and a fair
+coin otherwise. No QuantumCircuit is built and no simulator is started.
+"""
+
+import numpy as np
+
+
+def prepare_and_measure(bit_num, rng):
+    """
+    Draw one BB84 round as arrays.
+
+    Args:
+        bit_num (int): Number of qubits Alice sends
+        rng (np.random.Generator): Random source for bits, bases and outcomes
+
+    Returns:
+        tuple: (abits, abase, bbase, bbits) as uint8 arrays of length bit_num
+    """
+    abits = rng.integers(0, 2, bit_num, dtype=np.uint8)
+    abase = rng.integers(0, 2, bit_num, dtype=np.uint8)
+    bbase = rng.integers(0, 2, bit_num, dtype=np.uint8)
+    bbits = measure(abits, abase, bbase, rng)
+    return abits, abase, bbase, bbits
+
+
+def measure(bits, prep_bases, meas_bases, rng):
+    """Ideal measurement: keep the bit on a basis match, random bit otherwise."""
+    coins = rng.integers(0, 2, np.shape(bits), dtype=np.uint8)
+    return np.where(prep_bases == meas_bases, bits, coins).astype(np.uint8)
+
+
+def sift(abits, abase, bbase, bbits):
+    """
+    Keep the positions where Alice and Bob used the same basis.
+
+    Returns:
+        tuple: (agoodbits, bgoodbits, match_count)
+    """
+    mask = np.asarray(abase) == np.asarray(bbase)
+    agoodbits = np.asarray(abits, dtype=np.uint8)[mask]
+    bgoodbits = np.asarray(bbits, dtype=np.uint8)[mask]
+    match_count = int(np.count_nonzero(agoodbits == bgoodbits))
+    return agoodbits, bgoodbits, match_count
+
+
+def counts_from_bits(bbits, shots=1):
+    """Build a sampler-style counts dict (little-endian bitstring) for one outcome."""
+    key = (np.asarray(bbits, dtype=np.uint8)[::-1] + ord('0')).tobytes().decode('ascii')
+    return {key: shots}
+
+
+def measure_shots(bits, prep_bases, meas_bases, shots, rng):
+    """Ideal per-shot measurements, shape (shots, len(bits)), for shot harvesting."""
+    coins = rng.integers(0, 2, (shots, len(bits)), dtype=np.uint8)
+    return np.where(np.asarray(prep_bases) == np.asarray(meas_bases), np.asarray(bits, dtype=np.uint8), coins).astype(np.uint8)
+
+
+def harvest_rounds(abits, abase, bbase, shot_bits, key_shot=None):
+    """
+    Sift every shot as a BB84 round, all at once.
+
+    The shots repeat the same bit and basis choices, so they are not
+    independent rounds: their error rate estimates the circuit's expected
+    QBER (see parameter_estimation.estimation_policy).
+
+    Args:
+        abits, abase, bbase: Alice's bits/bases and Bob's bases, length n
+        shot_bits (np.ndarray): Bob's per-shot outcomes, shape (shots, n)
+        key_shot (int | None): Shot whose bits become the key; it is left
+            out, so the disclosed rounds never include the key
+
+    Returns:
+        tuple: (agoodbits, bgoodbits, stats) where the key arrays are the
+        flattened sifted bits of every shot and stats holds the QBER over all of them
+    """
+    shot_bits = np.asarray(shot_bits, dtype=np.uint8)
+    if key_shot is not None:
+        shot_bits = np.delete(shot_bits, key_shot, axis=0)
+    shots, n = shot_bits.shape
+    mask = np.asarray(abase) == np.asarray(bbase)
+    bgoodbits = shot_bits[:, mask].ravel()
+    agoodbits = np.tile(np.asarray(abits, dtype=np.uint8)[mask], shots)
+    errors = int(np.count_nonzero(agoodbits != bgoodbits))
+    sifted = int(bgoodbits.size)
+    stats = {
+        "shots": int(shots),
+        "raw_bits": int(shots * n),
+        "sifted_bits": sifted,
+        "errors": errors,
+        "qber": errors / sifted if sifted else 0,
+    }
+    return agoodbits, bgoodbits, stats
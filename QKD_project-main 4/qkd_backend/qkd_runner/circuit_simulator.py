@@ -1,41 +1,39 @@
 # qkd_backend/qkd_runner/circuit_simulator.py
-import random
 import numpy as np
-from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
+from qkd_backend.backend_config import get_aer_simulator, get_sampler, sampler_seed
+from qkd_backend.qkd_runner.batching import (
+    DEFAULT_CHUNK_WIDTH, bb84_circuit, build_chunks, run_chunks, counts_from_matrix
+)
 
 def text_to_bits(text):
     return [int(b) for c in text for b in bin(ord(c))[2:].zfill(8)]
 
-def random_bases(n):
-    return [random.choice(['+', 'x']) for _ in range(n)]
+def random_bases(n, rng):
+    return [['+', 'x'][b] for b in rng.integers(0, 2, n)]
 
-def run_circuit_simulator(message, shots=1024):
+def run_circuit_simulator(message, shots=1024, chunk_width=DEFAULT_CHUNK_WIDTH, rng_seed=None):
+    rng = np.random.default_rng(rng_seed)
     bits = text_to_bits(message)
     n = len(bits)
-    Sender_bases = random_bases(n)
-    Receiver_bases = random_bases(n)
+    Sender_bases = random_bases(n, rng)
+    Receiver_bases = random_bases(n, rng)
 
-    qc = QuantumCircuit(n, n)
-    for i in range(n):
-        if bits[i] == 1:
-            qc.x(i)
-        if Sender_bases[i] == 'x':
-            qc.h(i)
-    for i in range(n):
-        if Receiver_bases[i] == 'x':
-            qc.h(i)
-        qc.measure(i, i)
+    sender_bases = [1 if b == 'x' else 0 for b in Sender_bases]
+    receiver_bases = [1 if b == 'x' else 0 for b in Receiver_bases]
+    circuits = build_chunks(
+        n,
+        lambda start, stop: bb84_circuit(bits[start:stop], sender_bases[start:stop], receiver_bases[start:stop]),
+        chunk_width,
+    )
 
     try:
-        qasm_str = qc.qasm()
+        qasm_str = circuits[0].qasm() if len(circuits) == 1 else ""
     except Exception:
         qasm_str = ""
 
-    sim = AerSimulator()
-    job = sim.run(qc, shots=shots)
-    result = job.result()
-    counts = result.get_counts()
+    # All chunks go to the simulator as one multi-PUB job
+    sampler = get_sampler(get_aer_simulator(), sampler_seed(rng_seed))
+    counts = counts_from_matrix(run_chunks(sampler, circuits, shots))
     counts_int = {str(k): int(v) for k, v in counts.items()}
 
     matched_positions = [i for i in range(n) if Sender_bases[i] == Receiver_bases[i]]
@@ -4,129 +4,99 @@ BB84 (no Eve) with selectable backend.
 
 Backends:
 - local: AerSimulator + BackendSamplerV2
+- noisy: AerSimulator with FakeBrisbane noise and coupling map (cached, with transpilation)
 - ibm: IBM Runtime backend + SamplerV2 (with transpilation)
 """
 
 import numpy as np
-from qiskit import QuantumCircuit
-from qiskit_ibm_runtime import SamplerV2 as Sampler
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-from qiskit.visualization import circuit_drawer
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import hashlib
-import os
-from qiskit_aer import AerSimulator
-from qiskit.primitives import BackendSamplerV2
-from qkd_backend.backend_config import get_backend_service
+from qkd_backend.backend_config import sampler_seed
+from qkd_backend.cipher import as_bit_array, xor_bytes
+from qkd_backend.qkd_runner.bb84_vectorized import (
+    prepare_and_measure, counts_from_bits, measure_shots, harvest_rounds
+)
+from qkd_backend.qkd_runner.batching import DEFAULT_CHUNK_WIDTH, counts_from_matrix, run_bb84_circuit
+from qkd_backend.qkd_runner.parameter_estimation import abort_reason, estimation_policy
+from qkd_backend.qkd_runner.pipeline import distill
 
 
 def xor_encrypt_decrypt(message_bytes, key_bits):
-    # Repeat key_bits to match the length of message_bytes
-    key = (key_bits * ((len(message_bytes) // len(key_bits)) + 1))[:len(message_bytes)]
-    key_bytes = bytes([int(b) for b in key])
-    return bytes([mb ^ kb for mb, kb in zip(message_bytes, key_bytes)])
-
-
-def run_exp1(message=None, backend_type="local", error_mitigation=False, bit_num=20, shots=1024, rng_seed=None):
-    # Map problem to quantum circuit
+    # Each message byte is XORed with one key bit (value 0/1), key repeated
+    return xor_bytes(message_bytes, as_bit_array(key_bits))
+
+
+def run_exp1(message=None, backend_type="local", error_mitigation=False, bit_num=20, shots=1024, rng_seed=None, engine="circuit", chunk_width=DEFAULT_CHUNK_WIDTH, harvest_shots=False, draw_diagram=True, reconciliation="cascade"):
+    """
+    Run BB84 without Eve.
+
+    engine="numpy" swaps the circuit for the vectorized engine on the ideal
+    local backend; it is ignored for the IBM backend. Circuit runs are split
+    into sub-circuits of at most chunk_width qubits. harvest_shots=True treats
+    every shot but the key shot as its own BB84 round and estimates QBER over them.
+    draw_diagram=False skips the circuit diagram entirely.
+    reconciliation picks the error-correction engine ("cascade" or "ldpc").
+    """
+    return run_bb84(message, xor_encrypt_decrypt, backend_type=backend_type, bit_num=bit_num, shots=shots,
+                    rng_seed=rng_seed, engine=engine, chunk_width=chunk_width, harvest_shots=harvest_shots,
+                    draw_diagram=draw_diagram, reconciliation=reconciliation, barrier=True)
+
+
+def run_bb84(message, cipher, backend_type="local", bit_num=20, shots=1024, rng_seed=None, engine="circuit", chunk_width=DEFAULT_CHUNK_WIDTH, harvest_shots=False, draw_diagram=True, reconciliation="cascade", barrier=False):
+    """
+    One BB84 session without Eve, shared by exp1 and exp2.
+
+    Args:
+        message (str | None): Demo message; None uses "QKD demo"
+        cipher: fn(message bytes, key bits) -> bytes, used to encrypt with
+            Alice's sifted key and decrypt with Bob's
+        barrier (bool): Draw a barrier between preparation and measurement
+        Other arguments as run_exp1
+
+    Returns:
+        dict: The experiment result for the UI
+    """
     rng = np.random.default_rng(rng_seed)
-    qc = QuantumCircuit(bit_num, bit_num)
-
-    # QKD step 1: Random bits and bases for Sender
-    abits = np.round(rng.random(bit_num))
-    abase = np.round(rng.random(bit_num))
-
-    for n in range(bit_num):
-        if abits[n] == 0:
-            if abase[n] == 1:
-                qc.h(n)
-        if abits[n] == 1:
-            if abase[n] == 0:
-                qc.x(n)
-            if abase[n] == 1:
-                qc.x(n)
-                qc.h(n)
-
-    qc.barrier()
-
-    # QKD step 2: Random bases for Receiver
-    bbase = np.round(rng.random(bit_num))
-
-    for m in range(bit_num):
-        if bbase[m] == 1:
-            qc.h(m)
-        qc.measure(m, m)
-
-    # Backend & sampler selection
-    if backend_type == "local":
-        aer_backend = AerSimulator()
-        qc_isa = qc
-        sampler = BackendSamplerV2(backend=aer_backend)
+
+    if backend_type == "local" and engine == "numpy":
+        # Ideal, noise-free BB84 as array operations (no circuit, no simulator)
+        abits, abase, bbase, bbits_arr = prepare_and_measure(bit_num, rng)
+        shot_bits = bbits_arr[np.newaxis, :]
+        if harvest_shots:
+            shot_bits = np.vstack([shot_bits, measure_shots(abits, abase, bbase, shots - 1, rng)])
+        counts = counts_from_matrix(shot_bits) if harvest_shots else counts_from_bits(bbits_arr, shots)
+        bbits = bbits_arr.tolist()
+        diagram_url = None
     else:
-        backend = get_backend_service("ibm")
-        target = backend.target
-        pm = generate_preset_pass_manager(target=target, optimization_level=3)
-        qc_isa = pm.run(qc)
-        sampler = Sampler(mode=backend)
-
-    # Draw circuit
-    os.makedirs("static", exist_ok=True)
-    diagram_path = "static/circuit_exp1.png"
-    fig = circuit_drawer(qc_isa, output='mpl')
-    fig.savefig(diagram_path)
-    plt.close(fig)
-
-    # Run
-    job = sampler.run([qc_isa], shots=shots)
-
-    counts = job.result()[0].data.c.get_counts()
-    countsint = job.result()[0].data.c.get_int_counts()
-
-    keys = counts.keys()
-    key = list(keys)[0]
-    bmeas = list(key)
-    bmeas_ints = []
-    for n in range(bit_num):
-        bmeas_ints.append(int(bmeas[n]))
-    bbits = bmeas_ints[::-1]
-
-    print(bbits)
-
-    # QKD step 3: Public discussion of bases
-    agoodbits = []
-    bgoodbits = []
-    match_count = 0
-    for n in range(bit_num):
-        if abase[n] == bbase[n]:
-            agoodbits.append(int(abits[n]))
-            bgoodbits.append(bbits[n])
-            if int(abits[n]) == bbits[n]:
-                match_count += 1
-    # --- Error Correction (Simple Parity) ---
-    block_size = 4
-    corrected_bbits = []
-
-    for i in range(0, len(agoodbits), block_size):
-        a_block = agoodbits[i:i+block_size]
-        b_block = bgoodbits[i:i+block_size]
-        a_parity = sum(a_block) % 2
-        b_parity = sum(b_block) % 2
-        if a_parity != b_parity and len(b_block) > 0:
-            b_block[-1] ^= 1
-        corrected_bbits.extend(b_block)
+        abits, abase, bbase, bbits, counts, shot_bits, diagram_url = run_bb84_circuit(
+            bit_num, shots, rng, backend_type, chunk_width, draw_diagram, sampler_seed(rng_seed), barrier
+        )
+
+    harvest = None
+    harvest_alice = harvest_bob = None
+    if harvest_shots:
+        # Every other shot is a BB84 round disclosed for estimation; shot 0 is the key
+        harvest_alice, harvest_bob, harvest = harvest_rounds(abits, abase, bbase, shot_bits, key_shot=0)
+    estimation_kwargs, harvest_estimation = estimation_policy(harvest_alice, harvest_bob)
+
+    # --- Sifting, sampled QBER estimation, error correction (Cascade / LDPC) and privacy amplification ---
+    distilled = distill(abits, abase, bbase, bbits, rng=rng, method=reconciliation, **estimation_kwargs)
+    agoodbits = distilled["alice"].tolist()
+    bgoodbits = distilled["bob"].tolist()
+    fidelity = distilled["match_count"] / len(agoodbits) if agoodbits else 0
+    if harvest is not None:
+        fidelity = 1 - harvest["qber"] if harvest["sifted_bits"] else 0
+    loss = 1 - fidelity if agoodbits else 1
+    corrected_bbits = distilled["corrected"].tolist()
 
     print(agoodbits)
     print(bgoodbits)
-    print("fidelity = ", match_count / len(agoodbits))
-    print("loss = ", 1 - match_count / len(agoodbits))
+    print("fidelity = ", fidelity)
+    print("loss = ", loss)
     error_corrected_key = ''.join(map(str, corrected_bbits))
     print("Key after Error Correction:", error_corrected_key)
 
-    # --- Privacy Amplification ---
-    secret_key = hashlib.sha256(error_corrected_key.encode()).hexdigest()
-    secret_key = secret_key[:64]  # shorten for demonstration
+    # Privacy-amplified key; whole bytes only, so the hex key never carries padding bits
+    final_key = distilled["key"]
+    secret_key = np.packbits(final_key[:final_key.size // 8 * 8]).tobytes().hex()
 
     print("Final Secret Key:", secret_key)
 
@@ -136,9 +106,9 @@ def run_exp1(message=None, backend_type="local", error_mitigation=False, bit_num
     message_bytes = message.encode('utf-8')
     if agoodbits and len(agoodbits) >= 8:
         # Encrypt
-        encrypted_bytes = xor_encrypt_decrypt(message_bytes, agoodbits)
+        encrypted_bytes = cipher(message_bytes, agoodbits)
         # Decrypt using Bob's key
-        decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, bgoodbits)
+        decrypted_bytes = cipher(encrypted_bytes, bgoodbits)
         try:
             decrypted_message = decrypted_bytes.decode('utf-8')
         except Exception:
@@ -149,23 +119,30 @@ def run_exp1(message=None, backend_type="local", error_mitigation=False, bit_num
         decrypted_message = ""
 
     # Return results for UI
-    return {
-        "Sender_bits": abits.tolist(),
-        "Sender_bases": abase.tolist(),
-        "Receiver_bases": bbase.tolist(),
+    result = {
+        "Sender_bits": abits.astype(int).tolist(),
+        "Sender_bases": abase.astype(int).tolist(),
+        "Receiver_bases": bbase.astype(int).tolist(),
         "Receiver_bits": bbits,
         "agoodbits": agoodbits,
         "bgoodbits": bgoodbits,
-        "fidelity": match_count / len(agoodbits) if agoodbits else 0,
-        "loss": 1 - (match_count / len(agoodbits)) if agoodbits else 1,
+        "fidelity": fidelity,
+        "loss": loss,
         "error_corrected_key": error_corrected_key,
         "final_secret_key": secret_key,
         "original_message": message,
         "encrypted_message_hex": encrypted_hex,
         "decrypted_message": decrypted_message,
-        "circuit_diagram_url": "/static/circuit_exp1.png",
+        "circuit_diagram_url": diagram_url,
         "counts": counts
     }
+    result["abort_reason"] = abort_reason(distilled)
+    result["parameter_estimation"] = distilled.get("estimation", harvest_estimation)
+    result["reconciliation"] = distilled.get("reconciliation")
+    result["privacy_amplification"] = distilled.get("privacy_amplification")
+    if harvest is not None:
+        result["harvest"] = harvest
+    return result
 def encrypt_with_existing_key(exp_result, message):
     agoodbits = exp_result["agoodbits"]
     bgoodbits = exp_result["bgoodbits"]
@@ -2,32 +2,20 @@
 # BB84 with Eve intercept-resend, executed on IBM Quantum backend using SamplerV2.
 
 import numpy as np
-from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
-from qiskit_ibm_runtime import QiskitRuntimeService, SamplerV2 as Sampler
-from qiskit_aer import AerSimulator
-from qiskit_aer.noise import NoiseModel
-from qiskit.primitives import BackendSamplerV2
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from backend_config import get_backend_service
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-import os
-from qiskit.visualization import circuit_drawer
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
-
-"""
-exp3: BB84 with Eve intercept-resend
-
-Changes:
-- Avoid initializing IBM Runtime at import time.
-- Respect backend_type ("local" | "ibm").
-- Use AerSimulator + BackendSamplerV2 for local fast runs.
-- Safely extract a single bitstring from counts (sampling when shots>1).
-"""
+from qkd_backend.backend_config import get_backend_service, get_aer_simulator, batch_sampler, sampler_seed
+from qkd_backend.diagrams import register_circuit
+from qkd_backend.qkd_runner.bb84_vectorized import counts_from_bits, harvest_rounds, measure_shots
+from qkd_backend.qkd_runner.intercept_resend import intercept, intercept_mask, resend
+from qkd_backend.qkd_runner.parameter_estimation import abort_reason, estimation_policy
+from qkd_backend.qkd_runner.pipeline import distill
+from qkd_backend.qkd_runner.batching import (
+    DEFAULT_CHUNK_WIDTH, backend_chunk_width, bb84_circuit, build_chunks, run_chunks, counts_from_matrix,
+    bb84_template_pubs, pub_circuit,
+)
+
+# Sessions one run_exp3_batch call may run; all of them share two sampler jobs
+MAX_BATCH_SESSIONS = 64
+
 
 def _extract_bitstring_from_counts(counts, rng, shots):
     """Extract a random bitstring sample from counts dict."""
@@ -38,148 +26,187 @@ def _extract_bitstring_from_counts(counts, rng, shots):
     choice = rng.choice(len(outcomes), p=probs)
     return outcomes[choice]
 
-def run_exp3(message=None, bit_num=20, shots=1024, rng_seed=None, backend_type="local"):
-    rng = np.random.default_rng(rng_seed)
-
-    # Step 1: Sender's random bits and bases
-    abits = np.round(rng.random(bit_num)).astype(int)
-    abase = np.round(rng.random(bit_num)).astype(int)
-
+def _stage_pubs(backend, backend_type, bits, bases, meas_bases, chunk_width):
+    """Chunked PUBs of every session in a (sessions, bit_num) batch, session after session."""
+    sessions, bit_num = bits.shape
+    chunk_width = backend_chunk_width(backend_type, chunk_width)
+    pubs = []
+    for s in range(sessions):
+        if backend_type == "local":
+            pubs.extend(build_chunks(
+                bit_num,
+                lambda start, stop: bb84_circuit(bits[s, start:stop], bases[s, start:stop], meas_bases[s, start:stop]),
+                chunk_width,
+            ))
+        else:
+            pubs.extend(bb84_template_pubs(backend, bits[s], bases[s], meas_bases[s], chunk_width))
+    return pubs
+
+
+def _run_circuits(abits, abase, bit_num, shots, rng, backend_type, chunk_width, intercept_fraction, seed=None):
+    """Run Eve's measurement circuit, then the resent circuit Bob measures; seed fixes the simulator."""
     # Step 2: Eve's random measurement bases
     ebase = np.round(rng.random(bit_num)).astype(int)
 
     # Step 3: Receiver's random measurement bases
     bbase = np.round(rng.random(bit_num)).astype(int)
 
-    # --- Sender prepares and sends qubits ---
-    qr = QuantumRegister(bit_num, "q")
-    cr = ClassicalRegister(bit_num, "c")
-    qc = QuantumCircuit(qr, cr)
-    for n in range(bit_num):
-        if abits[n] == 0:
-            if abase[n] == 1:
-                qc.h(n)
-        if abits[n] == 1:
-            if abase[n] == 0:
-                qc.x(n)
-            if abase[n] == 1:
-                qc.x(n)
-                qc.h(n)
-
-    # --- Eve intercepts and measures ---
-    for m in range(bit_num):
-        if ebase[m] == 1:
-            qc.h(m)
-        qc.measure(qr[m], cr[m])
-
-    # Backend & Sampler selection
-    if backend_type == "local":
-        # Fast local path: AerSimulator without heavy transpilation
-        aer_backend = AerSimulator()
-        qc_isa = qc
-        sampler = BackendSamplerV2(backend=aer_backend)
-    else:
-        # IBM runtime backend
-        backend = get_backend_service("ibm")
-        target = backend.target
-        pm = generate_preset_pass_manager(target=target, optimization_level=3)
-        qc_isa = pm.run(qc)
-        # SamplerV2 alias imported as Sampler
-        sampler = Sampler(mode=backend)
-
-    # Eve’s measurement
-    job = sampler.run([qc_isa], shots=shots)
-    res = job.result()
-    try:
-        counts = res[0].data.c.get_counts()
-    except Exception:
-        counts = res[0].data.get_counts()
-    key = _extract_bitstring_from_counts(counts, rng, shots)
-    emeas = list(key)
-    ebits = [int(x) for x in emeas][::-1]
-
-    # --- Eve resends to Receiver ---
-    qr2 = QuantumRegister(bit_num, "q")
-    cr2 = ClassicalRegister(bit_num, "c")
-    qc2 = QuantumCircuit(qr2, cr2)
-    for n in range(bit_num):
-        if ebits[n] == 0:
-            if ebase[n] == 1:
-                qc2.h(n)
-        if ebits[n] == 1:
-            if ebase[n] == 0:
-                qc2.x(n)
-            if ebase[n] == 1:
-                qc2.x(n)
-                qc2.h(n)
-
-    # Receiver's measurement
-    for m in range(bit_num):
-        if bbase[m] == 1:
-            qc2.h(m)
-        qc2.measure(qr2[m], cr2[m])
-
-    if backend_type == "local":
-        qc2_isa = qc2
-    else:
-        qc2_isa = pm.run(qc2)
-
-    job2 = sampler.run([qc2_isa], shots=shots)
-    res2 = job2.result()
-    try:
-        counts2 = res2[0].data.c.get_counts()
-    except Exception:
-        counts2 = res2[0].data.get_counts()
-    key2 = _extract_bitstring_from_counts(counts2, rng, shots)
-    bmeas = list(key2)
-    bbits = [int(x) for x in bmeas][::-1]
-
-    # Save circuit diagram
-    diagram_path = "static/circuit_exp3.png"
-    try:
-        fig = circuit_drawer(qc2_isa, output='mpl')
-        fig.savefig(diagram_path)
-        plt.close(fig)
-    except Exception:
-        # Don't fail if drawing isn't supported in the environment
-        diagram_path = None
-
-    # Sifting: keep only positions where Sender & Receiver used same basis
-    agoodbits = []
-    bgoodbits = []
-    match_count = 0
-    for i in range(bit_num):
-        if abase[i] == bbase[i]:
-            agoodbits.append(int(abits[i]))
-            bgoodbits.append(int(bbits[i]))
-            if int(abits[i]) == int(bbits[i]):
-                match_count += 1
-
-    # After sifting and before returning the result:
-    fidelity = match_count / len(agoodbits) if agoodbits else 0
+    # Backend selection: shared AerSimulator without heavy transpilation, or
+    # noisy / IBM, where both stages share one cached parameterized template per chunk width
+    backend = get_aer_simulator() if backend_type == "local" else get_backend_service(backend_type)
+
+    def stage_pubs(bits, bases, meas_bases):
+        return _stage_pubs(backend, backend_type, np.atleast_2d(bits), np.atleast_2d(bases),
+                           np.atleast_2d(meas_bases), chunk_width)
+
+    # Both stages go through one sampler, in batch execution mode on IBM
+    with batch_sampler(backend, seed) as sampler:
+        # --- Sender prepares and sends qubits, Eve intercepts and measures (all chunks in one job) ---
+        counts = counts_from_matrix(run_chunks(sampler, stage_pubs(abits, abase, ebase), shots))
+        key = _extract_bitstring_from_counts(counts, rng, shots)
+        emeas = list(key)
+        ebits = [int(x) for x in emeas][::-1]
+
+        # --- Eve resends to Receiver, Receiver measures ---
+        intercepted = intercept_mask(bit_num, intercept_fraction, rng)
+        rbits, rbase = resend(abits, abase, ebase, ebits, intercepted)
+        qc2_isa = stage_pubs(rbits, rbase, bbase)
+        shot_bits2 = run_chunks(sampler, qc2_isa, shots)
+
+    counts2 = counts_from_matrix(shot_bits2)
+    # Bob keeps one random shot as his key
+    key_shot = int(rng.integers(shots))
+    bbits = shot_bits2[key_shot].tolist()
+    return ebase, bbase, ebits, intercepted, counts, counts2, shot_bits2, key_shot, bbits, qc2_isa
+
+
+def run_exp3_batch(sessions=8, bit_num=20, shots=1024, rng_seed=None, backend_type="local", chunk_width=DEFAULT_CHUNK_WIDTH, harvest_shots=False, draw_diagram=False, intercept_fraction=1.0):
+    """
+    Run many intercept-resend sessions with two sampler jobs in total.
+
+    Every session's Eve-stage circuits are submitted as one multi-PUB job;
+    once it returns, every Bob-stage circuit is built from Eve's results and
+    submitted as a second job. On IBM both jobs run in batch execution mode,
+    so N sessions cost two queue round trips instead of 2N.
+
+    Returns:
+        list[dict]: One run_exp3-style result per session
+
+    Raises:
+        ValueError: If sessions is not in [1, MAX_BATCH_SESSIONS]
+    """
+    if not 1 <= sessions <= MAX_BATCH_SESSIONS:
+        raise ValueError(f"sessions must be in [1, {MAX_BATCH_SESSIONS}]")
+    rng = np.random.default_rng(rng_seed)
+    shape = (sessions, bit_num)
+    abits = rng.integers(0, 2, shape)
+    abase = rng.integers(0, 2, shape)
+    ebase = rng.integers(0, 2, shape)
+    bbase = rng.integers(0, 2, shape)
+
+    backend = get_aer_simulator() if backend_type == "local" else get_backend_service(backend_type)
+    with batch_sampler(backend, sampler_seed(rng_seed)) as sampler:
+        # Stitched columns are session-major, so they reshape to (shots, sessions, bit_num)
+        eve_shots = run_chunks(sampler, _stage_pubs(backend, backend_type, abits, abase, ebase, chunk_width),
+                               shots).reshape(shots, sessions, bit_num)
+        # Eve keeps one measured shot per session, as in run_exp3
+        ebits = eve_shots[rng.integers(0, shots, sessions), np.arange(sessions)]
+        intercepted = intercept_mask(shape, intercept_fraction, rng)
+        rbits, rbase = resend(abits, abase, ebase, ebits, intercepted)
+        bob_pubs = _stage_pubs(backend, backend_type, rbits, rbase, bbase, chunk_width)
+        bob_shots = run_chunks(sampler, bob_pubs, shots).reshape(shots, sessions, bit_num)
+
+    pubs_per_session = len(bob_pubs) // sessions
+    results = []
+    for s in range(sessions):
+        shot_bits2 = bob_shots[:, s]
+        key_shot = int(rng.integers(shots))
+        bbits = shot_bits2[key_shot].tolist()
+        diagram_url = register_circuit(pub_circuit(bob_pubs[s * pubs_per_session])) if draw_diagram else None
+        results.append(_session_result(
+            abits[s], abase[s], ebase[s], bbase[s], ebits[s].tolist(), intercepted[s],
+            counts_from_matrix(eve_shots[:, s]), counts_from_matrix(shot_bits2), shot_bits2, key_shot,
+            bbits, diagram_url, rng, harvest_shots,
+        ))
+    return results
+
+
+def _session_result(abits, abase, ebase, bbase, ebits, intercepted, counts, counts2, shot_bits2, key_shot, bbits,
+                    diagram_url, rng, harvest_shots):
+    """Sift, estimate QBER and build the result dict of one session."""
+    harvest = None
+    harvest_alice = harvest_bob = None
+    if harvest_shots:
+        # Every other Bob shot is a BB84 round against Eve's resent qubits, disclosed for estimation
+        harvest_alice, harvest_bob, harvest = harvest_rounds(abits, abase, bbase, shot_bits2, key_shot)
+    estimation_kwargs, harvest_estimation = estimation_policy(harvest_alice, harvest_bob)
+
+    # Sifting, then QBER on a disclosed sample; the rest of the sifted key is kept
+    distilled = distill(abits, abase, bbase, bbits, rng=rng, stages=("estimate",), **estimation_kwargs)
+    agoodbits = distilled["alice"].tolist()
+    bgoodbits = distilled["bob"].tolist()
+
+    fidelity = 1 - distilled["qber"] if agoodbits else 0
     loss = 1 - fidelity if agoodbits else 1
 
-    # Define abort reason first
-    abort_reason = None
-    if loss > 0.15:
-        abort_reason = "Error too high! Key generation aborted."
-
-    return {
+    result = {
         "Sender_bits": abits.tolist(),
         "Sender_bases": abase.tolist(),
         "Receiver_bases": bbase.tolist(),
         "Receiver_bits": bbits,
         "Eve_bases": ebase.tolist(),  # Add Eve's bases
         "Eve_bits": ebits,            # Add Eve's bits
+        "Eve_intercepted": intercepted.tolist(),
         "agoodbits": agoodbits,
         "bgoodbits": bgoodbits,
         "fidelity": fidelity,
         "loss": loss,
-        "circuit_diagram_url": f"/{diagram_path}" if diagram_path else None,
+        "circuit_diagram_url": diagram_url,
         "counts_eve": counts,
         "counts_bob": counts2,
-        "abort_reason": abort_reason
+        "abort_reason": abort_reason(distilled),
+        "parameter_estimation": distilled.get("estimation", harvest_estimation),
     }
+    if harvest is not None:
+        result["harvest"] = harvest
+    return result
+
+def run_exp3(message=None, bit_num=20, shots=1024, rng_seed=None, backend_type="local", chunk_width=DEFAULT_CHUNK_WIDTH, harvest_shots=False, draw_diagram=True, engine="circuit", intercept_fraction=1.0):
+    """
+    Run BB84 with Eve intercepting and resending.
+
+    engine="numpy" computes the attack directly on the ideal local backend
+    (see intercept_resend) instead of running Eve's and Bob's circuits; it
+    is ignored for the IBM backend. intercept_fraction is the share of
+    qubits Eve intercepts; the rest reach Bob as Alice prepared them.
+    """
+    rng = np.random.default_rng(rng_seed)
+
+    # Step 1: Sender's random bits and bases
+    abits = np.round(rng.random(bit_num)).astype(int)
+    abase = np.round(rng.random(bit_num)).astype(int)
+
+    if backend_type == "local" and engine == "numpy":
+        # Step 2-3: Eve's bases and measurement, then Receiver's bases
+        ebase, ebits_arr, intercepted, rbits, rbase = intercept(abits, abase, rng, intercept_fraction)
+        bbase = rng.integers(0, 2, bit_num, dtype=np.uint8)
+        counts = counts_from_bits(ebits_arr, shots)
+        ebits = ebits_arr.tolist()
+        shot_bits2 = measure_shots(rbits, rbase, bbase, shots, rng)
+        counts2 = counts_from_matrix(shot_bits2)
+        key_shot = int(rng.integers(shots))
+        bbits = shot_bits2[key_shot].tolist()
+        qc2_isa = None
+    else:
+        ebase, bbase, ebits, intercepted, counts, counts2, shot_bits2, key_shot, bbits, qc2_isa = _run_circuits(
+            abits, abase, bit_num, shots, rng, backend_type, chunk_width, intercept_fraction, sampler_seed(rng_seed)
+        )
+
+    # Circuit diagram is drawn lazily on first GET of its URL
+    diagram_url = register_circuit(pub_circuit(qc2_isa[0])) if draw_diagram and qc2_isa else None
+
+    return _session_result(abits, abase, ebase, bbase, ebits, intercepted, counts, counts2, shot_bits2, key_shot,
+                           bbits, diagram_url, rng, harvest_shots)
 
 def run(message=None):
     return run_exp3(message)
@@ -1,123 +1,127 @@
-import random
+import numpy as np
 from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
-from qiskit.primitives import BackendSamplerV2
-from qiskit_ibm_runtime import SamplerV2 as Sampler
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-from qkd_backend.backend_config import get_backend_service
-import os
-from qiskit.visualization import circuit_drawer
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
-def xor_encrypt_decrypt(message_bytes, key_bits):
-    msg_bits = []
-    for byte in message_bytes:
-        for i in range(8):
-            msg_bits.append((byte >> (7-i)) & 1)
-    if len(key_bits) < len(msg_bits):
-        key = (key_bits * ((len(msg_bits)//len(key_bits))+1))[:len(msg_bits)]
-    else:
-        key = key_bits[:len(msg_bits)]
-    cipher_bits = [m ^ k for m, k in zip(msg_bits, key)]
-    cipher_bytes = bytearray()
-    for i in range(0, len(cipher_bits), 8):
-        byte = 0
-        for j in range(8):
-            if i+j < len(cipher_bits):
-                byte = (byte << 1) | cipher_bits[i+j]
-            else:
-                byte = (byte << 1)
-        cipher_bytes.append(byte)
-    return bytes(cipher_bytes)
-
-def run_exp4(message=None, n=20, shots=1024, backend_type="local"):
+from qkd_backend.backend_config import get_backend_service, get_aer_simulator, get_sampler, sampler_seed
+from qkd_backend.cipher import xor_bits as xor_encrypt_decrypt
+from qkd_backend.diagrams import register_circuit
+from qkd_backend.transpile_cache import transpile
+from qkd_backend.qkd_runner.bb84_vectorized import harvest_rounds
+from qkd_backend.qkd_runner.intercept_resend import intercept_mask
+from qkd_backend.qkd_runner.parameter_estimation import abort_reason, estimation_policy
+from qkd_backend.qkd_runner.pipeline import distill
+from qkd_backend.qkd_runner.batching import DEFAULT_CHUNK_WIDTH, backend_chunk_width, build_chunks, run_chunks, counts_from_matrix
+
+def eve_targets(n, intercept_fraction, rng):
+    """Qubits Eve intercepts: alternate ones (0, 2, 4, ...) when intercept_fraction is None, else a random share."""
+    if intercept_fraction is None:
+        return np.arange(n) % 2 == 0
+    return intercept_mask(n, intercept_fraction, rng)
+
+
+def run_exp4(message=None, n=20, shots=1024, backend_type="local", chunk_width=DEFAULT_CHUNK_WIDTH, harvest_shots=False, draw_diagram=True, rng_seed=None, intercept_fraction=None):
+    """
+    Run BB84 with Eve measuring part of the qubits and resending random bits.
+
+    All randomness comes from one np.random.Generator seeded with rng_seed,
+    so runs are reproducible and safe to run concurrently.
+    intercept_fraction picks a random share of qubits for Eve; None keeps
+    her on alternate qubits.
+    """
+    rng = np.random.default_rng(rng_seed)
+
     # Alice prepares random bits and bases
-    alice_bits = [random.randint(0, 1) for _ in range(n)]
-    alice_bases = [random.randint(0, 1) for _ in range(n)]  # 0 = Z-basis, 1 = X-basis
+    alice_bits = rng.integers(0, 2, n).tolist()
+    alice_bases = rng.integers(0, 2, n).tolist()  # 0 = Z-basis, 1 = X-basis
 
-    # Eve measures alternate bits (0, 2, 4, ...)
-    eve_bases = [random.randint(0, 1) if i % 2 == 0 else None for i in range(n)]
+    # Eve measures the qubits she intercepts in random bases
+    targets = eve_targets(n, intercept_fraction, rng)
+    eve_bases = [int(b) if t else None for b, t in zip(rng.integers(0, 2, n), targets)]
 
     # Bob chooses random bases
-    bob_bases = [random.randint(0, 1) for _ in range(n)]
-
-    # Quantum circuit
-    qc = QuantumCircuit(n, n)
-    os.makedirs("static", exist_ok=True)
-
-    # Step 1: Alice encodes bits
-    for i in range(n):
-        if alice_bits[i] == 1:
-            qc.x(i)
-        if alice_bases[i] == 1:
-            qc.h(i)
-
-    # Step 2: Eve intercepts alternate bits (passive: just measures, doesn't resend)
-    for i in range(n):
-        if eve_bases[i] is not None:  
-            if eve_bases[i] == 1:
-                qc.h(i)
-            qc.measure(i, i)
-            qc.reset(i)
-            if random.randint(0, 1) == 1:
-                qc.x(i)
-            if alice_bases[i] == 1:
-                qc.h(i)
+    bob_bases = rng.integers(0, 2, n).tolist()
 
-    # Step 3: Bob measures
-    for i in range(n):
-        if bob_bases[i] == 1:
-            qc.h(i)
-        qc.measure(i, i)
+    # Eve's random resend bits for the qubits she intercepts
+    eve_resend = np.where(targets, rng.integers(0, 2, n), 0).tolist()
+
+    def build(start, stop):
+        # Quantum circuit for qubits start..stop-1
+        qc = QuantumCircuit(stop - start, stop - start)
+
+        # Step 1: Alice encodes bits
+        for q, i in enumerate(range(start, stop)):
+            if alice_bits[i] == 1:
+                qc.x(q)
+            if alice_bases[i] == 1:
+                qc.h(q)
+
+        # Step 2: Eve intercepts alternate bits (passive: just measures, doesn't resend)
+        for q, i in enumerate(range(start, stop)):
+            if eve_bases[i] is not None:
+                if eve_bases[i] == 1:
+                    qc.h(q)
+                qc.measure(q, q)
+                qc.reset(q)
+                if eve_resend[i] == 1:
+                    qc.x(q)
+                if alice_bases[i] == 1:
+                    qc.h(q)
+
+        # Step 3: Bob measures
+        for q, i in enumerate(range(start, stop)):
+            if bob_bases[i] == 1:
+                qc.h(q)
+            qc.measure(q, q)
+        return qc
+
+    circuits = build_chunks(n, build, backend_chunk_width(backend_type, chunk_width))
 
     # Backend & sampler selection
     if backend_type == "local":
-        qc_isa = qc
-        sampler = BackendSamplerV2(backend=AerSimulator())
+        qc_isa = circuits
+        sampler = get_sampler(get_aer_simulator(), sampler_seed(rng_seed))
     else:
-        backend = get_backend_service("ibm")
-        target = backend.target
-        pm = generate_preset_pass_manager(target=target, optimization_level=3)
-        qc_isa = pm.run(qc)
-        sampler = Sampler(mode=backend)
-
-    # Draw compiled/selected circuit
-    diagram_path = "static/circuit_exp4.png"
-    fig = circuit_drawer(qc_isa, output='mpl')
-    fig.savefig(diagram_path)
-    plt.close(fig)
-
-    # Run the circuit
-    job = sampler.run([qc_isa], shots=shots)
-    result = job.result()
-    counts_dict = result[0].data.c.get_counts() if hasattr(result[0].data, 'c') else result[0].data.get_counts()
+        backend = get_backend_service(backend_type)
+        # Pass manager and structurally identical circuits come from the cache
+        qc_isa = transpile(backend, circuits)
+        sampler = get_sampler(backend, sampler_seed(rng_seed))
+
+    # Compiled/selected circuit (first chunk) is drawn lazily on first GET
+    diagram_url = register_circuit(qc_isa[0]) if draw_diagram else None
+
+    # Run all chunks as one job
+    shot_bits = run_chunks(sampler, qc_isa, shots)
+    counts_dict = counts_from_matrix(shot_bits)
     bob_results = list(counts_dict.keys())[0]
     bob_bits = [int(b) for b in bob_results[::-1]]
 
-    # Step 4: Find matching bases and generate sifted key if QBER ≤ 11%
-    matching_indices = []
-    sifted_alice = []
-    sifted_bob = []
-
-    for i in range(n):
-        if alice_bases[i] == bob_bases[i]:
-            matching_indices.append(i)
-            sifted_alice.append(alice_bits[i])
-            sifted_bob.append(bob_bits[i])
+    harvest = None
+    harvest_alice = harvest_bob = None
+    if harvest_shots:
+        # Every other shot is a BB84 round disclosed for estimation; shot 0 (first counts key) is the key
+        harvest_alice, harvest_bob, harvest = harvest_rounds(alice_bits, alice_bases, bob_bases, shot_bits,
+                                                             key_shot=0)
+    estimation_kwargs, harvest_estimation = estimation_policy(harvest_alice, harvest_bob)
+
+    # Step 4: Sift, then estimate QBER on a disclosed sample; abort if its upper bound exceeds 11%
+    distilled = distill(alice_bits, alice_bases, bob_bases, bob_bits, rng=rng, stages=("estimate",),
+                        **estimation_kwargs)
+    sifted_alice = distilled["alice"].tolist()
+    sifted_bob = distilled["bob"].tolist()
+    kept_alice = distilled["kept_alice"].tolist()
+    kept_bob = distilled["kept_bob"].tolist()
 
     # Step 5: QBER calculation
-    errors = sum(1 for a, b in zip(sifted_alice, sifted_bob) if a != b)
-    qber = (errors / len(sifted_alice)) * 100 if len(sifted_alice) > 0 else 0
-
-    SECURITY_THRESHOLD = 11
-
-    # Message encryption/decryption only if QBER is below threshold
-    if message is not None and sifted_alice and qber <= SECURITY_THRESHOLD:
+    qber = distilled["qber"] * 100
+
+    # Message encryption/decryption only with the undisclosed bits of an accepted key: a usable
+    # estimate (the finite-key bound, or the harvest estimate), no abort, and Alice's and Bob's
+    # halves agree (exp4 has no error correction, so a key that passed estimation can still hold
+    # Eve's errors)
+    accepted = (distilled["estimation_status"] in ("ok", "estimate") and not distilled["aborted"]
+                and bool(kept_alice) and kept_alice == kept_bob)
+    if message is not None and accepted:
         message_bytes = message.encode('utf-8')
-        encrypted_bytes = xor_encrypt_decrypt(message_bytes, sifted_alice)
-        decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, sifted_bob)
+        encrypted_bytes = xor_encrypt_decrypt(message_bytes, kept_alice)
+        decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, kept_bob)
         try:
             decrypted_message = decrypted_bytes.decode('utf-8')
         except Exception:
@@ -137,7 +141,7 @@ def run_exp4(message=None, n=20, shots=1024, backend_type="local"):
     bmeas = list(key2)
     bbits = [int(x) for x in bmeas][::-1]
 
-    return {
+    result = {
         "Sender_bits": alice_bits,
         "Sender_bases": alice_bases,
         "Receiver_bases": bob_bases,
@@ -149,7 +153,14 @@ def run_exp4(message=None, n=20, shots=1024, backend_type="local"):
         "qber": qber,
         "fidelity": (100 - qber) / 100,  # Convert to decimal (0-1 range)
         "loss": qber / 100,              # Convert to decimal (0-1 range)
-        "circuit_diagram_url": "/static/circuit_exp4.png",
+        "circuit_diagram_url": diagram_url,
         "counts_eve": counts,
-        "counts_bob": counts2
-    }
\ No newline at end of file
+        "counts_bob": counts2,
+        "encrypted_message_hex": encrypted_hex,
+        "decrypted_message": decrypted_message,
+        "abort_reason": abort_reason(distilled),
+        "parameter_estimation": distilled.get("estimation", harvest_estimation),
+    }
+    if harvest is not None:
+        result["harvest"] = harvest
+    return result
@@ -0,0 +1,189 @@
+# qkd_backend/qkd_runner/exp4_sweep.py
+"""
+QBER sweep for exp4's attack over interception fraction and key length.
+
+On the ideal channel exp4 reduces to array operations: Eve re-prepares the
+qubits she intercepts as random bits in Alice's basis, so on a sifted
+position Bob reads her random bit if she intercepted it and Alice's bit
+otherwise. Each grid cell simulates many sessions as one (sessions, n)
+batch; cells run in a process pool, each on its own Generator spawned from
+the cell's seed, so results do not depend on scheduling or worker count.
+
+The detection rate is the share of sessions exp4 aborts, decided as its
+parameter estimation does: on a disclosed sample of the sifted key, with
+the finite-key bound when the sample is large enough.
+"""
+
+import multiprocessing
+import numbers
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+
+from qkd_backend.serialization import table_columns
+from qkd_backend.qkd_runner.intercept_resend import validate_fraction
+from qkd_backend.qkd_runner.parameter_estimation import decide, estimation_policy, qber_upper_bound, sample_size
+
+DEFAULT_SESSIONS = 1000
+# Bounds of one sweep: a cell holds a few (sessions, key_length) arrays in memory
+MAX_SESSIONS = 100_000
+MAX_KEY_LENGTH = 100_000
+MAX_CELL_QUBITS = 10_000_000
+MAX_CELLS = 1024
+# Two-sided 95% normal quantile for the confidence interval of the mean QBER
+Z_95 = 1.959963984540054
+# Sweeps run on job worker threads, and forking a multithreaded process can
+# deadlock the child, so pool workers are spawned
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+SWEEP_DTYPE = np.dtype([
+    ("intercept_fraction", "f8"),
+    ("key_length", "i8"),
+    ("seed", "i8"),
+    ("sessions", "i8"),
+    ("qber_mean", "f8"),
+    ("qber_std", "f8"),
+    ("ci_low", "f8"),
+    ("ci_high", "f8"),
+    ("qber_p05", "f8"),
+    ("qber_p50", "f8"),
+    ("qber_p95", "f8"),
+    ("detection_rate", "f8"),
+])
+
+
+def simulate_exp4(sessions, n, intercept_fraction, rng):
+    """
+    Per-session QBER of exp4's attack on an ideal channel, and exp4's abort decision.
+
+    Sessions without sifted bits are left out.
+
+    Returns:
+        tuple: (QBER of each session with at least one sifted bit, whether
+        exp4 aborts it)
+    """
+    shape = (sessions, n)
+    abits = rng.integers(0, 2, shape, dtype=np.uint8)
+    sifted = rng.integers(0, 2, shape, dtype=np.uint8) == rng.integers(0, 2, shape, dtype=np.uint8)
+    intercepted = rng.random(shape) < intercept_fraction
+    resent = rng.integers(0, 2, shape, dtype=np.uint8)
+    bbits = np.where(intercepted, resent, abits)
+    sifted_bits = np.count_nonzero(sifted, axis=1)
+    errors = np.count_nonzero(sifted & (abits != bbits), axis=1)
+    keep = sifted_bits > 0
+    sifted_bits, errors = sifted_bits[keep], errors[keep]
+    return errors / sifted_bits, _aborted(sifted_bits, errors, rng)
+
+
+def _aborted(sifted_bits, errors, rng):
+    """exp4's abort decision per session, from the errors in its disclosed sample."""
+    policy, _ = estimation_policy()
+    k = sample_size(sifted_bits, policy["sample_fraction"])
+    # The sample is drawn without replacement, so its errors are hypergeometric
+    sampled_errors = rng.hypergeometric(errors, sifted_bits - errors, k) if k.size else k
+    # Sessions share few (errors, sample, key) triples; decide each once
+    triples, inverse = np.unique(np.stack([sampled_errors, k, sifted_bits], axis=1), axis=0, return_inverse=True)
+    aborted = np.array([decide(e / s, qber_upper_bound(e, s, n), s, n - s, policy["max_qber"])[1]
+                        for e, s, n in triples], dtype=bool)
+    return aborted[inverse.ravel()]
+
+
+def _integer(value, name, low, high):
+    if isinstance(value, bool) or not isinstance(value, numbers.Integral) or not low <= value <= high:
+        raise ValueError(f"{name} must be an integer in [{low}, {high}], got {value!r}")
+    return int(value)
+
+
+def _values(values, name):
+    if isinstance(values, (str, bytes, dict)) or not hasattr(values, "__iter__"):
+        raise ValueError(f"{name} must be a list")
+    values = list(values)
+    if not values:
+        raise ValueError(f"{name} must not be empty")
+    return values
+
+
+def validate_grid(intercept_fractions, key_lengths, seeds=(0,), sessions=DEFAULT_SESSIONS):
+    """
+    Check a sweep grid before any cell runs, so the job API can reject it up front.
+
+    Returns:
+        dict: intercept_fractions, key_lengths, seeds (lists of float / int)
+        and sessions, as sweep() takes them
+
+    Raises:
+        ValueError: On a non-list axis, a non-numeric or out-of-range value,
+        or a grid over MAX_CELLS cells or MAX_CELL_QUBITS qubits per cell
+    """
+    fractions = [validate_fraction(f, "intercept_fractions")
+                 for f in _values(intercept_fractions, "intercept_fractions")]
+    lengths = [_integer(n, "key_lengths", 1, MAX_KEY_LENGTH) for n in _values(key_lengths, "key_lengths")]
+    seeds = [_integer(seed, "seeds", 0, 2**63 - 1) for seed in _values(seeds, "seeds")]
+    sessions = _integer(sessions, "sessions", 1, MAX_SESSIONS)
+    cells = len(fractions) * len(lengths) * len(seeds)
+    if cells > MAX_CELLS:
+        raise ValueError(f"Sweep of {cells} cells exceeds {MAX_CELLS}")
+    if sessions * max(lengths) > MAX_CELL_QUBITS:
+        raise ValueError(f"sessions * key_length exceeds {MAX_CELL_QUBITS} qubits per cell")
+    return {"intercept_fractions": fractions, "key_lengths": lengths, "seeds": seeds, "sessions": sessions}
+
+
+def _sweep_cell(intercept_fraction, key_length, seed, seed_seq, sessions):
+    qber, aborted = simulate_exp4(sessions, key_length, intercept_fraction, np.random.default_rng(seed_seq))
+    row = np.zeros((), dtype=SWEEP_DTYPE)
+    row["intercept_fraction"] = intercept_fraction
+    row["key_length"] = key_length
+    row["seed"] = seed
+    row["sessions"] = qber.size
+    if qber.size:
+        mean = qber.mean()
+        std = qber.std(ddof=1) if qber.size > 1 else 0.0
+        half_width = Z_95 * std / np.sqrt(qber.size)
+        row["qber_mean"] = mean
+        row["qber_std"] = std
+        row["ci_low"] = mean - half_width
+        row["ci_high"] = mean + half_width
+        row["qber_p05"], row["qber_p50"], row["qber_p95"] = np.quantile(qber, [0.05, 0.5, 0.95])
+        row["detection_rate"] = np.count_nonzero(aborted) / qber.size
+    return row
+
+
+def sweep(intercept_fractions, key_lengths, seeds=(0,), sessions=DEFAULT_SESSIONS, max_workers=None, executor=None):
+    """
+    QBER distribution for every (fraction, key length, seed) grid cell.
+
+    Args:
+        intercept_fractions: Shares of qubits Eve intercepts
+        key_lengths: Qubits per session
+        seeds: Root seeds; cells of one seed get independent spawned streams
+        sessions (int): Sessions simulated per cell
+        max_workers (int | None): Process pool size when no executor is given
+        executor: Optional executor to run the cells on
+
+    Returns:
+        np.ndarray: Structured array of SWEEP_DTYPE rows in grid order
+
+    Raises:
+        ValueError: On a grid validate_grid() rejects
+    """
+    grid = validate_grid(intercept_fractions, key_lengths, seeds, sessions)
+    sessions = grid["sessions"]
+    axes = list(product(grid["intercept_fractions"], grid["key_lengths"]))
+    cells = []
+    for seed in grid["seeds"]:
+        for (fraction, length), seed_seq in zip(axes, np.random.SeedSequence(seed).spawn(len(axes))):
+            cells.append((fraction, length, seed, seed_seq, sessions))
+    if executor is not None:
+        rows = list(executor.map(_sweep_cell, *zip(*cells))) if cells else []
+    elif len(cells) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT) as pool:
+            rows = list(pool.map(_sweep_cell, *zip(*cells)))
+    else:
+        rows = [_sweep_cell(*cell) for cell in cells]
+    return np.array(rows, dtype=SWEEP_DTYPE)
+
+
+def run_sweep(intercept_fractions, key_lengths, seeds=(0,), sessions=DEFAULT_SESSIONS, max_workers=None):
+    """sweep() as a JSON-ready column table, for the job API."""
+    return table_columns(sweep(intercept_fractions, key_lengths, seeds, sessions, max_workers))
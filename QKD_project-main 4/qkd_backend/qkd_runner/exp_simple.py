@@ -2,12 +2,14 @@
 import numpy as np
 import hashlib
 
-def run_simple_exp(backend_type="local"):
+from qkd_backend.cipher import xor_bytes
+
+def run_simple_exp(backend_type="local", rng_seed=None):
     """
     Simple QKD experiment for testing the web interface
     """
     # Simulate a simple BB84 protocol without heavy quantum computation
-    rng = np.random.default_rng()
+    rng = np.random.default_rng(rng_seed)
     bit_num = 10  # Reduced from 20 for faster execution
     
     # Step 1: Alice's random bits and bases
@@ -68,21 +70,13 @@ def encrypt_with_existing_key(exp_result, message):
     key = exp_result["final_secret_key"]
     message_bytes = message.encode('utf-8')
     
-    # Simple XOR encryption
-    encrypted = []
-    for i, byte in enumerate(message_bytes):
-        key_byte = ord(key[i % len(key)])
-        encrypted.append(byte ^ key_byte)
-    
-    encrypted_hex = ''.join(f'{b:02x}' for b in encrypted)
+    # Simple XOR encryption, key characters used as key bytes
+    key_bytes = key.encode('utf-8')
+    encrypted = xor_bytes(message_bytes, key_bytes)
+    encrypted_hex = encrypted.hex()
     
     # Decrypt to verify
-    decrypted = []
-    for i, byte in enumerate(encrypted):
-        key_byte = ord(key[i % len(key)])
-        decrypted.append(byte ^ key_byte)
-    
-    decrypted_message = bytes(decrypted).decode('utf-8')
+    decrypted_message = xor_bytes(encrypted, key_bytes).decode('utf-8')
     
     return {
         "original_message": message,
@@ -0,0 +1,91 @@
+# qkd_backend/qkd_runner/intercept_resend.py
+"""
+Circuit-free intercept-resend attack for the ideal local backend.
+
+On an ideal channel Eve's attack needs no second circuit: where she picks
+the wrong basis her bit is a fair coin, and she resends that bit in her
+basis, so Bob's basis mismatches against her basis randomize his bit again.
+Qubits she lets through reach Bob as Alice prepared them. All functions
+work on arrays of any shape, so simulate_sessions runs thousands of
+sessions as one (sessions, bit_num) batch.
+"""
+
+import numbers
+
+import numpy as np
+
+from qkd_backend.qkd_runner.bb84_vectorized import measure
+
+
+def validate_fraction(value, name="intercept_fraction"):
+    """
+    An interception fraction as a float.
+
+    Raises:
+        ValueError: If value is not a real number in [0, 1] (booleans and NaN included)
+    """
+    if isinstance(value, bool) or not isinstance(value, numbers.Real) or not 0 <= value <= 1:
+        raise ValueError(f"{name} must be a number in [0, 1], got {value!r}")
+    return float(value)
+
+
+def intercept_mask(shape, intercept_fraction, rng):
+    """Positions Eve intercepts; all of them for a fraction of 1 (no random draw)."""
+    if intercept_fraction >= 1:
+        return np.ones(shape, dtype=bool)
+    return rng.random(shape) < intercept_fraction
+
+
+def resend(abits, abase, ebase, ebits, intercepted):
+    """What reaches Bob: Eve's bit and basis where she intercepted, Alice's elsewhere."""
+    bits = np.where(intercepted, ebits, abits).astype(np.uint8)
+    bases = np.where(intercepted, ebase, abase).astype(np.uint8)
+    return bits, bases
+
+
+def intercept(abits, abase, rng, intercept_fraction=1.0):
+    """
+    Eve measures a random share of Alice's qubits in random bases.
+
+    Args:
+        abits, abase: Alice's bits and bases (arrays of any shape)
+        rng (np.random.Generator): Random source
+        intercept_fraction (float): Probability that Eve intercepts a qubit
+
+    Returns:
+        tuple: (ebase, ebits, intercepted, resent_bits, resent_bases)
+    """
+    abits = np.asarray(abits, dtype=np.uint8)
+    abase = np.asarray(abase, dtype=np.uint8)
+    ebase = rng.integers(0, 2, abits.shape, dtype=np.uint8)
+    ebits = measure(abits, abase, ebase, rng)
+    intercepted = intercept_mask(abits.shape, intercept_fraction, rng)
+    resent_bits, resent_bases = resend(abits, abase, ebase, ebits, intercepted)
+    return ebase, ebits, intercepted, resent_bits, resent_bases
+
+
+def simulate_sessions(sessions, bit_num, rng=None, intercept_fraction=1.0):
+    """
+    Run many intercept-resend BB84 sessions as one batch.
+
+    Args:
+        sessions (int): Number of independent sessions
+        bit_num (int): Qubits per session
+        rng (np.random.Generator | int | None): Random source or seed
+        intercept_fraction (float): Probability that Eve intercepts a qubit
+
+    Returns:
+        dict: Per-session arrays sifted_bits, errors and qber (0 where nothing was sifted)
+    """
+    rng = np.random.default_rng(rng)
+    shape = (sessions, bit_num)
+    abits = rng.integers(0, 2, shape, dtype=np.uint8)
+    abase = rng.integers(0, 2, shape, dtype=np.uint8)
+    bbase = rng.integers(0, 2, shape, dtype=np.uint8)
+    _, _, _, resent_bits, resent_bases = intercept(abits, abase, rng, intercept_fraction)
+    bbits = measure(resent_bits, resent_bases, bbase, rng)
+    sifted = abase == bbase
+    sifted_bits = np.count_nonzero(sifted, axis=1)
+    errors = np.count_nonzero(sifted & (abits != bbits), axis=1)
+    qber = np.divide(errors, sifted_bits, out=np.zeros(sessions), where=sifted_bits > 0)
+    return {"sifted_bits": sifted_bits, "errors": errors, "qber": qber}
@@ -0,0 +1,145 @@
+# qkd_backend/qkd_runner/key_stream.py
+"""
+Continuous BB84 key generation as a stream of key blocks.
+
+raw_rounds() runs BB84 rounds back to back, on the vectorized engine or
+through the shared circuit runner on any backend, and key_stream() feeds them
+through the threaded post-processing pipeline. Every stage hands blocks
+over a bounded queue, so a slow consumer stalls the producer once the
+queues are full instead of piling up key material; closing the stream
+stops every stage.
+"""
+
+import time
+from itertools import count
+
+import numpy as np
+
+from qkd_backend.backend_config import sampler_seed
+from qkd_backend.qkd_runner.batching import DEFAULT_CHUNK_WIDTH, run_bb84_circuit
+from qkd_backend.qkd_runner.bb84_vectorized import prepare_and_measure
+from qkd_backend.qkd_runner.parameter_estimation import QBER_ABORT_THRESHOLD
+from qkd_backend.qkd_runner.pipeline import DEFAULT_BLOCK_BITS, distill_stream
+from qkd_backend.qkd_runner.reconciliation import RECONCILERS
+
+DEFAULT_ROUND_BITS = 8192
+DEFAULT_STREAM_BLOCK_BITS = DEFAULT_BLOCK_BITS
+# Key material is only streamed in blocks of at most this many sifted bits
+MAX_STREAM_BLOCK_BITS = 1 << 20
+
+# Stages after sifting for each stream kind
+STREAM_STAGES = {
+    "final": ("estimate", "reconcile", "amplify"),
+    "sifted": ("estimate",),
+}
+
+
+def raw_rounds(round_bits=DEFAULT_ROUND_BITS, rng=None, engine="numpy", backend_type="local",
+               chunk_width=DEFAULT_CHUNK_WIDTH, rng_seed=None, max_rounds=None):
+    """
+    BB84 raw rounds, back to back.
+
+    Args:
+        round_bits (int): Qubits Alice sends per round
+        rng (np.random.Generator): Source of bits and bases
+        engine (str): "numpy" for the vectorized engine (ideal local backend only), else circuits
+        backend_type (str): Backend for circuit rounds ("local", "noisy", "ibm")
+        rng_seed (int | None): Root of the per-round simulator seeds
+        max_rounds (int | None): Stop after this many rounds; None runs until closed
+
+    Yields:
+        tuple: (abits, abase, bbase, bbits) arrays of length round_bits
+    """
+    rng = rng if rng is not None else np.random.default_rng(rng_seed)
+    rounds = count() if max_rounds is None else range(max_rounds)
+    for index in rounds:
+        if backend_type == "local" and engine == "numpy":
+            yield prepare_and_measure(round_bits, rng)
+            continue
+        # One shot per round; each round's simulator seed is spawned from (rng_seed, index)
+        seed = sampler_seed([rng_seed, index]) if rng_seed is not None else None
+        abits, abase, bbase, bbits, _, _, _ = run_bb84_circuit(
+            round_bits, 1, rng, backend_type, chunk_width, draw_diagram=False, seed=seed
+        )
+        yield abits, abase, bbase, np.asarray(bbits, dtype=np.uint8)
+
+
+def key_stream(round_bits=DEFAULT_ROUND_BITS, block_bits=DEFAULT_STREAM_BLOCK_BITS, engine="numpy",
+               backend_type="local", chunk_width=DEFAULT_CHUNK_WIDTH, rng_seed=None, kind="final",
+               sample_fraction=0.2, max_qber=QBER_ABORT_THRESHOLD, reconciliation="cascade", max_blocks=None):
+    """
+    Stream distilled key blocks with live QBER and throughput.
+
+    Args:
+        round_bits (int): Qubits per raw round
+        block_bits (int): Sifted bits per pipeline block
+        kind (str): "final" (reconciled, privacy-amplified key) or "sifted"
+            (the undisclosed sifted key after QBER estimation)
+        sample_fraction (float): Share of each block disclosed for QBER estimation
+        max_qber (float): Abort threshold on a block's QBER upper bound
+        reconciliation (str): "cascade" or "ldpc"
+        max_blocks (int | None): Stop after this many blocks; None runs until closed
+
+    Yields:
+        dict: Per block its index, key_bits and key (hex, whole bytes
+        packed MSB first, last byte zero-padded), the block's qber /
+        qber_upper / aborted, the running QBER and key totals, and key_rate_bps
+
+    Raises:
+        ValueError: On an unknown kind or reconciliation method, or an out-of-range size
+    """
+    if kind not in STREAM_STAGES:
+        raise ValueError(f"Unknown stream kind: {kind}")
+    if "reconcile" in STREAM_STAGES[kind] and reconciliation not in RECONCILERS:
+        raise ValueError(f"Unknown reconciliation method: {reconciliation}")
+    if round_bits < 1 or not 1 <= block_bits <= MAX_STREAM_BLOCK_BITS:
+        raise ValueError(f"round_bits must be >= 1 and block_bits in [1, {MAX_STREAM_BLOCK_BITS}]")
+    # Validated eagerly; the pipeline threads only start with the first block
+    return _key_blocks(round_bits, block_bits, engine, backend_type, chunk_width, rng_seed, kind,
+                       sample_fraction, max_qber, reconciliation, max_blocks)
+
+
+def _key_blocks(round_bits, block_bits, engine, backend_type, chunk_width, rng_seed, kind, sample_fraction,
+                max_qber, reconciliation, max_blocks):
+    rng = np.random.default_rng(rng_seed)
+    seed = int(rng.integers(0, 2**63))
+    blocks = distill_stream(
+        raw_rounds(round_bits, rng, engine, backend_type, chunk_width, rng_seed),
+        block_bits=block_bits, seed=seed, sample_fraction=sample_fraction, max_qber=max_qber,
+        method=reconciliation, stages=STREAM_STAGES[kind], threads=True,
+    )
+    start = time.monotonic()
+    total_key_bits = estimated_bits = 0
+    errors = 0.0
+    try:
+        for index, block in enumerate(blocks):
+            if kind == "final":
+                key, key_bits = block.get("key", b""), block.get("key_bits", 0)
+            else:
+                key, key_bits = block["alice"], block["n_bits"]
+            if block.get("aborted"):
+                key, key_bits = b"", 0
+            key = bytes(key)
+            total_key_bits += key_bits
+            # Running QBER, weighted by the bits each block's estimate covers
+            stats = block.get("estimation")
+            covered = stats["sampled_bits"] if stats else block["n_bits"]
+            estimated_bits += covered
+            errors += block["qber"] * covered
+            elapsed = time.monotonic() - start
+            yield {
+                "block": index,
+                "key_bits": int(key_bits),
+                "key": key[:(key_bits + 7) // 8].hex(),
+                "qber": block["qber"],
+                "qber_upper": block["qber_upper"],
+                "aborted": block["aborted"],
+                "running_qber": errors / estimated_bits if estimated_bits else 0.0,
+                "total_key_bits": total_key_bits,
+                "elapsed_s": elapsed,
+                "key_rate_bps": total_key_bits / elapsed if elapsed > 0 else None,
+            }
+            if max_blocks is not None and index + 1 >= max_blocks:
+                return
+    finally:
+        blocks.close()
@@ -0,0 +1,137 @@
+# qkd_backend/qkd_runner/multiuser_engine.py
+"""
+Multi-user trusted-node QKD model, evaluated for all receivers at once.
+
+The model of the Streamlit multi-user simulator (multiuser.py): each
+receiver sits at its own distance from Alice, the path is cut into links
+of link_length km with a trusted node per link, and the per-link QBER
+compounds over the hops into an end-to-end QBER, key rate and time to
+form a session key. Every function takes NumPy arrays, so simulate()
+evaluates any number of receivers in one pass; both multiuser.py and the
+Flask app call it. Values are rounded to 2 decimals at each step, as the
+simulator displays them.
+"""
+
+import numpy as np
+
+# Key rate at zero QBER, in kbps
+BASE_RATE_KBPS = 50
+DISTRIBUTION_MODES = ("Sequential", "Parallel")
+SESSION_KEY_LENGTHS = (128, 256, 512, 1024)
+
+
+def _round2(x):
+    """round(x, 2) elementwise, with Python's tie-breaking on the exact float value."""
+    x = np.asarray(x, dtype=float)
+    out = np.round(x, 2)
+    # np.round halves ties on x * 100; the few near-ties are settled by round() itself
+    scaled = x * 100
+    # inf - inf is nan here; those entries are masked out by isfinite
+    with np.errstate(invalid="ignore"):
+        ties = np.isfinite(scaled) & (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if np.any(ties):
+        out = np.array(out, dtype=float)
+        out[ties] = [round(float(v), 2) for v in x[ties]]
+    return out
+
+
+def calculate_trusted_nodes(distance, link_length):
+    """Hops (one trusted node per link) needed to cover each distance."""
+    return np.ceil(np.asarray(distance, dtype=float) / link_length).astype(np.int64)
+
+
+def calculate_per_link_qber(detector_eff, dark_count, attenuation, misalignment):
+    """Simplified per-link QBER in %; attenuation does not enter the model."""
+    qber = (100 - np.asarray(detector_eff, dtype=float)) * 0.01 + np.asarray(dark_count) * 100 + misalignment
+    return _round2(qber)
+
+
+def calculate_end_to_end_qber(per_link_qber, n_hops):
+    """End-to-end QBER in %: 1 - (1 - q)^n over n hops."""
+    q_total = 1 - (1 - np.asarray(per_link_qber, dtype=float) / 100) ** np.asarray(n_hops)
+    return _round2(q_total * 100)
+
+
+def calculate_key_rate(end_to_end_qber, base_rate=BASE_RATE_KBPS):
+    """Key rate in kbps, falling linearly with the end-to-end QBER."""
+    return _round2(base_rate * (1 - np.asarray(end_to_end_qber, dtype=float) / 100))
+
+
+def calculate_time_to_form_key(session_length, key_rate, n_hops, latency):
+    """Seconds to form a session key: session_length / key_rate plus latency (ms) per hop; inf at rate 0."""
+    key_rate = np.asarray(key_rate, dtype=float)
+    with np.errstate(divide="ignore"):
+        t = session_length / key_rate + np.asarray(n_hops) * latency / 1000.0
+    return _round2(t)
+
+
+def spread_distances(total_distance, n_users):
+    """Receivers evenly spread out to total_distance, the simulator's default distances."""
+    i = np.arange(1, n_users + 1)
+    return np.floor(total_distance * i / n_users).astype(np.int64)
+
+
+def simulate(user_distances, link_length=100, session_key_length=128, detector_efficiency=90,
+             dark_count_prob=0.001, channel_attenuation=0.2, misalignment_error=2, key_relay_latency=5):
+    """
+    Evaluate every receiver.
+
+    Args:
+        user_distances: Distance of each receiver from Alice in km
+        link_length (float): Link length per trusted node in km
+        session_key_length (int): K_session length in bits
+        detector_efficiency (float): Detector efficiency in %
+        dark_count_prob (float): Dark count probability
+        channel_attenuation (float): dB/km (not used by the model)
+        misalignment_error (float): Misalignment error in %
+        key_relay_latency (float): Key relay latency per hop in ms
+
+    Returns:
+        dict: Per-receiver arrays distance_km, trusted_nodes, per_link_qber,
+        end_to_end_qber, key_rate, success, time_to_form_key and final_key_length
+
+    Raises:
+        ValueError: If link_length is not positive
+    """
+    if link_length <= 0:
+        raise ValueError("link_length must be positive")
+    distances = np.asarray(user_distances, dtype=float)
+    n_hops = calculate_trusted_nodes(distances, link_length)
+    # One per-link QBER for every receiver: all links share the same hardware
+    per_link = calculate_per_link_qber(detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error)
+    end_to_end = calculate_end_to_end_qber(per_link, n_hops)
+    rate = calculate_key_rate(end_to_end)
+    return {
+        "distance_km": distances,
+        "trusted_nodes": n_hops,
+        "per_link_qber": np.full(distances.shape, per_link),
+        "end_to_end_qber": end_to_end,
+        "key_rate": rate,
+        "success": rate > 0,
+        "time_to_form_key": calculate_time_to_form_key(session_key_length, rate, n_hops, key_relay_latency),
+        "final_key_length": np.full(distances.shape, session_key_length, dtype=np.int64),
+    }
+
+
+def summarize(result, distribution_mode="Sequential"):
+    """
+    Summary statistics over all receivers.
+
+    total_time sums every receiver's time to form its key; completion_time
+    is that sum for sequential distribution and the slowest receiver for
+    parallel distribution.
+    """
+    if distribution_mode not in DISTRIBUTION_MODES:
+        raise ValueError(f"Unknown distribution mode: {distribution_mode}")
+    times = result["time_to_form_key"]
+    n = times.size
+    total_time = round(float(times.sum()), 2) if n else 0.0
+    return {
+        "receivers": int(n),
+        "avg_qber": round(float(result["end_to_end_qber"].mean()), 2) if n else 0.0,
+        "total_key_rate": round(float(result["key_rate"].sum()), 2),
+        "successes": int(np.count_nonzero(result["success"])),
+        "failures": int(n - np.count_nonzero(result["success"])),
+        "total_time": total_time,
+        "completion_time": total_time if distribution_mode == "Sequential" else (float(times.max()) if n else 0.0),
+    }
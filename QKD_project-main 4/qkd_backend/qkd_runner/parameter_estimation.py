@@ -0,0 +1,170 @@
+# qkd_backend/qkd_runner/parameter_estimation.py
+"""
+QBER estimation from a disclosed random sample with finite-key bounds.
+
+Alice and Bob reveal only a random subset of the sifted key, compute the
+observed error rate on it and bound the error rate of the undisclosed rest
+from above. The abort decision uses that upper bound, and the undisclosed
+bits are kept for the key.
+
+Bounds (k sampled out of N sifted bits, failure probability epsilon):
+    hoeffding: t = sqrt(ln(1/eps) / (2k))
+    serfling:  t = sqrt((1 - (k-1)/N) ln(1/eps) / (2k))   (sampling without replacement)
+bound the error rate of all N bits by e_obs + t; the N - k kept bits then
+have error rate at most e_obs + t N / (N - k).
+
+The sample is never smaller than MIN_PE_SAMPLE_BITS, the size at which
+the bound becomes meaningful. A sifted key too short to leave bits after
+such a sample is disclosed in full and gets status
+"insufficient_statistics": its QBER is exact, the abort decision uses it,
+and no key is left.
+"""
+
+import numpy as np
+
+DEFAULT_SAMPLE_FRACTION = 0.2
+PE_EPSILON = 1e-10
+# Smallest sample drawn; keys up to this size are disclosed in full. An
+# error-free sample of k bits is bounded by sqrt(ln(1/eps) / 2k), which
+# only drops under 11% from k ~ 950
+MIN_PE_SAMPLE_BITS = 1000
+# Abort when the QBER upper bound exceeds this (BB84 one-way limit is ~11%)
+QBER_ABORT_THRESHOLD = 0.11
+
+
+def deviation(k, n_total, epsilon=PE_EPSILON, method="serfling"):
+    """
+    One-sided deviation t of the sample error rate from the population rate.
+
+    Raises:
+        ValueError: For an unknown method
+    """
+    if k <= 0:
+        return 1.0
+    log_term = np.log(1 / epsilon)
+    if method == "hoeffding":
+        return float(np.sqrt(log_term / (2 * k)))
+    if method == "serfling":
+        return float(np.sqrt((1 - (k - 1) / n_total) * log_term / (2 * k)))
+    raise ValueError(f"Unknown estimation bound: {method}")
+
+
+def qber_upper_bound(errors, k, n_total, epsilon=PE_EPSILON, method="serfling"):
+    """Upper bound on the error rate of the n_total - k undisclosed bits, capped at 0.5."""
+    if n_total - k <= 0 or k <= 0:
+        return 0.5
+    observed = errors / k
+    bound = observed + deviation(k, n_total, epsilon, method) * n_total / (n_total - k)
+    return float(min(bound, 0.5))
+
+
+def decide(qber_observed, qber_upper, sampled_bits, kept_bits, max_qber=QBER_ABORT_THRESHOLD):
+    """
+    Statistics status and abort flag of an estimate.
+
+    Returns:
+        tuple: ("ok" or "insufficient_statistics", abort). Samples under
+        MIN_PE_SAMPLE_BITS, or samples that leave no key, abort on the
+        observed QBER; the rest on the upper bound.
+    """
+    if sampled_bits < MIN_PE_SAMPLE_BITS or kept_bits <= 0:
+        return "insufficient_statistics", bool(max_qber is not None and qber_observed > max_qber)
+    return "ok", bool(max_qber is not None and qber_upper > max_qber)
+
+
+def sample_size(n_total, sample_fraction=DEFAULT_SAMPLE_FRACTION):
+    """Bits disclosed out of n_total sifted bits, at least MIN_PE_SAMPLE_BITS (or all of them); broadcasts."""
+    n_total = np.asarray(n_total)
+    return np.minimum(n_total, np.maximum(MIN_PE_SAMPLE_BITS, np.rint(n_total * sample_fraction).astype(np.int64)))
+
+
+def estimate(alice_bits, bob_bits, sample_fraction=DEFAULT_SAMPLE_FRACTION, epsilon=PE_EPSILON,
+             max_qber=QBER_ABORT_THRESHOLD, method="serfling", rng=None):
+    """
+    Disclose a random sample of the sifted key and bound the QBER.
+
+    Args:
+        alice_bits, bob_bits: Sifted keys (0/1 arrays of equal length)
+        sample_fraction (float): Share of the sifted bits to disclose
+        epsilon (float): Failure probability of the bound
+        max_qber (float | None): Abort threshold on the upper bound
+        method (str): "serfling" or "hoeffding"
+        rng (np.random.Generator): Public randomness choosing the sample
+
+    Returns:
+        tuple: (keep mask over the sifted bits, stats dict with sampled_bits,
+        errors, qber_observed, qber_upper, epsilon, method, status, abort)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    alice = np.asarray(alice_bits, dtype=np.uint8)
+    bob = np.asarray(bob_bits, dtype=np.uint8)
+    n_total = alice.size
+    k = int(sample_size(n_total, sample_fraction))
+    keep = np.ones(n_total, dtype=bool)
+    keep[rng.choice(n_total, k, replace=False)] = False
+    errors = int(np.count_nonzero(alice[~keep] != bob[~keep]))
+    upper = qber_upper_bound(errors, k, n_total, epsilon, method)
+    observed = errors / k if k else 0.0
+    status, abort = decide(observed, upper, k, n_total - k, max_qber)
+    stats = {
+        "sampled_bits": int(k),
+        "kept_bits": int(n_total - k),
+        "errors": errors,
+        "qber_observed": observed,
+        "qber_upper": upper,
+        "epsilon": epsilon,
+        "method": method,
+        "status": status,
+        "abort": abort,
+    }
+    return keep, stats
+
+
+def estimation_policy(alice_bits=None, bob_bits=None):
+    """
+    distill() arguments for the shared abort policy.
+
+    Without harvested bits the pipeline samples the sifted key itself. With
+    harvested bits (every shot but the key shot sifted, see
+    bb84_vectorized.harvest_rounds) the whole harvest is disclosed and its
+    error rate decides the abort. The shots repeat the same bit and basis
+    choices, so they are not independent rounds: their error rate estimates
+    the expected QBER of the circuit, not the QBER of the key shot, and no
+    finite-key bound is claimed (status "estimate", qber_upper None). An
+    empty harvest (a single shot) falls back to sampling the sifted key.
+
+    Returns:
+        tuple: (kwargs for distill, harvest estimation stats or None)
+    """
+    kwargs = {"sample_fraction": DEFAULT_SAMPLE_FRACTION, "max_qber": QBER_ABORT_THRESHOLD}
+    if alice_bits is None or not len(alice_bits):
+        return kwargs, None
+    alice = np.asarray(alice_bits, dtype=np.uint8)
+    errors = int(np.count_nonzero(alice != np.asarray(bob_bits, dtype=np.uint8)))
+    k = int(alice.size)
+    observed = errors / k
+    stats = {
+        "sampled_bits": k,
+        "errors": errors,
+        "qber_observed": observed,
+        "qber_upper": None,
+        "method": "harvest",
+        "status": "estimate",
+        "abort": observed > QBER_ABORT_THRESHOLD,
+    }
+    kwargs.update(qber=observed)
+    return kwargs, stats
+
+
+def abort_reason(summary):
+    """Human-readable abort message for a distill() summary, or None."""
+    if not summary.get("aborted"):
+        return None
+    if summary.get("estimation_status") == "insufficient_statistics":
+        return (f"Observed QBER {summary['qber']:.1%} exceeds {QBER_ABORT_THRESHOLD:.0%} "
+                f"(sample too small for a finite-key bound). Key generation aborted.")
+    if summary.get("estimation_status") == "estimate":
+        return (f"Estimated QBER {summary['qber']:.1%} exceeds {QBER_ABORT_THRESHOLD:.0%}. "
+                f"Key generation aborted.")
+    return (f"QBER upper bound {summary['qber_upper']:.1%} exceeds {QBER_ABORT_THRESHOLD:.0%} "
+            f"(observed {summary['qber']:.1%}). Key generation aborted.")
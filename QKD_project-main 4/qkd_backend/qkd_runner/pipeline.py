@@ -0,0 +1,345 @@
+# qkd_backend/qkd_runner/pipeline.py
+"""
+Streaming BB84 post-processing: sift -> estimate -> reconcile -> amplify.
+
+Every stage is a generator over blocks. A block is a dict holding Alice's
+and Bob's keys as packed bit arrays plus the stats each stage adds, so a
+continuous raw-key stream is processed with memory bounded by the block
+size and queue depth. The per-block functions are pure and module-level,
+so map_stage can fan them out to a thread or process pool, and threaded()
+runs a whole stage on its own thread behind a bounded queue.
+
+Each block carries its own seed; stage randomness (sample positions,
+Cascade permutations, Toeplitz seeds) is derived from it, so results do not
+depend on how the stages are scheduled.
+"""
+
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+
+from qkd_backend.qkd_runner.bb84_vectorized import sift
+from qkd_backend.qkd_runner.parameter_estimation import PE_EPSILON, decide, estimate
+from qkd_backend.qkd_runner.privacy_amplification import privacy_amplify
+from qkd_backend.qkd_runner.reconciliation import RECONCILERS, binary_entropy, reconcile
+
+DEFAULT_BLOCK_BITS = 1 << 16
+QUEUE_DEPTH = 4
+
+# Stream ids mixed into each block seed, one per randomized stage
+_ESTIMATE, _RECONCILE, _AMPLIFY = 1, 2, 3
+
+
+def _bits(block, name):
+    return np.unpackbits(block[name])[:block["n_bits"]]
+
+
+def _rng(block, stage):
+    return np.random.default_rng(list(block["seed"]) + [stage])
+
+
+def make_block(alice, bob, seed):
+    """Pack a pair of sifted keys into a pipeline block."""
+    alice = np.asarray(alice, dtype=np.uint8)
+    return {"alice": np.packbits(alice), "bob": np.packbits(np.asarray(bob, dtype=np.uint8)),
+            "n_bits": int(alice.size), "seed": seed}
+
+
+# --- Per-block stage functions ---
+def estimate_block(block, sample_fraction=0.0, max_qber=None, qber=None, qber_upper=None, epsilon=PE_EPSILON,
+                   bound="serfling"):
+    """
+    Estimate the QBER of a block.
+
+    With sample_fraction > 0 a random sample is disclosed and removed from
+    the key, and the abort decision uses the finite-key upper bound (see
+    parameter_estimation). With 0, every bit is compared and kept, as the
+    simulated experiments used to do. Both are marked aborted as
+    parameter_estimation.decide() rules; samples too small for a meaningful
+    bound are marked "insufficient_statistics". A known qber (e.g. the
+    shot-harvesting estimate), optionally with a bound in qber_upper, skips
+    the comparison; the block is marked "estimate" and aborts when the
+    bound (or the estimate itself) exceeds max_qber.
+    """
+    alice, bob = _bits(block, "alice"), _bits(block, "bob")
+    n = alice.size
+    if qber is None and sample_fraction > 0 and n:
+        keep, stats = estimate(alice, bob, sample_fraction, epsilon, max_qber, bound, _rng(block, _ESTIMATE))
+        block.update(alice=np.packbits(alice[keep]), bob=np.packbits(bob[keep]), n_bits=int(keep.sum()))
+        block["estimation"] = stats
+        qber, upper, status, aborted = stats["qber_observed"], stats["qber_upper"], stats["status"], stats["abort"]
+    elif qber is None:
+        qber = upper = float(np.count_nonzero(alice != bob)) / n if n else 0.0
+        status, aborted = decide(qber, upper, n, n, max_qber)
+    else:
+        upper = qber if qber_upper is None else qber_upper
+        status, aborted = "estimate", max_qber is not None and upper > max_qber
+    block["estimation_status"] = status
+    block["qber"] = float(qber)
+    block["qber_upper"] = float(upper)
+    block["aborted"] = bool(aborted)
+    return block
+
+
+def reconcile_block(block, method="cascade"):
+    """Correct Bob's key to Alice's and record the leaked parity bits."""
+    if block.get("aborted"):
+        return block
+    stats = reconcile(block["alice"], block["bob"], block["qber"], method=method,
+                      rng=_rng(block, _RECONCILE), n_bits=block["n_bits"])
+    block["bob"] = stats.pop("corrected")
+    block["leaked_bits"] = stats["leaked_bits"]
+    block["reconciliation"] = stats
+    return block
+
+
+def amplify_block(block):
+    """Compress Bob's reconciled key to its secure length, sized from the QBER upper bound."""
+    if block.get("aborted"):
+        return block
+    pa = privacy_amplify(block["bob"], block.get("qber_upper", block["qber"]), block.get("leaked_bits", 0),
+                         rng=_rng(block, _AMPLIFY), n_bits=block["n_bits"])
+    block["key"] = pa["key"]
+    block["key_bits"] = pa["key_bits"]
+    return block
+
+
+# --- Generator stages ---
+def sift_stage(raw_rounds, block_bits=DEFAULT_BLOCK_BITS, seed=None):
+    """
+    Sift raw rounds and re-cut the sifted bits into blocks of block_bits.
+
+    Args:
+        raw_rounds: Iterable of (abits, abase, bbase, bbits) arrays of any length
+        block_bits (int | None): Bits per emitted block; None emits one block per round
+        seed (int | None): Root seed; block i gets seed (seed, i)
+
+    Yields:
+        dict: Blocks with packed "alice"/"bob", "n_bits", "seed" and "match_count"
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+    index = 0
+    alice_buf, bob_buf = [], []
+    buffered = 0
+    for abits, abase, bbase, bbits in raw_rounds:
+        agood, bgood, _ = sift(abits, abase, bbase, bbits)
+        if block_bits is None:
+            block = make_block(agood, bgood, (seed, index))
+            block["match_count"] = int(np.count_nonzero(agood == bgood))
+            index += 1
+            yield block
+            continue
+        alice_buf.append(agood)
+        bob_buf.append(bgood)
+        buffered += agood.size
+        while buffered >= block_bits:
+            alice_all, bob_all = np.concatenate(alice_buf), np.concatenate(bob_buf)
+            block = make_block(alice_all[:block_bits], bob_all[:block_bits], (seed, index))
+            block["match_count"] = int(np.count_nonzero(alice_all[:block_bits] == bob_all[:block_bits]))
+            index += 1
+            alice_buf, bob_buf = [alice_all[block_bits:]], [bob_all[block_bits:]]
+            buffered -= block_bits
+            yield block
+    if block_bits is not None and buffered:
+        alice_all, bob_all = np.concatenate(alice_buf), np.concatenate(bob_buf)
+        block = make_block(alice_all, bob_all, (seed, index))
+        block["match_count"] = int(np.count_nonzero(alice_all == bob_all))
+        yield block
+
+
+def map_stage(fn, blocks, executor=None, max_in_flight=QUEUE_DEPTH, **kwargs):
+    """
+    Apply a per-block function, in order.
+
+    With an executor (thread or process pool) up to max_in_flight blocks
+    are processed concurrently.
+    """
+    if executor is None:
+        for block in blocks:
+            yield fn(block, **kwargs)
+        return
+    in_flight = deque()
+    for block in blocks:
+        in_flight.append(executor.submit(fn, block, **kwargs))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+_DONE = object()
+
+
+def threaded(blocks, maxsize=QUEUE_DEPTH):
+    """
+    Run an iterator on its own thread, handing blocks over a bounded queue.
+
+    Exceptions raised by the producer are re-raised in the consumer. When
+    the consumer is closed early the producer stops at its next hand-off
+    and closes its input, so an abandoned pipeline shuts down stage by
+    stage instead of leaving threads blocked on full queues.
+    """
+    handoff = queue.Queue(maxsize=maxsize)
+    closed = threading.Event()
+
+    def put(item):
+        while not closed.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for block in blocks:
+                if not put(block):
+                    return
+        except BaseException as e:
+            put(e)
+        else:
+            put(_DONE)
+        finally:
+            if hasattr(blocks, "close"):
+                blocks.close()
+
+    threading.Thread(target=produce, daemon=True, name="qkd-pipeline").start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        closed.set()
+
+
+def distill_stream(raw_rounds, block_bits=DEFAULT_BLOCK_BITS, seed=None, sample_fraction=0.0, max_qber=None,
+                   qber=None, qber_upper=None, epsilon=PE_EPSILON, bound="serfling", method="cascade",
+                   stages=("estimate", "reconcile", "amplify"), executor=None, threads=False):
+    """
+    Compose the pipeline over a stream of raw rounds.
+
+    Args:
+        stages: Which stages to run after sifting, in order
+        executor: Optional pool for the per-block stages
+        threads (bool): Run each stage on its own thread
+
+    Yields:
+        dict: Finished blocks
+
+    Raises:
+        ValueError: For an unknown reconciliation method, before any block runs
+    """
+    if "reconcile" in stages and method not in RECONCILERS:
+        raise ValueError(f"Unknown reconciliation method: {method}")
+    wrap = threaded if threads else (lambda it: it)
+    blocks = wrap(sift_stage(raw_rounds, block_bits, seed))
+    steps = {
+        "estimate": (estimate_block, {"sample_fraction": sample_fraction, "max_qber": max_qber, "qber": qber,
+                                      "qber_upper": qber_upper, "epsilon": epsilon, "bound": bound}),
+        "reconcile": (reconcile_block, {"method": method}),
+        "amplify": (amplify_block, {}),
+    }
+    for name in stages:
+        fn, kwargs = steps[name]
+        blocks = wrap(map_stage(fn, blocks, executor, **kwargs))
+    return blocks
+
+
+def distill(abits, abase, bbase, bbits, rng=None, block_bits=None, **kwargs):
+    """
+    Run one BB84 round through the pipeline and merge the blocks.
+
+    Args:
+        abits, abase, bbase, bbits: Raw round of any length
+        rng (np.random.Generator): Source of the root seed
+        block_bits (int | None): Block size; None keeps the round as one block
+        **kwargs: Passed to distill_stream
+
+    Returns:
+        dict: alice, bob (sifted), kept_alice, kept_bob (undisclosed after
+        estimation; Bob's reconciled if that stage ran), corrected, key
+        (0/1 uint8 arrays), match_count, qber, qber_upper, aborted, and
+        estimation_status ("ok", "insufficient_statistics" or "estimate", None without
+        estimation), and estimation / reconciliation / privacy_amplification
+        stats when those ran
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    seed = int(rng.integers(0, 2**63))
+    raw = [(abits, abase, bbase, bbits)]
+    sifted_alice, sifted_bob = sift(abits, abase, bbase, bbits)[:2]
+    blocks = list(distill_stream(raw, block_bits=block_bits, seed=seed, **kwargs))
+
+    def joined(arrays):
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.uint8)
+
+    n = sum(b["n_bits"] for b in blocks)
+    estimated = [b for b in blocks if "qber" in b]
+    done = [b for b in blocks if not b.get("aborted")]
+    kept_bob = joined([_bits(b, "bob") for b in blocks])
+    key = joined([np.unpackbits(b["key"])[:b["key_bits"]] for b in done if "key" in b])
+    if kwargs.get("qber") is not None:
+        qber = kwargs["qber"]
+    else:
+        sampled = [b["estimation"] for b in estimated if "estimation" in b]
+        if sampled:
+            k = sum(e["sampled_bits"] for e in sampled)
+            qber = sum(e["errors"] for e in sampled) / k if k else 0.0
+        else:
+            qber = sum(b["qber"] * b["n_bits"] for b in estimated) / n if n and estimated else 0.0
+    summary = {
+        "alice": sifted_alice,
+        "bob": sifted_bob,
+        "kept_alice": joined([_bits(b, "alice") for b in blocks]),
+        "kept_bob": kept_bob,
+        "corrected": kept_bob,
+        "key": key,
+        "match_count": sum(b["match_count"] for b in blocks),
+        "qber": qber,
+        "qber_upper": max((b["qber_upper"] for b in estimated), default=qber),
+        "aborted": any(b.get("aborted") for b in blocks),
+        "estimation_status": None,
+        "blocks": len(blocks),
+    }
+    if estimated:
+        statuses = {b["estimation_status"] for b in estimated}
+        summary["estimation_status"] = next(
+            (s for s in ("insufficient_statistics", "estimate") if s in statuses), "ok"
+        )
+    sampled = [b["estimation"] for b in blocks if "estimation" in b]
+    if sampled:
+        summary["estimation"] = {
+            "sampled_bits": sum(e["sampled_bits"] for e in sampled),
+            "kept_bits": sum(e["kept_bits"] for e in sampled),
+            "errors": sum(e["errors"] for e in sampled),
+            "qber_observed": qber,
+            "qber_upper": summary["qber_upper"],
+            "epsilon": sampled[0]["epsilon"],
+            "method": sampled[0]["method"],
+            "status": summary["estimation_status"],
+            "abort": summary["aborted"],
+        }
+    if any("reconciliation" in b for b in done):
+        leaked = sum(b.get("leaked_bits", 0) for b in done)
+        h = binary_entropy(qber)
+        summary["reconciliation"] = {
+            "method": kwargs.get("method", "cascade"),
+            "leaked_bits": int(leaked),
+            "efficiency": leaked / (n * h) if n and h else None,
+            "errors_corrected": sum(b["reconciliation"]["errors_corrected"] for b in done),
+            "residual_errors": sum(b["reconciliation"]["residual_errors"] for b in done),
+        }
+    if any("key" in b for b in done):
+        summary["privacy_amplification"] = {
+            "key_bits": int(key.size),
+            "input_bits": int(n),
+            "compression": key.size / n if n else 0.0,
+        }
+    return summary
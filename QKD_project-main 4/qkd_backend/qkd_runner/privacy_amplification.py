@@ -0,0 +1,97 @@
+# qkd_backend/qkd_runner/privacy_amplification.py
+"""
+Privacy amplification by two-universal Toeplitz hashing.
+
+The reconciled key x (n bits) is compressed to l bits with a random
+l x n Toeplitz matrix T, T[i, j] = seed[i - j + n - 1]. T x is a slice of
+the convolution seed * x, computed with real FFTs of length >= n + l - 1
+(O(n log n) instead of the O(n l) matrix product). The output length l
+follows from the QBER and the bits leaked during reconciliation.
+"""
+
+import numpy as np
+from scipy import fft as sp_fft
+
+from qkd_backend.qkd_runner.reconciliation import binary_entropy
+
+# Failure probabilities of privacy amplification and of error verification
+EPSILON_PA = 1e-10
+EPSILON_EC = 1e-10
+
+
+def secure_key_length(n, qber, leaked_bits, epsilon_pa=EPSILON_PA, epsilon_ec=EPSILON_EC):
+    """
+    Extractable key length for n reconciled bits.
+
+    l = n (1 - h(qber)) - leaked - log2(2 / eps_ec) - 2 log2(1 / eps_pa),
+    using the QBER as the phase-error rate (BB84 with symmetric bases).
+
+    Returns:
+        int: l, never negative
+    """
+    if n <= 0:
+        return 0
+    length = n * (1 - binary_entropy(qber)) - leaked_bits \
+        - np.log2(2 / epsilon_ec) - 2 * np.log2(1 / epsilon_pa)
+    return max(0, int(np.floor(length)))
+
+
+def toeplitz_hash(key_bits, out_len, seed_bits):
+    """
+    T x mod 2 for the Toeplitz matrix defined by seed_bits.
+
+    Args:
+        key_bits (np.ndarray): 0/1 array of length n
+        out_len (int): Output length l
+        seed_bits (np.ndarray): 0/1 array of length n + l - 1
+
+    Returns:
+        np.ndarray: uint8 0/1 array of length l
+    """
+    n = key_bits.size
+    if out_len <= 0 or n == 0:
+        return np.zeros(0, dtype=np.uint8)
+    if seed_bits.size != n + out_len - 1:
+        raise ValueError(f"Toeplitz seed must have {n + out_len - 1} bits, got {seed_bits.size}")
+    # Circular convolution of any size >= n + l - 1 does not alias into
+    # indices n-1 .. n+l-2; next_fast_len picks a 5-smooth size near it
+    size = sp_fft.next_fast_len(n + out_len - 1, real=True)
+    spectrum = sp_fft.rfft(seed_bits.astype(np.float64), size, workers=-1)
+    spectrum *= sp_fft.rfft(key_bits.astype(np.float64), size, workers=-1)
+    conv = sp_fft.irfft(spectrum, size, workers=-1)
+    window = conv[n - 1:n - 1 + out_len]
+    return (np.rint(window).astype(np.int64) & 1).astype(np.uint8)
+
+
+def privacy_amplify(key_bits, qber, leaked_bits, rng=None, n_bits=None,
+                    epsilon_pa=EPSILON_PA, epsilon_ec=EPSILON_EC):
+    """
+    Compress a reconciled key to its secure length.
+
+    Args:
+        key_bits: Reconciled key (0/1 array, or packed with n_bits)
+        qber (float): Estimated QBER
+        leaked_bits (int): Bits disclosed during reconciliation
+        rng (np.random.Generator): Public randomness for the Toeplitz seed
+        n_bits (int | None): Key length when key_bits is packed
+
+    Returns:
+        dict: key (packed uint8 array), key_bits (l), input_bits (n),
+        compression (l / n), seed (packed Toeplitz seed)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    if n_bits is not None:
+        bits = np.unpackbits(np.asarray(key_bits, dtype=np.uint8))[:n_bits]
+    else:
+        bits = np.asarray(key_bits, dtype=np.uint8).ravel()
+    n = bits.size
+    out_len = secure_key_length(n, qber, leaked_bits, epsilon_pa, epsilon_ec)
+    seed = rng.integers(0, 2, n + out_len - 1 if out_len else 0, dtype=np.uint8)
+    final = toeplitz_hash(bits, out_len, seed)
+    return {
+        "key": np.packbits(final),
+        "key_bits": out_len,
+        "input_bits": n,
+        "compression": out_len / n if n else 0.0,
+        "seed": np.packbits(seed),
+    }
@@ -0,0 +1,357 @@
+# qkd_backend/qkd_runner/reconciliation.py
+"""
+Information reconciliation for sifted BB84 keys.
+
+Two engines, both on NumPy bit arrays (0/1 uint8, or np.packbits output
+when n_bits is given):
+
+- cascade: Cascade with the first block size chosen from the estimated
+  QBER and doubled every pass. All mismatched blocks of a pass are
+  binary-searched in parallel using prefix parities, and flipped bits are
+  cascaded back into earlier passes until every block parity agrees.
+- ldpc: Alice sends the syndrome of a random low-density parity-check code
+  and Bob decodes his key against it with normalized min-sum belief
+  propagation, all frames at once. Frames that never decode fall back
+  to Cascade.
+
+Both return a stats dict with the corrected key, leaked_bits and the
+reconciliation efficiency f = leaked / (n * h(qber)).
+"""
+
+import numpy as np
+
+CASCADE_PASSES = 4
+# Smallest QBER used to size Cascade blocks and LDPC codes, so a clean
+# channel still gets finite blocks / a non-empty syndrome
+MIN_QBER = 0.01
+
+LDPC_FRAME_SIZE = 4096
+LDPC_COLUMN_WEIGHT = 3
+LDPC_TARGET_EFFICIENCY = 1.5
+# Rate adaptation for frames that fail to decode
+LDPC_EFFICIENCY_STEP = 0.3
+LDPC_MAX_EFFICIENCY = 3.0
+LDPC_MAX_ITERATIONS = 50
+MIN_SUM_SCALE = 0.8
+# Magnitude used for bits that are known with certainty
+MAX_LLR = 1e3
+
+
+def binary_entropy(p):
+    """h(p) in bits; 0 at p = 0 or 1."""
+    p = float(p)
+    if p <= 0 or p >= 1:
+        return 0.0
+    return float(-p * np.log2(p) - (1 - p) * np.log2(1 - p))
+
+
+def _as_bits(bits, n_bits=None):
+    if n_bits is not None:
+        return np.unpackbits(np.asarray(bits, dtype=np.uint8))[:n_bits].copy()
+    return np.asarray(bits, dtype=np.uint8).ravel().copy()
+
+
+def _output(bits, n_bits):
+    return np.packbits(bits) if n_bits is not None else bits
+
+
+def _efficiency(leaked, n, qber):
+    """leaked / (n h(qber)); None on an error-free key, where it is undefined."""
+    h = binary_entropy(qber)
+    return leaked / (n * h) if n and h else None
+
+
+def _prefix_parity(bits):
+    """P[i] = parity of bits[:i], length n + 1."""
+    prefix = np.zeros(bits.size + 1, dtype=np.uint8)
+    np.bitwise_xor.accumulate(bits, out=prefix[1:])
+    return prefix
+
+
+# --- Cascade ---
+def cascade_block_sizes(qber, n, passes=CASCADE_PASSES):
+    """Block size per pass: k1 = 0.73 / qber, doubled each pass, capped at n."""
+    k1 = max(2, int(np.ceil(0.73 / max(qber, MIN_QBER))))
+    return [max(1, min(k1 << i, n)) for i in range(passes)]
+
+
+def _binary_search(alice_prefix, bob_perm, starts, stops):
+    """
+    Locate one error in each [start, stop) block with odd parity difference.
+
+    All blocks are halved in lockstep; both prefix arrays stay valid for the
+    whole search because at most one bit per block is flipped, at the end.
+
+    Returns:
+        tuple: (error positions in permuted order, parity bits disclosed)
+    """
+    bob_prefix = _prefix_parity(bob_perm)
+    lo, hi = starts.copy(), stops.copy()
+    leaked = 0
+    active = hi - lo > 1
+    while active.any():
+        idx = np.flatnonzero(active)
+        mid = (lo[idx] + hi[idx]) // 2
+        a = alice_prefix[mid] ^ alice_prefix[lo[idx]]
+        b = bob_prefix[mid] ^ bob_prefix[lo[idx]]
+        leaked += idx.size
+        left = a != b
+        hi[idx[left]] = mid[left]
+        lo[idx[~left]] = mid[~left]
+        active = hi - lo > 1
+    return lo, leaked
+
+
+def cascade(alice_bits, bob_bits, qber, passes=CASCADE_PASSES, rng=None, n_bits=None):
+    """
+    Reconcile Bob's key to Alice's with Cascade.
+
+    Args:
+        alice_bits, bob_bits: Sifted keys (0/1 arrays, or packed with n_bits)
+        qber (float): Estimated QBER, used to size the first-pass blocks
+        passes (int): Number of Cascade passes
+        rng (np.random.Generator): Public randomness for the pass permutations
+        n_bits (int | None): Key length when the inputs are packed
+
+    Returns:
+        dict: corrected key (same form as the input), leaked_bits, efficiency,
+        errors_corrected, block_sizes, residual_errors
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    alice = _as_bits(alice_bits, n_bits)
+    bob = _as_bits(bob_bits, n_bits)
+    n = alice.size
+    if bob.size != n:
+        raise ValueError("Alice and Bob keys must have the same length")
+    if n == 0:
+        return {"corrected": _output(bob, n_bits), "leaked_bits": 0, "efficiency": None,
+                "errors_corrected": 0, "block_sizes": [], "residual_errors": 0}
+
+    initial_errors = int(np.count_nonzero(alice != bob))
+    sizes = cascade_block_sizes(qber, n, passes)
+    perms, bounds, alice_prefixes, alice_parities = [], [], [], []
+    leaked = 0
+    flipped = 0
+
+    for i, k in enumerate(sizes):
+        perm = np.arange(n) if i == 0 else rng.permutation(n)
+        perms.append(perm)
+        starts = np.arange(0, n, k)
+        bounds.append((starts, np.minimum(starts + k, n)))
+        prefix = _prefix_parity(alice[perm])
+        alice_prefixes.append(prefix)
+        alice_parities.append(prefix[bounds[-1][1]] ^ prefix[starts])
+        leaked += starts.size  # Alice announces every block parity once
+
+        # Correct this pass, then cascade flips back through earlier passes
+        while True:
+            progress = False
+            for j in range(i + 1):
+                starts_j, stops_j = bounds[j]
+                bob_perm = bob[perms[j]]
+                bob_prefix = _prefix_parity(bob_perm)
+                bad = np.flatnonzero((bob_prefix[stops_j] ^ bob_prefix[starts_j]) != alice_parities[j])
+                if bad.size == 0:
+                    continue
+                pos, search_leak = _binary_search(alice_prefixes[j], bob_perm, starts_j[bad], stops_j[bad])
+                leaked += search_leak
+                bob[perms[j][pos]] ^= 1
+                flipped += pos.size
+                progress = True
+            if not progress:
+                break
+
+    residual = int(np.count_nonzero(alice != bob))
+    return {
+        "corrected": _output(bob, n_bits),
+        "leaked_bits": int(leaked),
+        "efficiency": _efficiency(leaked, n, initial_errors / n),
+        "errors_corrected": int(flipped),
+        "block_sizes": sizes,
+        "residual_errors": residual,
+    }
+
+
+# --- LDPC ---
+def ldpc_parity_check(n, m, column_weight=LDPC_COLUMN_WEIGHT, rng=None):
+    """
+    Random parity-check matrix with `column_weight` ones per column.
+
+    Sockets are dealt to checks round-robin and shuffled, so check degrees
+    differ by at most one; duplicate edges are dropped.
+
+    Returns:
+        tuple: (var, chk) edge index arrays, sorted by check
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    var = np.repeat(np.arange(n), column_weight)
+    chk = rng.permutation(np.arange(var.size) % m)
+    edges = np.unique(chk.astype(np.int64) * n + var)
+    return edges % n, edges // n
+
+
+def _check_starts(chk):
+    """Offsets of each check's run of edges (edges are sorted by check) and the check ids."""
+    starts = np.flatnonzero(np.r_[True, chk[1:] != chk[:-1]])
+    return starts, chk[starts]
+
+
+def _syndrome(bits, var, chk, m):
+    """H x mod 2 for a batch of words, shape (frames, n) -> (frames, m)."""
+    starts, ids = _check_starts(chk)
+    out = np.zeros((bits.shape[0], m), dtype=np.uint8)
+    out[:, ids] = np.bitwise_xor.reduceat(bits[:, var], starts, axis=1)
+    return out
+
+
+def _min_sum(llr, syndrome, var, chk, m, max_iterations):
+    """
+    Normalized min-sum decoding of a batch of frames that share one code.
+
+    Frames drop out of the working set as soon as their syndrome matches.
+
+    Returns:
+        tuple: (hard decisions (frames, n), converged flags, iterations run)
+    """
+    check_starts, _ = _check_starts(chk)
+    by_var = np.argsort(var, kind='stable')
+    var_starts = np.flatnonzero(np.r_[True, var[by_var][1:] != var[by_var][:-1]])
+    var_ids = var[by_var][var_starts]
+    edge_check = np.repeat(np.arange(check_starts.size), np.diff(np.r_[check_starts, var.size]))
+
+    decided = (llr < 0).astype(np.uint8)
+    converged = (_syndrome(decided, var, chk, m) == syndrome).all(axis=1)
+    active = np.flatnonzero(~converged)
+    prior = llr[active].astype(np.float32)
+    totals = prior
+    syn_sign = (1 - 2 * syndrome[active][:, chk].astype(np.int8)).astype(np.float32)
+    c2v = np.zeros((active.size, var.size), dtype=np.float32)
+    iteration = 0
+    while iteration < max_iterations and active.size:
+        iteration += 1
+        v2c = totals[:, var] - c2v
+
+        # Check update: sign product and the two smallest magnitudes per check
+        mag = np.abs(v2c)
+        neg = (v2c < 0).astype(np.uint8)
+        neg_parity = np.bitwise_xor.reduceat(neg, check_starts, axis=1)
+        min1 = np.minimum.reduceat(mag, check_starts, axis=1)
+        min1_edge = min1[:, edge_check]
+        is_min = mag == min1_edge
+        min2 = np.minimum.reduceat(np.where(is_min, np.float32(np.inf), mag), check_starts, axis=1)
+        # Ties: a second edge equal to min1 makes min2 == min1
+        ties = np.add.reduceat(is_min.astype(np.uint8), check_starts, axis=1) > 1
+        # A degree-1 check has no other edge: its message is just the syndrome bit
+        min2 = np.minimum(np.where(ties, min1, min2), np.float32(MAX_LLR))
+        other_min = np.where(is_min, min2[:, edge_check], min1_edge)
+        sign = (1 - 2 * (neg_parity[:, edge_check] ^ neg).astype(np.int8)) * syn_sign
+        c2v = np.float32(MIN_SUM_SCALE) * sign * other_min
+
+        totals = prior.copy()
+        totals[:, var_ids] += np.add.reduceat(c2v[:, by_var], var_starts, axis=1)
+        hard = (totals < 0).astype(np.uint8)
+        done = (_syndrome(hard, var, chk, m) == syndrome[active]).all(axis=1)
+        decided[active] = hard
+        if done.any():
+            converged[active[done]] = True
+            keep = ~done
+            active, prior, totals, syn_sign, c2v = active[keep], prior[keep], totals[keep], syn_sign[keep], c2v[keep]
+    return decided, converged, iteration
+
+
+def ldpc(alice_bits, bob_bits, qber, frame_size=LDPC_FRAME_SIZE, efficiency=LDPC_TARGET_EFFICIENCY,
+         column_weight=LDPC_COLUMN_WEIGHT, max_iterations=LDPC_MAX_ITERATIONS, rng=None, n_bits=None):
+    """
+    Reconcile Bob's key to Alice's with LDPC syndrome decoding.
+
+    The key is cut into frames of frame_size bits (the last one is padded
+    with known zeros). Alice discloses m = efficiency * h(qber) * frame_size
+    syndrome bits per frame. Frames that fail to decode are retried with a
+    fresh, lower-rate code (efficiency raised by LDPC_EFFICIENCY_STEP) up to
+    LDPC_MAX_EFFICIENCY; every syndrome sent counts as leaked. Frames that
+    still fail are reported in failed_frames and handed to Cascade, whose
+    parities are added to leaked_bits, so the output matches Alice's key.
+
+    Returns:
+        dict: corrected key, leaked_bits, efficiency, errors_corrected,
+        iterations, attempts, failed_frames, fallback_leaked_bits, residual_errors
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    alice = _as_bits(alice_bits, n_bits)
+    bob = _as_bits(bob_bits, n_bits)
+    n = alice.size
+    if bob.size != n:
+        raise ValueError("Alice and Bob keys must have the same length")
+    if n == 0:
+        return {"corrected": _output(bob, n_bits), "leaked_bits": 0, "efficiency": None, "errors_corrected": 0,
+                "iterations": 0, "attempts": 0, "failed_frames": 0, "fallback_leaked_bits": 0,
+                "residual_errors": 0}
+
+    q = min(max(qber, MIN_QBER), 0.5 - 1e-9)
+    frame = min(frame_size, n)
+    frames = -(-n // frame)
+    pad = frames * frame - n
+    a = np.concatenate([alice, np.zeros(pad, dtype=np.uint8)]).reshape(frames, frame)
+    b = np.concatenate([bob, np.zeros(pad, dtype=np.uint8)]).reshape(frames, frame)
+    llr = np.log((1 - q) / q) * (1.0 - 2.0 * b)
+    if pad:
+        # Padding bits are known to both sides
+        llr[-1, frame - pad:] = MAX_LLR
+
+    corrected = b.copy()
+    pending = np.arange(frames)
+    leaked = 0
+    iterations = 0
+    attempts = 0
+    f = efficiency
+    while pending.size and f <= LDPC_MAX_EFFICIENCY + 1e-9:
+        attempts += 1
+        m = min(frame, max(1, int(np.ceil(f * binary_entropy(q) * frame))))
+        var, chk = ldpc_parity_check(frame, m, column_weight, rng)
+        syndrome = _syndrome(a[pending], var, chk, m)
+        leaked += pending.size * m
+        decided, converged, its = _min_sum(llr[pending], syndrome, var, chk, m, max_iterations)
+        iterations += its
+        corrected[pending[converged]] = decided[converged]
+        pending = pending[~converged]
+        f += LDPC_EFFICIENCY_STEP
+
+    # Undecoded frames fall back to Cascade (the padding agrees on both sides)
+    fallback_leaked = 0
+    if pending.size:
+        fallback = cascade(a[pending].ravel(), corrected[pending].ravel(), qber, rng=rng)
+        corrected[pending] = fallback["corrected"].reshape(pending.size, frame)
+        fallback_leaked = fallback["leaked_bits"]
+        leaked += fallback_leaked
+
+    corrected = corrected.ravel()[:n]
+    return {
+        "corrected": _output(corrected, n_bits),
+        "leaked_bits": int(leaked),
+        "efficiency": _efficiency(leaked, n, np.count_nonzero(alice != bob) / n),
+        "errors_corrected": int(np.count_nonzero(corrected != bob)),
+        "iterations": int(iterations),
+        "attempts": attempts,
+        "failed_frames": int(pending.size),
+        "fallback_leaked_bits": int(fallback_leaked),
+        "residual_errors": int(np.count_nonzero(corrected != alice)),
+    }
+
+
+RECONCILERS = {"cascade": cascade, "ldpc": ldpc}
+
+
+def reconcile(alice_bits, bob_bits, qber, method="cascade", **kwargs):
+    """
+    Run the named reconciliation engine.
+
+    Raises:
+        ValueError: For an unknown method
+    """
+    try:
+        engine = RECONCILERS[method]
+    except KeyError:
+        raise ValueError(f"Unknown reconciliation method: {method}") from None
+    stats = engine(alice_bits, bob_bits, qber, **kwargs)
+    stats["method"] = method
+    return stats
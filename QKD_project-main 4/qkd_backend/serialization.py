@@ -0,0 +1,133 @@
+# Compact result encodings
+"""
+Compact wire formats for experiment results.
+
+Runner results carry their bit arrays (Sender_bits, agoodbits, ...) as
+JSON lists and the full measurement counts, so at large key lengths a
+response is mostly brackets, commas and rare bitstrings. compact() packs
+each bit array 8 bits per byte and keeps only the most frequent
+measurement outcomes. The format is picked from the Accept header:
+
+    application/json                  the result as is (default)
+    application/vnd.qkd.compact+json  compact, packed bits as base64
+    application/msgpack               compact, packed bits as raw bytes
+
+MessagePack needs the optional msgpack package and is only offered when
+it is installed. A packed array is {"bitpacked": data, "length": n};
+np.unpackbits(data)[:n] restores it. Compact counts are
+{"top": {bitstring: shots}, "other_shots": ..., "outcomes": ..., "shots": ...}.
+"""
+
+import base64
+import json
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+COMPACT_JSON = "application/vnd.qkd.compact+json"
+MSGPACK = "application/msgpack"
+X_MSGPACK = "application/x-msgpack"
+
+# Measurement outcomes kept per counts dict in compact results
+COUNTS_TOP = 32
+
+# 0/1 arrays of the runner results (exp_simple uses the short names)
+BIT_FIELDS = frozenset({
+    "Sender_bits", "Sender_bases", "Receiver_bases", "Receiver_bits",
+    "Eve_bases", "Eve_bits", "Eve_intercepted", "eve_bases", "eve_bits",
+    "agoodbits", "bgoodbits", "abits", "abase", "bbase", "bbits",
+})
+COUNTS_FIELDS = frozenset({"counts", "counts_eve", "counts_bob"})
+
+
+def media_types():
+    """Media types results can be encoded as, in order of preference."""
+    return [JSON, COMPACT_JSON] + ([MSGPACK, X_MSGPACK] if msgpack is not None else [])
+
+
+def negotiate(accept):
+    """
+    Pick the media type for a result.
+
+    Args:
+        accept: Werkzeug MIMEAccept of the request (falsy when no Accept header)
+
+    Returns:
+        str | None: Media type to encode with, None if nothing acceptable is offered
+    """
+    if not accept:
+        return JSON
+    return accept.best_match(media_types())
+
+
+def pack_bits(values, binary=False):
+    """
+    Bit-pack a 0/1 sequence.
+
+    Returns:
+        dict | None: {"bitpacked", "length"}, data as bytes if binary else
+        base64 text; None if the values are not all 0 or 1
+    """
+    try:
+        bits = np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return None
+    if bits.ndim != 1 or not np.all((bits == 0) | (bits == 1)):
+        return None
+    data = np.packbits(bits.astype(np.uint8)).tobytes()
+    return {"bitpacked": data if binary else base64.b64encode(data).decode("ascii"), "length": int(bits.size)}
+
+
+def compact_counts(counts, top=COUNTS_TOP):
+    """The top most frequent outcomes of a counts dict, plus totals for the rest."""
+    ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    kept = dict(ranked[:top])
+    shots = sum(counts.values())
+    return {
+        "top": kept,
+        "other_shots": shots - sum(kept.values()),
+        "outcomes": len(counts),
+        "shots": shots,
+    }
+
+
+def table_columns(table):
+    """Column-oriented dict of a structured array (sweep and optimizer tables), for JSON responses."""
+    return {name: table[name].tolist() for name in table.dtype.names}
+
+
+def compact(result, binary=False, top=COUNTS_TOP):
+    """
+    Compact form of a result: packed bit arrays and truncated counts.
+
+    Nested dicts and lists (e.g. run_exp3_batch's sessions) are compacted
+    too; everything else is returned unchanged.
+    """
+    if isinstance(result, list):
+        return [compact(item, binary, top) for item in result]
+    if not isinstance(result, dict):
+        return result
+    out = {}
+    for name, value in result.items():
+        packed = pack_bits(value, binary) if name in BIT_FIELDS and isinstance(value, list) else None
+        if packed is not None:
+            out[name] = packed
+        elif name in COUNTS_FIELDS and isinstance(value, dict):
+            out[name] = compact_counts(value, top)
+        else:
+            out[name] = compact(value, binary, top)
+    return out
+
+
+def encode(result, media_type):
+    """Serialize a result as one of the compact media types."""
+    if media_type == COMPACT_JSON:
+        return json.dumps(compact(result), separators=(",", ":")).encode("utf-8")
+    if media_type in (MSGPACK, X_MSGPACK) and msgpack is not None:
+        return msgpack.packb(compact(result, binary=True), use_bin_type=True)
+    raise ValueError(f"Unsupported media type: {media_type}")
@@ -0,0 +1,132 @@
+# Transpilation cache for hardware (ISA) circuits
+"""
+LRU cache of transpiled ISA circuits and preset pass managers.
+
+Circuits are keyed by backend and circuit structure (gate names, operands
+and parameters), so a structurally identical circuit is only transpiled
+once per backend. Parameterized templates (see batching.bb84_template)
+always hit after the first run because their structure never changes.
+"""
+
+import threading
+from collections import OrderedDict
+
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+
+DEFAULT_MAXSIZE = 256
+
+
+def _backend_key(backend, optimization_level):
+    return (getattr(backend, 'name', type(backend).__name__), optimization_level)
+
+
+def circuit_key(qc):
+    """Structural key of a circuit: width plus every instruction's name, operands and parameters."""
+    ops = tuple(
+        (
+            inst.operation.name,
+            tuple(qc.find_bit(q).index for q in inst.qubits),
+            tuple(qc.find_bit(c).index for c in inst.clbits),
+            tuple(str(p) for p in inst.operation.params),
+        )
+        for inst in qc.data
+    )
+    return (qc.num_qubits, qc.num_clbits, ops)
+
+
+class TranspileCache:
+    """Thread-safe LRU cache of ISA circuits with hit/miss counters."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._circuits = OrderedDict()
+        self._pass_managers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def pass_manager(self, backend, optimization_level=3):
+        """Preset pass manager for the backend target, built once per backend."""
+        key = _backend_key(backend, optimization_level)
+        with self._lock:
+            pm = self._pass_managers.get(key)
+        if pm is None:
+            pm = generate_preset_pass_manager(target=backend.target, optimization_level=optimization_level)
+            with self._lock:
+                pm = self._pass_managers.setdefault(key, pm)
+        return pm
+
+    def run(self, backend, circuits, optimization_level=3):
+        """
+        Transpile circuits for backend, reusing cached ISA circuits.
+
+        Args:
+            backend: Backend whose target the circuits are compiled for
+            circuits (list[QuantumCircuit]): Logical circuits
+            optimization_level (int): Preset pass manager level
+
+        Returns:
+            list[QuantumCircuit]: ISA circuits in the same order (shared; do not mutate)
+        """
+        backend_key = _backend_key(backend, optimization_level)
+        keys = [(backend_key, circuit_key(qc)) for qc in circuits]
+        isa = [None] * len(circuits)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._circuits.get(key)
+                if cached is not None:
+                    self._circuits.move_to_end(key)
+                    isa[i] = cached
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            pm = self.pass_manager(backend, optimization_level)
+            todo = list(missing.items())
+            compiled = pm.run([circuits[indices[0]] for _, indices in todo])
+            with self._lock:
+                for (key, indices), qc_isa in zip(todo, compiled):
+                    self._circuits[key] = qc_isa
+                    self._circuits.move_to_end(key)
+                    for i in indices:
+                        isa[i] = qc_isa
+                while len(self._circuits) > self.maxsize:
+                    self._circuits.popitem(last=False)
+        return isa
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._circuits),
+                "maxsize": self.maxsize,
+                "pass_managers": len(self._pass_managers),
+            }
+
+    def clear(self):
+        """Drop all cached circuits and pass managers and reset the counters."""
+        with self._lock:
+            self._circuits.clear()
+            self._pass_managers.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_cache = TranspileCache()
+
+
+def get_transpile_cache():
+    """Process-wide transpile cache."""
+    return _cache
+
+
+def transpile(backend, circuits, optimization_level=3):
+    """Transpile a list of circuits through the process-wide cache."""
+    return _cache.run(backend, circuits, optimization_level)
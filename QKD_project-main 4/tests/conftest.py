@@ -0,0 +1,7 @@
+# tests/conftest.py
+"""Make the project root importable, as app.py sees it when run from there."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
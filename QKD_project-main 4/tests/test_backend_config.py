@@ -0,0 +1,37 @@
+# tests/test_backend_config.py
+from qiskit_aer import AerSimulator
+
+from qkd_backend import backend_config
+from qkd_backend.clifford_sampler import CliffordSampler
+from qkd_backend.qkd_runner import exp1
+
+
+def test_unseeded_sampler_is_shared():
+    registry = backend_config.BackendRegistry()
+    simulator = AerSimulator()
+    assert registry.sampler(simulator) is registry.sampler(simulator)
+
+
+def test_seeded_samplers_share_the_simulator_sampler():
+    registry = backend_config.BackendRegistry()
+    simulator = AerSimulator()
+    first, second = registry.sampler(simulator, 7), registry.sampler(simulator, 7)
+    assert isinstance(first, CliffordSampler) and first is not second
+    assert first.fallback is second.fallback
+    assert registry.sampler(simulator, 8).fallback is not first.fallback
+
+
+def test_seeded_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(backend_config, "MAX_CACHED_SAMPLERS", 4)
+    registry = backend_config.BackendRegistry()
+    simulator = AerSimulator()
+    for seed in range(10):
+        registry.sampler(simulator, seed)
+    assert len(registry._samplers) == 4
+
+
+def test_seeded_runs_repeat_exactly():
+    runs = [exp1.run_exp1(bit_num=24, shots=64, rng_seed=11, draw_diagram=False, harvest_shots=True)
+            for _ in range(2)]
+    assert runs[0]["counts"] == runs[1]["counts"]
+    assert runs[0]["Receiver_bits"] == runs[1]["Receiver_bits"]
@@ -0,0 +1,54 @@
+# tests/test_decoy.py
+import numpy as np
+import pytest
+
+from qkd_backend import decoy
+from qkd_backend.keyrate import transmittance
+
+
+@pytest.mark.parametrize("distance", [0, 50, 100])
+def test_bounds_bracket_the_true_single_photon_statistics(distance):
+    params = {**decoy.DECOY_DEFAULTS, "n_pulses": None}
+    stats = decoy.decoy_rate(distance, 0.5, 0.1, 0.5, 0.25, **params)
+    eta = params["eta_det"] * transmittance(distance, params["alpha"])
+    y0 = params["dark"] / params["rep_rate"]
+    y1 = y0 + eta - y0 * eta
+    e1 = (decoy.E0 * y0 + params["e_det"] * eta) / y1
+    assert 0 < stats["y1_lower"] <= y1
+    assert stats["e1_upper"] >= e1 - 1e-12
+
+
+def test_finite_pulses_cost_key_rate():
+    asymptotic = decoy.decoy_rate(50, 0.5, 0.1, 0.5, 0.25, n_pulses=None)["key_rate"]
+    finite = decoy.decoy_rate(50, 0.5, 0.1, 0.5, 0.25, n_pulses=1e9)["key_rate"]
+    assert 0 < finite < asymptotic
+
+
+def test_infeasible_settings_have_no_rate():
+    assert decoy.decoy_rate(10, 0.1, 0.5, 0.5, 0.25)["key_rate"] == 0
+
+
+def test_optimum_beats_a_fixed_setting_and_decays_with_distance():
+    rows = decoy.optimize([10, 60], executor=None, max_workers=1)
+    assert rows["key_rate"][0] > rows["key_rate"][1] > 0
+    fixed = decoy.decoy_rate(10, 0.5, 0.1, 0.5, 0.25)["key_rate"]
+    assert rows["key_rate"][0] >= fixed
+
+
+def test_validate_params_accepts_asymptotic_pulses():
+    assert decoy.validate_params({"n_pulses": None, "u": 3}) == {"n_pulses": None, "u": 3.0}
+
+
+@pytest.mark.parametrize("params", [
+    {"u": None}, {"u": -1}, {"eta_det": 0}, {"eta_det": 1.5}, {"e_det": 0.6}, {"f_ec": 0.9},
+    {"rep_rate": 0}, {"alpha": float("inf")}, {"dark": "100"}, {"u": True}, {"bogus": 1},
+])
+def test_decoy_route_rejects_bad_params(params):
+    from app import app
+    assert app.test_client().post("/keyrate/decoy", json={"params": params}).status_code == 400
+
+
+@pytest.mark.parametrize("distances", [[-1], [float("nan")], []])
+def test_decoy_route_rejects_bad_distances(distances):
+    from app import app
+    assert app.test_client().post("/keyrate/decoy", json={"distances": distances}).status_code == 400
@@ -0,0 +1,43 @@
+# tests/test_diagrams.py
+import threading
+
+from qiskit import QuantumCircuit
+
+from qkd_backend import diagrams
+
+
+def _circuit(n):
+    qc = QuantumCircuit(n)
+    qc.h(range(n))
+    qc.measure_all()
+    return qc
+
+
+def test_render_times_out_without_raising(monkeypatch, tmp_path):
+    monkeypatch.setattr(diagrams, "DIAGRAM_DIR", str(tmp_path))
+    release = threading.Event()
+    # Occupy the single drawing worker so the next drawing stays queued
+    blocker = diagrams._executor.submit(release.wait)
+    try:
+        digest = diagrams.register_circuit(_circuit(3)).rsplit("/", 1)[1][:-4]
+        assert diagrams.render(digest, timeout=0.05) is None
+        # The queued drawing was cancelled, but the circuit is still registered
+        assert diagrams.is_known(digest)
+    finally:
+        release.set()
+        blocker.result()
+    assert diagrams.render(digest).endswith(f"{digest}.png")
+
+
+def test_route_answers_503_while_drawing(monkeypatch):
+    monkeypatch.setattr(diagrams, "render", lambda digest: None)
+    monkeypatch.setattr(diagrams, "is_known", lambda digest: True)
+    from app import app
+    response = app.test_client().get("/diagrams/abc123.png")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+
+
+def test_route_answers_404_for_unknown_diagrams():
+    from app import app
+    assert app.test_client().get("/diagrams/0000deadbeef.png").status_code == 404
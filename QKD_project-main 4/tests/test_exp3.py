@@ -0,0 +1,17 @@
+# tests/test_exp3.py
+import pytest
+
+from qkd_backend.qkd_runner import exp3
+
+
+@pytest.mark.parametrize("sessions", [0, -1, exp3.MAX_BATCH_SESSIONS + 1])
+def test_batch_rejects_out_of_range_sessions(sessions):
+    with pytest.raises(ValueError):
+        exp3.run_exp3_batch(sessions=sessions)
+
+
+@pytest.mark.parametrize("sessions", [0, exp3.MAX_BATCH_SESSIONS + 1, "many"])
+def test_batch_job_rejects_sessions_at_submission(sessions):
+    from app import app
+    response = app.test_client().post("/jobs/exp3_batch", json={"sessions": sessions})
+    assert response.status_code == 400
@@ -0,0 +1,52 @@
+# tests/test_exp4_sweep.py
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner import exp4_sweep
+
+
+def test_full_interception_is_detected():
+    # exp4's 20-qubit sessions are disclosed in full and abort on the observed QBER
+    with ThreadPoolExecutor(2) as pool:
+        rows = exp4_sweep.sweep([0.0, 1.0], [20], sessions=500, executor=pool)
+    assert rows["qber_mean"][0] == 0 and rows["detection_rate"][0] == 0
+    # Eve resends random bits in Alice's basis, so half the intercepted bits are wrong
+    assert rows["qber_mean"][1] == pytest.approx(0.5, abs=0.03)
+    assert rows["detection_rate"][1] > 0.8
+
+
+def test_sweep_is_reproducible_across_executors():
+    grid = ([0.5], [100, 200], [3], 50)
+    with ThreadPoolExecutor(2) as pool:
+        threaded = exp4_sweep.sweep(*grid, executor=pool)
+    with ThreadPoolExecutor(1) as pool:
+        single = exp4_sweep.sweep(*grid, executor=pool)
+    assert np.array_equal(threaded, single)
+
+
+@pytest.mark.parametrize("body", [
+    {"intercept_fractions": [None]},
+    {"intercept_fractions": ["0.5"]},
+    {"intercept_fractions": [1.5]},
+    {"intercept_fractions": 0.5},
+    {"key_lengths": [0]},
+    {"key_lengths": ["20"]},
+    {"key_lengths": [2.5]},
+    {"seeds": [-1]},
+    {"sessions": 0},
+    {"sessions": True},
+    {"key_lengths": [exp4_sweep.MAX_KEY_LENGTH], "sessions": exp4_sweep.MAX_SESSIONS},
+])
+def test_sweep_route_rejects_bad_grids(body):
+    from app import app
+    assert app.test_client().post("/sweep/exp4", json=body).status_code == 400
+
+
+@pytest.mark.parametrize("fraction", ["half", 2, -0.1, True])
+def test_exp4_entry_points_reject_bad_fraction(fraction):
+    from app import app
+    client = app.test_client()
+    assert client.post("/jobs/exp4", json={"intercept_fraction": fraction}).status_code == 400
+    assert client.post("/run/exp4", json={"intercept_fraction": fraction}).status_code == 400
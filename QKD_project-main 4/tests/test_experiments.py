@@ -0,0 +1,29 @@
+# tests/test_experiments.py
+import numpy as np
+
+from qkd_backend.qkd_runner import exp1, exp2
+from qkd_backend.qkd_runner.batching import run_bb84_circuit
+from qkd_backend.qkd_runner.key_stream import raw_rounds
+
+
+def test_exp1_and_exp2_share_one_session():
+    one = exp1.run_exp1(bit_num=24, shots=32, rng_seed=5, draw_diagram=False)
+    two = exp2.run_exp2(bit_num=24, shots=32, rng_seed=5, draw_diagram=False)
+    for field in ("Sender_bits", "Receiver_bits", "agoodbits", "bgoodbits", "final_secret_key", "counts"):
+        assert one[field] == two[field]
+    # Only the demo cipher differs
+    assert one["decrypted_message"] == two["decrypted_message"] == "QKD demo"
+
+
+def test_ideal_circuit_round_has_no_sifted_errors():
+    rng = np.random.default_rng(0)
+    abits, abase, bbase, bbits, counts, shot_bits, url = run_bb84_circuit(30, 8, rng, "local", 10, False, seed=1)
+    assert shot_bits.shape == (8, 30) and url is None and sum(counts.values()) == 8
+    sifted = abase == bbase
+    assert np.array_equal(np.asarray(bbits)[sifted], abits[sifted].astype(int))
+
+
+def test_key_stream_circuit_rounds():
+    abits, abase, bbase, bbits = next(raw_rounds(16, engine="circuit", rng_seed=3, max_rounds=1))
+    sifted = abase == bbase
+    assert bbits.dtype == np.uint8 and np.array_equal(bbits[sifted], abits[sifted])
@@ -0,0 +1,55 @@
+# tests/test_key_pool.py
+import numpy as np
+import pytest
+
+from qkd_backend import key_pool
+from qkd_backend.qkd_runner import bb84_vectorized
+
+
+def test_clean_session_yields_key():
+    assert key_pool.bb84_key_material().size > 0
+
+
+def test_noisy_session_is_dropped(monkeypatch):
+    def noisy(bit_num, rng):
+        abits, abase, bbase, bbits = bb84_vectorized.prepare_and_measure(bit_num, rng)
+        return abits, abase, bbase, bbits ^ (rng.random(bit_num) < 0.2).astype(np.uint8)
+
+    monkeypatch.setattr(key_pool, "prepare_and_measure", noisy)
+    assert key_pool.bb84_key_material().size == 0
+
+
+def test_refill_skips_empty_batches():
+    batches = iter([np.zeros(0, dtype=np.uint8), np.ones(64, dtype=np.uint8)])
+    pool = key_pool.KeyPool("t", capacity=64, low_watermark_bits=8, high_watermark_bits=64,
+                            refill=lambda: next(batches, np.zeros(0, dtype=np.uint8)))
+    pool._refill_loop()
+    assert pool.available_bits == 64
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    monkeypatch.delenv("QKD_KEY_POOL_DIR", raising=False)
+    monkeypatch.setattr(key_pool, "_pools", {})
+    monkeypatch.setattr(key_pool, "MAX_KEY_POOLS", 2)
+    return key_pool._pools
+
+
+def test_reads_never_create_pools(pools):
+    from app import app
+    client = app.test_client()
+    assert client.get("/key_pool/nobody").status_code == 404
+    assert client.post("/key_pool/nobody/encrypt", json={"message": "hi"}).status_code == 404
+    assert client.get("/key_pool/bad%20name").status_code == 400
+    assert not pools
+
+
+def test_pool_count_is_capped(pools):
+    key_pool.get_key_pool("a")
+    key_pool.get_key_pool("b")
+    with pytest.raises(key_pool.TooManyKeyPools):
+        key_pool.get_key_pool("c")
+    with pytest.raises(key_pool.TooManyKeyPools):
+        key_pool.check_key_pool("c")
+    key_pool.check_key_pool("a")
+    assert key_pool.find_key_pool("c") is None
@@ -0,0 +1,89 @@
+# tests/test_keyrate.py
+import numpy as np
+import pytest
+
+from qkd_backend import keyrate
+
+
+def test_distance_grid_matches_page_axis():
+    assert np.array_equal(keyrate.distance_grid(10, 2.5), [0, 2.5, 5, 7.5, 10])
+
+
+@pytest.mark.parametrize("max_km, step", [(1e12, 1e-6), (float("inf"), 1), (10, float("nan")), (10, 0), (-1, 1)])
+def test_distance_grid_rejects_before_building(max_km, step):
+    with pytest.raises(ValueError):
+        keyrate.distance_grid(max_km, step)
+
+
+def test_grid_routes_reject_oversized_grids():
+    from app import app
+    client = app.test_client()
+    huge = {"max_distance": 1e12, "step": 1e-6}
+    assert client.post("/keyrate/grid", json=huge).status_code == 400
+    assert client.post("/keyrate/decoy", json=huge).status_code == 400
+    assert client.post("/keyrate/decoy", json={"max_distance": 1e5, "step": 1}).status_code == 400
+
+
+def _h(q):
+    return 0.0 if q <= 0 or q >= 1 else -q * np.log2(q) - (1 - q) * np.log2(1 - q)
+
+
+def _page_simulate(d, mu, protocol, eta=0.1, dark=100.0, rep_rate=1e6, alpha=0.2, e0=0.01):
+    # simulate() of KeyrateVsDistance.html, one point at a time
+    s = mu * eta * rep_rate * 10 ** (-alpha * d / 10)
+    qber = (e0 * s + 0.5 * dark) / (s + dark)
+    rate = s * max(0, 1 - 2 * _h(qber))
+    if protocol == "decoy":
+        rate *= 1.2
+    elif protocol == "e91":
+        qber, rate = qber + 0.01, rate * 0.9
+    elif protocol == "cvqkd":
+        qber, rate = min(0.15, qber + 0.05), rate * 1.5
+    return qber, rate
+
+
+def _page_repeater(d, repeaters):
+    # secureRepeaterSingleLink() of keyrate.html with the slider defaults
+    p_signal = 1.0 * 10 ** (-0.2 * d / (repeaters + 1) / 10) * 0.6
+    dpg = 100.0 / 10e6
+    error = min(max((0.5 * dpg + 0.01 * p_signal) / max(p_signal + dpg, 1e-30), 0), 0.4999)
+    return 10e6 * p_signal * 0.5 * max(0, 1 - 2 * _h(error))
+
+
+@pytest.mark.parametrize("protocol", keyrate.PROTOCOLS)
+def test_link_rate_matches_page(protocol):
+    distances = np.array([0, 10, 55.5, 120, 300])
+    qber, rate = keyrate.link_rate(distances, 0.5, protocol)
+    for d, q, r in zip(distances, qber, rate):
+        page_q, page_r = _page_simulate(d, 0.5, protocol)
+        assert q == pytest.approx(page_q, rel=1e-12)
+        assert r == pytest.approx(page_r, rel=1e-12, abs=1e-300)
+
+
+def test_repeater_and_twin_field_match_page():
+    distances = np.array([0, 50, 200, 500])
+    for n in (0, 1, 4):
+        for d, r in zip(distances, keyrate.repeater_rate(distances, n)):
+            assert r == pytest.approx(_page_repeater(d, n), rel=1e-12, abs=1e-300)
+    expected = [10e6 * 0.5 * 0.2 * np.sqrt(10 ** (-0.2 * d / 10)) * 0.6 for d in distances]
+    assert np.allclose(keyrate.tf_qkd_rate(distances), expected, rtol=1e-12)
+
+
+def test_link_rate_rejects_unknown_protocol():
+    with pytest.raises(ValueError):
+        keyrate.link_rate(10, 0.5, "b92")
+
+
+def test_evaluate_is_cached_and_read_only():
+    first = keyrate.evaluate("link", [1.0, 2.0], mus=(0.3, 0.5), protocols=("bb84", "e91"))
+    hits = keyrate.cache_stats()["link"]["hits"]
+    second = keyrate.evaluate("link", [1.0, 2.0], mus=(0.3, 0.5), protocols=("bb84", "e91"))
+    assert keyrate.cache_stats()["link"]["hits"] == hits + 1
+    assert second["key_rate"] is first["key_rate"]
+    assert first["key_rate"].shape == (2, 2, 2)
+    with pytest.raises(ValueError):
+        first["key_rate"][0, 0, 0] = 1.0
+    repeater = keyrate.evaluate("repeater", [0, 100], repeaters=(0, 2))
+    assert repeater["key_rate"].shape == (2, 2) and repeater["twin_field"].shape == (2,)
+    with pytest.raises(ValueError):
+        keyrate.evaluate("repeater", [0, 100], repeaters=(-1,))
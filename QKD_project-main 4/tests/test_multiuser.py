@@ -0,0 +1,54 @@
+# tests/test_multiuser.py
+import math
+
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner import multiuser_engine
+
+
+def _per_user(dist, link_length=100, session=128, det=90, dark=0.001, misalign=2, latency=5):
+    # The simulator's original per-receiver loop
+    n_hops = math.ceil(dist / link_length)
+    per_link = round((100 - det) * 0.01 + dark * 100 + misalign, 2)
+    end_to_end = round((1 - (1 - per_link / 100) ** n_hops) * 100, 2)
+    rate = round(50 * (1 - end_to_end / 100), 2)
+    t = round(session / rate + n_hops * latency / 1000.0, 2)
+    return n_hops, per_link, end_to_end, rate, t
+
+
+def test_spread_distances_matches_sidebar_defaults():
+    assert multiuser_engine.spread_distances(500, 3).tolist() == [int(500 * i / 3) for i in (1, 2, 3)]
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"link_length": 37, "session": 1024, "det": 73, "misalign": 7}])
+def test_simulate_matches_per_user_loop(kwargs):
+    distances = np.arange(1, 2001, 13)
+    engine_kwargs = {"link_length": kwargs.get("link_length", 100),
+                     "session_key_length": kwargs.get("session", 128),
+                     "detector_efficiency": kwargs.get("det", 90),
+                     "misalignment_error": kwargs.get("misalign", 2)}
+    result = multiuser_engine.simulate(distances, **engine_kwargs)
+    for i, d in enumerate(distances):
+        n_hops, per_link, end_to_end, rate, t = _per_user(int(d), **kwargs)
+        assert result["trusted_nodes"][i] == n_hops
+        assert result["per_link_qber"][i] == per_link
+        assert result["end_to_end_qber"][i] == end_to_end
+        assert result["key_rate"][i] == rate
+        assert result["time_to_form_key"][i] == t
+
+
+def test_summary_modes():
+    result = multiuser_engine.simulate([100, 250, 500])
+    sequential = multiuser_engine.summarize(result, "Sequential")
+    parallel = multiuser_engine.summarize(result, "Parallel")
+    assert sequential["receivers"] == 3 and sequential["successes"] == 3
+    assert sequential["completion_time"] == sequential["total_time"]
+    assert parallel["completion_time"] == float(result["time_to_form_key"].max())
+    with pytest.raises(ValueError):
+        multiuser_engine.summarize(result, "Broadcast")
+
+
+def test_simulate_rejects_non_positive_link_length():
+    with pytest.raises(ValueError):
+        multiuser_engine.simulate([100], link_length=0)
@@ -0,0 +1,71 @@
+# tests/test_parameter_estimation.py
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner import exp4
+from qkd_backend.qkd_runner.parameter_estimation import (
+    MIN_PE_SAMPLE_BITS, QBER_ABORT_THRESHOLD, deviation, estimate, qber_upper_bound, sample_size,
+)
+
+
+def test_serfling_is_tighter_than_hoeffding():
+    assert deviation(1000, 5000, method="serfling") < deviation(1000, 5000, method="hoeffding")
+    # Hoeffding: sqrt(ln(1/eps) / 2k)
+    assert deviation(1000, 5000, 1e-10, "hoeffding") == pytest.approx(np.sqrt(np.log(1e10) / 2000))
+
+
+def test_upper_bound_covers_the_kept_bits():
+    bound = qber_upper_bound(20, 2000, 10000)
+    assert 0.01 < bound < QBER_ABORT_THRESHOLD
+    assert qber_upper_bound(0, 10, 10) == 0.5
+
+
+def test_sample_never_smaller_than_minimum():
+    assert sample_size(10) == 10
+    assert sample_size(MIN_PE_SAMPLE_BITS + 10) == MIN_PE_SAMPLE_BITS
+    assert sample_size(100_000) == 20_000
+
+
+def test_short_key_is_disclosed_and_flagged():
+    rng = np.random.default_rng(0)
+    alice = rng.integers(0, 2, 50)
+    bob = alice.copy()
+    bob[:10] ^= 1
+    keep, stats = estimate(alice, bob, rng=rng)
+    assert not keep.any()
+    assert stats["status"] == "insufficient_statistics"
+    assert stats["qber_observed"] == pytest.approx(0.2)
+    assert stats["abort"]
+
+
+def test_long_clean_key_is_accepted():
+    rng = np.random.default_rng(1)
+    alice = rng.integers(0, 2, 50_000)
+    keep, stats = estimate(alice, alice.copy(), rng=rng)
+    assert stats["status"] == "ok" and not stats["abort"]
+    assert keep.sum() == 40_000
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_exp4_with_eve_never_accepts_a_key_that_fails_to_decrypt(seed):
+    result = exp4.run_exp4(message="secret", rng_seed=seed, draw_diagram=False)
+    if result["encrypted_message_hex"]:
+        assert result["decrypted_message"] == "secret"
+    assert result["decrypted_message"] != "<decryption failed>"
+
+
+def test_harvest_is_labelled_an_estimate_without_a_bound():
+    from qkd_backend.qkd_runner.parameter_estimation import estimation_policy
+
+    alice = np.zeros(5000, dtype=np.uint8)
+    bob = alice.copy()
+    bob[:100] = 1
+    kwargs, stats = estimation_policy(alice, bob)
+    assert stats["status"] == "estimate" and stats["qber_upper"] is None
+    assert kwargs["qber"] == pytest.approx(0.02) and "qber_upper" not in kwargs
+
+
+def test_serfling_matches_sampling_without_replacement():
+    k, n, eps = 1000, 5000, 1e-10
+    expected = np.sqrt((1 - (k - 1) / n) * np.log(1 / eps) / (2 * k))
+    assert deviation(k, n, eps, "serfling") == pytest.approx(expected)
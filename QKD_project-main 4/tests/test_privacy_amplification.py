@@ -0,0 +1,47 @@
+# tests/test_privacy_amplification.py
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner.privacy_amplification import (
+    EPSILON_EC, EPSILON_PA, privacy_amplify, secure_key_length, toeplitz_hash,
+)
+from qkd_backend.qkd_runner.reconciliation import binary_entropy
+
+
+def _toeplitz_matrix(seed, n, out_len):
+    i, j = np.ogrid[:out_len, :n]
+    return seed[i - j + n - 1]
+
+
+@pytest.mark.parametrize("n, out_len", [(1, 1), (7, 3), (64, 64), (1000, 317)])
+def test_fft_hash_matches_matrix_product(n, out_len):
+    rng = np.random.default_rng(n)
+    key = rng.integers(0, 2, n, dtype=np.uint8)
+    seed = rng.integers(0, 2, n + out_len - 1, dtype=np.uint8)
+    expected = _toeplitz_matrix(seed, n, out_len).astype(np.int64) @ key % 2
+    assert np.array_equal(toeplitz_hash(key, out_len, seed), expected)
+
+
+def test_hash_rejects_wrong_seed_length():
+    with pytest.raises(ValueError):
+        toeplitz_hash(np.ones(10, dtype=np.uint8), 4, np.ones(12, dtype=np.uint8))
+
+
+def test_secure_key_length_formula():
+    n, qber, leaked = 100_000, 0.03, 25_000
+    expected = np.floor(n * (1 - binary_entropy(qber)) - leaked
+                        - np.log2(2 / EPSILON_EC) - 2 * np.log2(1 / EPSILON_PA))
+    assert secure_key_length(n, qber, leaked) == expected
+    assert secure_key_length(100, 0.1, 50) == 0
+    assert secure_key_length(0, 0.0, 0) == 0
+
+
+def test_packed_input_matches_unpacked():
+    rng = np.random.default_rng(3)
+    bits = rng.integers(0, 2, 5003, dtype=np.uint8)
+    plain = privacy_amplify(bits, 0.02, 1000, rng=np.random.default_rng(9))
+    packed = privacy_amplify(np.packbits(bits), 0.02, 1000, rng=np.random.default_rng(9), n_bits=bits.size)
+    assert plain["input_bits"] == packed["input_bits"] == bits.size
+    assert plain["key_bits"] == secure_key_length(bits.size, 0.02, 1000) > 0
+    assert np.array_equal(plain["key"], packed["key"])
+    assert plain["compression"] == pytest.approx(plain["key_bits"] / bits.size)
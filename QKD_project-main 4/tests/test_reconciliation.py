@@ -0,0 +1,45 @@
+# tests/test_reconciliation.py
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner.reconciliation import RECONCILERS, cascade, ldpc
+
+
+def _noisy_pair(n, qber, seed):
+    rng = np.random.default_rng(seed)
+    alice = rng.integers(0, 2, n, dtype=np.uint8)
+    bob = alice ^ (rng.random(n) < qber).astype(np.uint8)
+    return alice, bob
+
+
+@pytest.mark.parametrize("method", sorted(RECONCILERS))
+@pytest.mark.parametrize("qber", [0.02, 0.035, 0.05])
+def test_engines_leave_no_residual_errors(method, qber):
+    alice, bob = _noisy_pair(50_000, qber, seed=int(qber * 1000))
+    stats = RECONCILERS[method](alice, bob, qber, rng=np.random.default_rng(1))
+    assert stats["residual_errors"] == 0
+    assert np.array_equal(stats["corrected"], alice)
+    assert stats["errors_corrected"] == np.count_nonzero(alice != bob)
+    # Leakage must at least reach the Shannon limit
+    assert stats["efficiency"] >= 1.0
+
+
+def test_cascade_on_packed_bits():
+    alice, bob = _noisy_pair(10_001, 0.03, seed=2)
+    stats = cascade(np.packbits(alice), np.packbits(bob), 0.03, rng=np.random.default_rng(0), n_bits=alice.size)
+    assert stats["residual_errors"] == 0
+    assert np.array_equal(np.unpackbits(stats["corrected"])[:alice.size], alice)
+
+
+def test_ldpc_falls_back_to_cascade_for_undecoded_frames():
+    alice, bob = _noisy_pair(20_000, 0.04, seed=3)
+    stats = ldpc(alice, bob, 0.04, max_iterations=0, rng=np.random.default_rng(0))
+    assert stats["failed_frames"] > 0
+    assert stats["fallback_leaked_bits"] > 0
+    assert stats["residual_errors"] == 0
+    assert np.array_equal(stats["corrected"], alice)
+
+
+def test_ldpc_rejects_mismatched_lengths():
+    with pytest.raises(ValueError):
+        ldpc(np.zeros(8, dtype=np.uint8), np.zeros(9, dtype=np.uint8), 0.02)